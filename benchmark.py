@@ -0,0 +1,177 @@
+"""
+端到端基准测试
+启动本地模拟API服务，对生成的1k/10k/100k行表格运行完整清洗流程，
+报告吞吐（行/秒）、行延迟p50/p99、峰值内存和保存耗时，用于对比各项优化的效果
+用法：python benchmark.py --rows 1000 10000 --engine async --concurrency 100 --latency-ms 200 --json result.json
+"""
+import argparse
+import configparser
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import numpy as np
+import pandas as pd
+from cleaner_config import default_config
+from mock_api_server import LATENCY_DISTRIBUTIONS, LatencyModel, MockAPIServer
+def generate_sheet(path, rows, duplicate_ratio=0.0, seed=0):
+    """生成测试表格：商品标题、店铺和价格，duplicate_ratio控制重复行比例"""
+    rng = np.random.default_rng(seed)
+    brands = ["华为", "小米", "苹果", "联想", "海尔", "美的", "格力", "索尼"]
+    products = ["手机", "笔记本电脑", "空调", "冰箱", "耳机", "平板", "电视", "洗衣机"]
+    unique_rows = max(1, int(rows * (1 - duplicate_ratio)))
+    titles = [
+        f"{brands[i % len(brands)]}{products[(i // len(brands)) % len(products)]} 型号{i:06d} {rng.integers(1, 9)}代 官方正品"
+        for i in range(unique_rows)
+    ]
+    picks = np.concatenate([np.arange(unique_rows), rng.integers(0, unique_rows, rows - unique_rows)])
+    df = pd.DataFrame({
+        "宝贝名": [titles[i] for i in picks],
+        "店铺": [f"{brands[i % len(brands)]}官方旗舰店" for i in picks],
+        "价格": [round(99 + (i * 37) % 9000, 2) for i in picks],
+    })
+    df.to_excel(path, index=False, engine="openpyxl")
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+def run_case(settings, input_file, output_file, result_queue):
+    """子进程：用全新的引擎跑一轮，避免各轮之间共享内存和连接"""
+    from cleaner_engine import CleanerEngine
+    
+    config = configparser.ConfigParser(interpolation=None)
+    config["DEFAULT"] = settings
+    engine = CleanerEngine(config)
+    engine.fields = engine.extract_dynamic_fields(settings["prompt"])
+    
+    # 丢弃进度消息，只打印错误
+    done_event = threading.Event()
+    
+    def drain():
+        while not (done_event.is_set() and engine.progress_queue.empty()):
+            try:
+                msg_type, content = engine.progress_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if msg_type == "status" and content.lstrip().startswith("❌"):
+                print(content.strip(), flush=True)
+    
+    printer = threading.Thread(target=drain, daemon=True)
+    printer.start()
+    engine.processing = True
+    succeeded = engine.process_data(input_file, output_file)
+    done_event.set()
+    printer.join()
+    
+    latencies = engine.row_latencies
+    result_queue.put({
+        "succeeded": succeeded,
+        "rows": engine.total_rows,
+        "completed_rows": engine.completed_rows,
+        "failed_rows": engine.failed_rows,
+        "elapsed": engine.elapsed,
+        "rows_per_second": engine.completed_rows / engine.elapsed if engine.elapsed > 0 else 0.0,
+        "p50_latency": float(np.percentile(latencies, 50)) if latencies else None,
+        "p99_latency": float(np.percentile(latencies, 99)) if latencies else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "save_time": engine.save_time,
+    })
+def format_seconds(value):
+    return "-" if value is None else f"{value:.3f}"
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI清洗工具端到端基准测试（使用本地模拟API）")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000], help="各轮的行数")
+    parser.add_argument("--engine", choices=["threads", "async"], nargs="+", default=["threads"], help="调度方式，可同时指定多个")
+    parser.add_argument("--concurrency", type=int, help="并发上限，缺省使用默认配置")
+    parser.add_argument("--pack-token-budget", type=int, default=0, help="打包预算，0表示不打包")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="生成表格中重复行的比例")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--bad-output-rate", type=float, default=0.0)
+    parser.add_argument("--chatter-rate", type=float, default=0.0, help="模型在字段之后追加说明文字的比例")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="每个输出Token的生成耗时（毫秒）")
+    parser.add_argument("--work-dir", default="benchmark_data", help="测试表格和输出目录，表格已存在时复用")
+    parser.add_argument("--json", help="结果另存为JSON")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖配置项，可多次指定")
+    args = parser.parse_args(argv)
+    
+    os.makedirs(args.work_dir, exist_ok=True)
+    server = MockAPIServer(
+        latency=LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma),
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, bad_output_rate=args.bad_output_rate,
+        chatter_rate=args.chatter_rate, token_ms=args.token_ms
+    )
+    api_url = server.start()
+    print(f"🧪 模拟API：{api_url}，延迟{args.latency_dist} {args.latency_ms:g}ms，"
+          f"错误率{args.error_rate:g}，429比例{args.rate_limit_rate:g}，每Token {args.token_ms:g}ms", flush=True)
+    
+    settings = default_config()
+    settings.update({
+        "api_key": "benchmark",
+        "api_url": api_url,
+        "pack_token_budget": str(args.pack_token_budget),
+        # 每轮都要真实请求，不读缓存也不续跑
+        "cache_enabled": "0",
+        "resume_enabled": "0",
+    })
+    for item in args.set:
+        key, _, value = item.partition("=")
+        settings[key.strip()] = value.strip()
+    
+    results = []
+    # 子进程使用spawn启动，各轮互不继承内存
+    context = multiprocessing.get_context("spawn")
+    try:
+        for rows in args.rows:
+            input_file = os.path.join(args.work_dir, f"bench_{rows}_{args.duplicate_ratio:g}.xlsx")
+            if not os.path.exists(input_file):
+                print(f"📝 生成{rows}行测试表格...", flush=True)
+                generate_sheet(input_file, rows, args.duplicate_ratio)
+            for engine in args.engine:
+                case_settings = dict(settings, engine=engine)
+                if args.concurrency:
+                    case_settings["max_workers"] = str(args.concurrency)
+                    case_settings["async_concurrency"] = str(args.concurrency)
+                output_file = os.path.join(args.work_dir, f"bench_{rows}_{engine}_out.xlsx")
+                result_queue = context.Queue()
+                process = context.Process(target=run_case, args=(case_settings, input_file, output_file, result_queue))
+                process.start()
+                result = None
+                # 子进程异常退出时不会放入结果，不能一直阻塞
+                while result is None and (process.is_alive() or not result_queue.empty()):
+                    try:
+                        result = result_queue.get(timeout=1)
+                    except queue.Empty:
+                        continue
+                process.join()
+                if result is None:
+                    print(f"❌ {rows}行/{engine}：子进程异常退出（退出码{process.exitcode}）", flush=True)
+                    results.append({"engine": engine, "input_rows": rows, "succeeded": False})
+                    continue
+                result.update({"engine": engine, "input_rows": rows})
+                results.append(result)
+                print(f"{'✅' if result['succeeded'] else '❌'} {rows}行/{engine}：{result['rows_per_second']:.1f}行/秒，"
+                      f"p50 {format_seconds(result['p50_latency'])}秒，p99 {format_seconds(result['p99_latency'])}秒，"
+                      f"峰值内存{result['peak_rss_mb'] or 0:.0f}MB，保存{result['save_time']:.2f}秒，"
+                      f"失败{result['failed_rows']}行", flush=True)
+    finally:
+        server.stop()
+    
+    print(f"📊 模拟API请求统计：{server.stats.summary()}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"📁 结果已保存：{args.json}")
+    return 0 if all(result["succeeded"] for result in results) else 1
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,24 @@
 """
 macOS应用构建脚本
 完整处理从PyInstaller到最终app包的所有步骤
+构建模式：onefile每次启动都要把依赖解压到临时目录；onedir直接从目录加载，启动更快
+构建后输出打包大小和各依赖包的占用；传入大小或启动耗时预算时才测量并检查，超出预算构建失败；非macOS平台只构建PyInstaller产物
+用法：python build_mac_app.py --mode onedir --size-budget-mb 150 --launch-budget-ms 3000
 """
+import argparse
 import os
 import sys
 import subprocess
 import shutil
 from pathlib import Path
+from bundle_report import LAUNCH_BUDGET_MS, SIZE_BUDGET_MB, report_bundle
+# 打包时排除的模块：测试代码、开发工具、pandas未使用的读写引擎（表格只用openpyxl读写）和绘图/科学计算库
+EXCLUDE_MODULES = [
+    "pandas.tests", "numpy.tests", "numpy.f2py", "pytest", "_pytest", "IPython", "jedi", "pygments", "setuptools", "pip",
+    "pyarrow", "fastparquet", "tables", "xlrd", "xlsxwriter", "odf", "pyxlsb", "python_calamine", "sqlalchemy",
+    "psycopg2", "pymysql", "bs4", "lxml", "html5lib", "fsspec", "s3fs", "gcsfs", "numba", "numexpr", "bottleneck",
+    "tabulate", "zstandard", "xarray", "matplotlib", "scipy", "PIL",
+]
 def run_command(cmd, description):
     """运行命令并处理错误"""
     print(f"🔄 {description}...")
@@ -24,8 +36,8 @@ def run_command(cmd, description):
         print(f"❌ {description}失败")
         print(f"错误: {e.stderr}")
         return False
-def build_macos_app():
-    """构建macOS应用"""
+def build_macos_app(mode="onefile", excludes=EXCLUDE_MODULES, size_budget_mb=None, launch_budget_ms=None):
+    """构建macOS应用；mode为onefile或onedir，预算为None时只输出报告不检查"""
     print("=" * 60)
     print("🍎 macOS应用构建脚本")
     print("=" * 60)
@@ -42,6 +54,7 @@ def build_macos_app():
     
     print(f"📦 应用名称: {app_name}")
     print(f"📦 主脚本: {main_script}")
+    print(f"📦 构建模式: {mode}，排除{len(excludes)}个模块")
     
     # 步骤1: 使用PyInstaller构建
     print("\n" + "=" * 60)
@@ -50,23 +63,42 @@ def build_macos_app():
     
     pyinstaller_cmd = [
         "pyinstaller",
-        "--onefile",
+        "--noconfirm",
+        f"--{mode}",
         "--windowed",
         "--name", app_name,
-        main_script
     ]
+    for module in excludes:
+        pyinstaller_cmd += ["--exclude-module", module]
+    pyinstaller_cmd.append(main_script)
     
     if not run_command(pyinstaller_cmd, "PyInstaller构建"):
         return False
     
-    # 检查构建结果
+    # 检查构建结果：onefile为单个可执行文件，onedir为同名目录（可执行文件和_internal依赖目录）
     exe_path = Path(f"dist/{app_name}")
     if not exe_path.exists():
         print(f"❌ 未找到可执行文件: {exe_path}")
         return False
     
-    exe_size_mb = exe_path.stat().st_size / 1024 / 1024
-    print(f"📦 可执行文件大小: {exe_size_mb:.2f} MB")
+    # 打包大小和各依赖包占用；设置了启动耗时预算时才冷启动产物测量启动耗时
+    print("\n" + "=" * 60)
+    print("打包报告")
+    print("=" * 60)
+    enforce_budget = bool(size_budget_mb or launch_budget_ms)
+    try:
+        budget_failures = report_bundle(str(exe_path), size_budget_mb or 0, launch_budget_ms or 0,
+                                        repeat=3 if launch_budget_ms else 0)
+    except Exception as e:
+        if enforce_budget:
+            print(f"❌ 打包报告失败: {e}")
+            return False
+        print(f"⚠️ 打包报告失败（未设置预算，不影响构建）: {e}")
+        budget_failures = []
+    
+    if sys.platform != "darwin":
+        print(f"\n💡 非macOS平台，跳过app包、签名等步骤，产物: {exe_path}")
+        return not budget_failures
     
     # 步骤2: 创建app包结构
     print("\n" + "=" * 60)
@@ -91,9 +123,12 @@ def build_macos_app():
         print(f"❌ 创建目录结构失败: {e}")
         return False
     
-    # 复制可执行文件
+    # 复制可执行文件；onedir使用PyInstaller生成的app包（依赖位于Contents/Frameworks，引导程序按此布局查找）
     try:
-        shutil.copy(exe_path, macos_dir / app_name)
+        if mode == "onedir":
+            shutil.copytree(f"dist/{app_bundle}", app_bundle, symlinks=True, dirs_exist_ok=True)
+        else:
+            shutil.copy(exe_path, macos_dir / app_name)
         print(f"✅ 可执行文件复制完成")
     except Exception as e:
         print(f"❌ 复制可执行文件失败: {e}")
@@ -198,7 +233,7 @@ def build_macos_app():
     print(f"   2. 右键点击 → 打开")
     print(f"   3. 如果仍有问题，运行修复脚本")
     
-    return True
+    return not budget_failures
 def get_app_size(app_path):
     """获取应用包大小"""
     total = 0
@@ -208,8 +243,15 @@ def get_app_size(app_path):
             total += os.path.getsize(fp)
     return total / 1024 / 1024
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建macOS应用")
+    parser.add_argument("--mode", choices=["onefile", "onedir"], default="onefile", help="onedir启动更快，onefile便于分发")
+    parser.add_argument("--no-exclude", action="store_true", help="不排除任何模块（用于对比打包大小）")
+    parser.add_argument("--size-budget-mb", type=float, help=f"打包大小预算（如{SIZE_BUDGET_MB}），不传时不检查")
+    parser.add_argument("--launch-budget-ms", type=float, help=f"启动耗时预算（如{LAUNCH_BUDGET_MS}），不传时不测量启动耗时")
+    args = parser.parse_args()
     try:
-        success = build_macos_app()
+        success = build_macos_app(args.mode, [] if args.no_exclude else EXCLUDE_MODULES,
+                                  args.size_budget_mb, args.launch_budget_ms)
         sys.exit(0 if success else 1)
     except KeyboardInterrupt:
         print("\n\n⚠️ 用户中断操作")
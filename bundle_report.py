@@ -0,0 +1,182 @@
+"""
+打包体积与启动耗时报告
+统计PyInstaller产物的总大小和各依赖包的占用（磁盘上的文件加上可执行文件内嵌归档中的模块），
+并通过启动探针冷启动打包后的程序测量启动耗时，与预算比较；超出预算时返回非0
+用法：python bundle_report.py "dist/AI清洗工具2.0" --size-budget-mb 150 --launch-budget-ms 3000 --json bundle.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from startup_benchmark import start_virtual_display
+# 默认预算：打包后总大小（MB）和首帧耗时（毫秒，无显示时为数据处理模块就绪耗时）
+SIZE_BUDGET_MB = 150
+LAUNCH_BUDGET_MS = 3000
+# 与mac_ai_cleaner.STARTUP_PROBE_ENV一致
+STARTUP_PROBE_ENV = "AI_CLEANER_STARTUP_PROBE"
+def package_of(name):
+    """把产物中的文件或模块名归到所属的包：pandas/_libs/x.so、pandas.core.frame → pandas"""
+    name = name.replace("\\", "/").lstrip("/")
+    for prefix in ("_internal/", "Contents/Frameworks/", "Contents/Resources/", "Contents/MacOS/"):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    top = name.split("/")[0]
+    if top in ("lib-dynload", "base_library.zip") or top.startswith(("libpython", "Python", "python3")):
+        return "Python运行时"
+    if top in ("_tcl_data", "_tk_data", "tcl8") or top.startswith(("libtcl", "libtk", "Tcl", "Tk")):
+        return "Tcl/Tk"
+    if "/" not in name and (top.endswith((".so", ".dylib", ".dll")) or ".so." in top):
+        return "共享库"
+    top = top.split(".")[0].split("-")[0]
+    # numpy.libs、numpy-2.0.dist-info等随包附带的文件归到对应的包
+    return top.lstrip("_") or name
+def archive_sizes(executable):
+    """可执行文件内嵌归档（PKG及其中的PYZ）中各包的压缩后大小，不是PyInstaller产物时返回空"""
+    try:
+        from PyInstaller.archive.readers import CArchiveReader, NotAnArchiveError
+    except ImportError:
+        return Counter()
+    sizes = Counter()
+    try:
+        archive = CArchiveReader(executable)
+    except Exception:
+        return sizes
+    for name, (_, length, _, _, typecode) in archive.toc.items():
+        if typecode == "z":
+            try:
+                pyz = archive.open_embedded_archive(name)
+            except NotAnArchiveError:
+                sizes[package_of(name)] += length
+                continue
+            for module, entry in pyz.toc.items():
+                sizes[package_of(module)] += entry[-1]
+            # PYZ自身的目录等开销
+            sizes["PYZ目录"] += max(length - sum(entry[-1] for entry in pyz.toc.values()), 0)
+        elif typecode in ("s", "m", "M"):
+            # 入口脚本和启动用的模块
+            sizes["入口脚本"] += length
+        else:
+            sizes[package_of(name)] += length
+    return sizes
+def bundle_sizes(dist_path):
+    """返回(总字节数, Counter{包: 字节数})；可执行文件按内嵌归档拆分，剩余部分计为引导程序"""
+    if os.path.isfile(dist_path):
+        files = [(dist_path, os.path.basename(dist_path))]
+    else:
+        files = [(os.path.join(dirpath, f), os.path.relpath(os.path.join(dirpath, f), dist_path))
+                 for dirpath, _, filenames in os.walk(dist_path) for f in filenames]
+    try:
+        executable = find_executable(dist_path)
+    except FileNotFoundError:
+        executable = None
+    total = 0
+    sizes = Counter()
+    for path, relpath in files:
+        if os.path.islink(path):
+            continue
+        size = os.path.getsize(path)
+        total += size
+        embedded = archive_sizes(path) if path == executable else Counter()
+        if embedded:
+            sizes.update(embedded)
+            sizes["引导程序"] += max(size - sum(embedded.values()), 0)
+        else:
+            sizes[package_of(relpath)] += size
+    return total, sizes
+def find_executable(dist_path):
+    """产物中的可执行文件：单文件产物本身、目录产物中与目录同名的文件或app包内的Contents/MacOS下的文件"""
+    if os.path.isfile(dist_path):
+        return dist_path
+    name = os.path.basename(dist_path.rstrip("/"))
+    if name.endswith(".app"):
+        name = name[:-len(".app")]
+    for candidate in (os.path.join(dist_path, name), os.path.join(dist_path, "Contents", "MacOS", name)):
+        if os.path.isfile(candidate):
+            return candidate
+    raise FileNotFoundError(f"未在{dist_path}中找到可执行文件")
+def measure_launch(executable, repeat=3):
+    """冷启动打包后的程序repeat次，返回各阶段耗时（毫秒，从进程启动算起）的中位数"""
+    home = tempfile.mkdtemp(prefix="bundle_report_")
+    os.makedirs(os.path.join(home, "Documents"))
+    env = dict(os.environ, HOME=home)
+    xvfb = None
+    if sys.platform.startswith("linux") and not env.get("DISPLAY"):
+        xvfb, display = start_virtual_display()
+        if display:
+            env["DISPLAY"] = display
+    runs = []
+    try:
+        for i in range(repeat):
+            probe_file = os.path.join(home, f"probe_{i}.json")
+            start = time.time()
+            completed = subprocess.run([executable], env=dict(env, **{STARTUP_PROBE_ENV: probe_file}),
+                                       capture_output=True, text=True, timeout=300)
+            if completed.returncode != 0 or not os.path.exists(probe_file):
+                raise RuntimeError(f"启动失败：{completed.stderr.strip()}")
+            with open(probe_file, encoding="utf-8") as f:
+                runs.append({key: (value - start) * 1000 for key, value in json.load(f).items()})
+    finally:
+        if xvfb:
+            xvfb.kill()
+        shutil.rmtree(home, ignore_errors=True)
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+def check_budget(total_bytes, launch, size_budget_mb, launch_budget_ms):
+    """与预算比较，返回超出预算的说明列表"""
+    failures = []
+    total_mb = total_bytes / 1024 / 1024
+    if size_budget_mb and total_mb > size_budget_mb:
+        failures.append(f"打包大小{total_mb:.1f} MB超过预算{size_budget_mb:.0f} MB")
+    if launch and launch_budget_ms:
+        stage = "first_frame" if "first_frame" in launch else "engine_ready"
+        if launch[stage] > launch_budget_ms:
+            failures.append(f"启动耗时（{stage}）{launch[stage]:.0f} ms超过预算{launch_budget_ms:.0f} ms")
+    return failures
+def format_report(dist_path, total_bytes, sizes, launch=None, top=15):
+    """报告文本：总大小、占用最多的包和启动耗时"""
+    lines = [f"📦 {dist_path}: 共{total_bytes / 1024 / 1024:.1f} MB"]
+    for package, size in sizes.most_common(top):
+        lines.append(f"   {package:<24} {size / 1024 / 1024:8.2f} MB  {size / max(total_bytes, 1):6.1%}")
+    rest = sum(size for _, size in sizes.most_common()[top:])
+    if rest:
+        lines.append(f"   {'其他':<24} {rest / 1024 / 1024:8.2f} MB  {rest / max(total_bytes, 1):6.1%}")
+    if launch:
+        stages = [("imported", "界面模块就绪"), ("first_frame", "首帧绘制完成"), ("engine_ready", "数据处理模块就绪")]
+        lines.append("🚀 启动耗时（中位数，从进程启动算起）：" + "，".join(
+            f"{label} {launch[key]:.0f} ms" for key, label in stages if key in launch))
+        if "first_frame" not in launch:
+            lines.append("   ⚠️ 无显示，未测量首帧")
+    return "\n".join(lines)
+def report_bundle(dist_path, size_budget_mb=SIZE_BUDGET_MB, launch_budget_ms=LAUNCH_BUDGET_MS, repeat=3, json_path=None):
+    """输出报告并检查预算，返回超出预算的说明列表；repeat为0时不测量启动耗时"""
+    total_bytes, sizes = bundle_sizes(dist_path)
+    launch = measure_launch(find_executable(dist_path), repeat) if repeat > 0 else None
+    print(format_report(dist_path, total_bytes, sizes, launch))
+    failures = check_budget(total_bytes, launch, size_budget_mb, launch_budget_ms)
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures and (size_budget_mb or launch_budget_ms):
+        print("✅ 打包大小和启动耗时在预算内")
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"dist_path": dist_path, "total_mb": total_bytes / 1024 / 1024,
+                       "packages_mb": {package: size / 1024 / 1024 for package, size in sizes.most_common()},
+                       "launch_ms": launch, "failures": failures}, f, ensure_ascii=False, indent=2)
+    return failures
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PyInstaller打包体积与启动耗时报告")
+    parser.add_argument("dist_path", help="单文件产物、目录产物或app包的路径")
+    parser.add_argument("--size-budget-mb", type=float, default=SIZE_BUDGET_MB, help="打包大小预算，0表示不检查")
+    parser.add_argument("--launch-budget-ms", type=float, default=LAUNCH_BUDGET_MS, help="启动耗时预算，0表示不检查")
+    parser.add_argument("--repeat", type=int, default=3, help="冷启动次数，0表示不测量启动耗时")
+    parser.add_argument("--json", help="结果另存为JSON")
+    args = parser.parse_args(argv)
+    failures = report_bundle(args.dist_path, args.size_budget_mb, args.launch_budget_ms, args.repeat, args.json)
+    return 1 if failures else 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+检查点写入与断点续跑
+清洗过程中只把新完成的行追加到输出文件旁的JSONL检查点，
+完整的Excel只在结束或停止时导出一次。
+检查点首行记录输入文件指纹、提示词哈希和发送列，都匹配时下次运行可跳过已完成的行
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+def checkpoint_path(output_file):
+    """检查点文件路径（与输出文件同目录）"""
+    return output_file + ".checkpoint.jsonl"
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """输入文件指纹：文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+def prompt_hash(prompt_template):
+    """提示词哈希"""
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+def make_header(input_fingerprint, prompt_digest, fields, columns=None):
+    """检查点首行；columns为发送给模型的列，发送列变化时不续跑"""
+    header = {"type": "header", "input_fingerprint": input_fingerprint, "prompt_hash": prompt_digest, "fields": fields}
+    if columns is not None:
+        header["columns"] = [str(col) for col in columns]
+    return header
+def read_checkpoint(path, header):
+    """读取与header匹配的检查点，返回[(行索引列表, 字段字典)]；文件不存在或不匹配时返回None"""
+    if not os.path.exists(path):
+        return None
+    records = []
+    with open(path, encoding="utf-8") as f:
+        try:
+            saved_header = json.loads(f.readline())
+        except ValueError:
+            return None
+        if saved_header != header:
+            return None
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时写了一半的行
+                continue
+            records.append((record["rows"], record["fields"]))
+    return records
+class CheckpointWriter:
+    def __init__(self, path, header, flush_rows=200, flush_seconds=10, resume=False):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        if resume:
+            # 续写已有检查点；上次崩溃可能留下不完整的末行，先补换行
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                incomplete = f.tell() > 0 and f.seek(-1, os.SEEK_END) >= 0 and f.read(1) != b"\n"
+            self.file = open(path, "a", encoding="utf-8")
+            if incomplete:
+                self.file.write("\n")
+        else:
+            self.file = open(path, "w", encoding="utf-8")
+            self.file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            self.file.flush()
+        self.buffer = []
+        self.buffered_rows = 0
+        self.lock = threading.Lock()
+        self.last_flush = time.time()
+        
+        # 统计
+        self.rows_written = 0
+        self.flush_count = 0
+        self.flush_time = 0.0
+    
+    def add(self, indices, fields):
+        """缓冲一条完成记录：indices为写入相同结果的行索引"""
+        record = json.dumps({"rows": [int(idx) for idx in indices], "fields": fields}, ensure_ascii=False)
+        with self.lock:
+            self.buffer.append(record)
+            self.buffered_rows += len(indices)
+    
+    def due(self):
+        """是否达到按行数或按时间的写入条件"""
+        return self.buffered_rows >= self.flush_rows or time.time() - self.last_flush >= self.flush_seconds
+    
+    def flush(self):
+        """把缓冲的记录追加到文件并落盘，返回写入行数"""
+        with self.lock:
+            self.last_flush = time.time()
+            if not self.buffer or self.file.closed:
+                return 0
+            started_at = time.time()
+            records = self.buffer
+            written_rows = self.buffered_rows
+            self.buffer = []
+            self.buffered_rows = 0
+            self.file.write("\n".join(records) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.rows_written += written_rows
+            self.flush_count += 1
+            self.flush_time += time.time() - started_at
+            return written_rows
+    
+    def close(self):
+        """写入剩余记录并关闭"""
+        self.flush()
+        with self.lock:
+            self.file.close()
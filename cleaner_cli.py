@@ -0,0 +1,175 @@
+"""
+命令行批处理入口（无界面，可在没有显示器的Linux服务器上运行）
+用法：python -m cleaner_cli -c config.ini -i input.xlsx -o output.xlsx
+分片批处理：python -m cleaner_cli -c config.ini --batch "exports/*.xlsx" --output-dir cleaned/
+运行前预估：python -m cleaner_cli -c config.ini -i input.xlsx --plan
+退出码：0 全部成功；1 处理出错或中断；2 参数或配置错误；3 完成但有行失败
+"""
+import argparse
+import configparser
+import os
+import queue
+import sys
+import threading
+import time
+from cleaner_config import default_config
+from cleaner_engine import CleanerEngine
+from shard_runner import expand_inputs, run_batch
+from run_planner import format_plan, plan_run
+def load_config(config_file, overrides):
+    """读取配置：缺少的键使用默认值，--set覆盖配置文件"""
+    config = configparser.ConfigParser(interpolation=None)
+    config.read_dict({"DEFAULT": default_config()})
+    if config_file:
+        if not os.path.exists(config_file):
+            raise FileNotFoundError(f"配置文件不存在：{config_file}")
+        config.read(config_file, encoding="utf-8")
+    for item in overrides:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"--set参数格式应为key=value：{item}")
+        config["DEFAULT"][key.strip()] = value.strip()
+    return config
+def print_progress(progress_queue, verbose, done_event):
+    """输出线程：打印状态信息，吞吐和进度每10秒打印一次"""
+    progress = 0.0
+    last_rate_at = 0.0
+    while not (done_event.is_set() and progress_queue.empty()):
+        try:
+            msg_type, content = progress_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if msg_type == "status":
+            # 逐行结果默认不打印
+            if verbose or not content.startswith("   行"):
+                print(content, end="", flush=True)
+        elif msg_type == "progress":
+            progress = content
+        elif msg_type == "rate" and time.time() - last_rate_at >= 10:
+            last_rate_at = time.time()
+            print(f"[{progress:5.1f}%] {content}", flush=True)
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m cleaner_cli", description="AI清洗工具命令行版（无界面批处理）")
+    parser.add_argument("-c", "--config", help="配置文件路径（INI，与界面版格式相同）")
+    parser.add_argument("-i", "--input", help="输入文件（xlsx/csv），缺省使用配置中的input_file")
+    parser.add_argument("-o", "--output", help="输出文件（xlsx），缺省使用配置中的output_file")
+    parser.add_argument("--api-key", help="API Key，缺省使用配置或环境变量AI_CLEANER_API_KEY")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖配置项，可多次指定")
+    parser.add_argument("-v", "--verbose", action="store_true", help="打印逐行结果")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="分片批处理：输入目录或通配符，多进程并行清洗")
+    parser.add_argument("--output-dir", help="分片批处理的输出目录")
+    parser.add_argument("--processes", type=int, help="分片批处理的进程数，缺省使用配置中的shard_processes")
+    parser.add_argument("--shard-rows", type=int, help="每个分片的行数，缺省使用配置中的shard_rows")
+    parser.add_argument("--concurrency", type=int, help="所有进程合计的并发上限，缺省使用配置中的并发数")
+    parser.add_argument("--plan", action="store_true", help="只预估Token、费用和耗时，不请求API")
+    parser.add_argument("--sample-rows", type=int, default=2000, help="预估时抽样的行数")
+    args = parser.parse_args(argv)
+    
+    try:
+        config = load_config(args.config, args.set)
+    except (OSError, ValueError, configparser.Error) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    
+    settings = config["DEFAULT"]
+    if args.api_key:
+        settings["api_key"] = args.api_key
+    elif not settings.get("api_key"):
+        settings["api_key"] = os.environ.get("AI_CLEANER_API_KEY", "")
+    input_file = args.input or settings.get("input_file", "")
+    output_file = args.output or settings.get("output_file", "")
+    
+    if args.plan:
+        return run_plan_mode(args, config, input_file, output_file)
+    if not settings["api_key"]:
+        print("❌ 缺少API Key（--api-key、配置文件或环境变量AI_CLEANER_API_KEY）", file=sys.stderr)
+        return 2
+    if args.batch:
+        return run_batch_mode(args, config)
+    if not input_file or not output_file:
+        print("❌ 请指定输入和输出文件", file=sys.stderr)
+        return 2
+    if not os.path.exists(input_file):
+        print(f"❌ 输入文件不存在：{input_file}", file=sys.stderr)
+        return 2
+    
+    engine = CleanerEngine(config)
+    engine.fields = engine.extract_dynamic_fields(settings["prompt"])
+    if not engine.fields:
+        print("❌ 未从提示词中提取到字段，请检查提示词格式", file=sys.stderr)
+        return 2
+    
+    done_event = threading.Event()
+    printer = threading.Thread(target=print_progress, args=(engine.progress_queue, args.verbose, done_event), daemon=True)
+    printer.start()
+    engine.processing = True
+    try:
+        succeeded = engine.process_data(input_file, output_file)
+    except KeyboardInterrupt:
+        engine.stop()
+        succeeded = False
+        engine.progress_queue.put(("status", "\n🛑 已中断，已完成的行保存在检查点中，下次运行可续跑\n"))
+    done_event.set()
+    printer.join()
+    
+    rows_per_second = engine.completed_rows / engine.elapsed if engine.elapsed > 0 else 0
+    print(f"📊 吞吐统计：完成{engine.completed_rows}/{engine.total_rows}行，失败{engine.failed_rows}行，"
+          f"耗时{engine.elapsed:.2f}秒，{rows_per_second:.1f}行/秒")
+    if not succeeded:
+        return 1
+    if engine.failed_rows:
+        return 3
+    return 0
+def run_plan_mode(args, config, input_file, output_file):
+    """运行前预估：抽样估算Token、费用和耗时"""
+    if not input_file or not os.path.exists(input_file):
+        print(f"❌ 输入文件不存在：{input_file}", file=sys.stderr)
+        return 2
+    fields = CleanerEngine(config).extract_dynamic_fields(config["DEFAULT"]["prompt"])
+    if not fields:
+        print("❌ 未从提示词中提取到字段，请检查提示词格式", file=sys.stderr)
+        return 2
+    started_at = time.time()
+    plan = plan_run(config, fields, input_file, output_file, args.sample_rows)
+    print(format_plan(plan), end="")
+    print(f"⏱️ 预估耗时{time.time() - started_at:.2f}秒")
+    return 0
+def run_batch_mode(args, config):
+    """分片批处理模式"""
+    settings = config["DEFAULT"]
+    input_files = expand_inputs(args.batch)
+    if not input_files:
+        print(f"❌ 没有匹配的输入文件：{args.batch}", file=sys.stderr)
+        return 2
+    if not args.output_dir:
+        print("❌ 分片批处理需要指定--output-dir", file=sys.stderr)
+        return 2
+    fields = CleanerEngine(config).extract_dynamic_fields(settings["prompt"])
+    if not fields:
+        print("❌ 未从提示词中提取到字段，请检查提示词格式", file=sys.stderr)
+        return 2
+    
+    processes = args.processes or int(settings.get("shard_processes", "4"))
+    shard_rows = args.shard_rows or int(settings.get("shard_rows", "50000"))
+    if args.concurrency:
+        total_concurrency = args.concurrency
+    elif settings.get("engine", "threads") == "async":
+        total_concurrency = int(settings.get("async_concurrency", "100"))
+    else:
+        total_concurrency = int(settings["max_workers"])
+    
+    try:
+        _, failed_rows, completed = run_batch(
+            config, fields, input_files, args.output_dir, processes, shard_rows, total_concurrency,
+            log=lambda message: print(message, end="", flush=True)
+        )
+    except KeyboardInterrupt:
+        print("\n🛑 已中断，已完成的行保存在各分片的检查点中，下次运行可续跑", flush=True)
+        return 1
+    if not completed:
+        return 1
+    if failed_rows:
+        return 3
+    return 0
+if __name__ == "__main__":
+    sys.exit(main())
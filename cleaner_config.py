@@ -0,0 +1,93 @@
+"""
+默认配置
+只依赖标准库：界面启动时先用它生成配置和预览字段，
+pandas等重型依赖随cleaner_engine在后台线程中加载
+"""
+import re
+# 默认清洗规则
+DEFAULT_PROMPT = """
+### 动态字段清洗规则（根据此提示词自动提取字段）
+请作为专业数据分析师，按照以下规则处理数据：
+1. 从【宝贝名】字段提取以下信息：
+   - 产品名称：提取产品的完整名称
+   - 规格：提取产品的容量规格
+   - 功效：提取产品的主要功效
+   - 核心成分：提取产品的主要有效成分
+   - 适用肤质：提取适用肤质信息
+2. 输出格式要求：
+   - 每个字段单独一行
+   - 格式为"字段名:值"，使用英文冒号
+   - 字段名必须与上述列表完全一致
+   - 没有信息的字段留空
+3. 示例输入：兰蔻小黑瓶精华液 30ml 保湿抗皱 二裂酵母成分 所有肤质适用
+4. 示例输出：
+产品名称:兰蔻小黑瓶精华液
+规格:30ml
+功效:保湿抗皱
+核心成分:二裂酵母
+适用肤质:所有肤质
+### 重要说明：
+- 工具会自动从第1条规则中提取字段名
+- 你可以修改第1条规则中的字段列表
+- 字段数量没有限制，可根据需要增删
+- 严格按照示例格式输出，不要添加额外内容
+"""
+def default_config():
+    """默认配置（DEFAULT节的键值）"""
+    return {
+        "api_key": "",
+        "api_url": "https://api.deepseek.com/v1/chat/completions",
+        "prompt": DEFAULT_PROMPT.strip(),
+        "input_file": "",
+        "output_file": "",
+        "checkpoint_rows": "200",
+        "checkpoint_seconds": "10",
+        "resume_enabled": "1",
+        "stream_chunk_rows": "0",
+        "shard_processes": "4",
+        "shard_rows": "50000",
+        "max_workers": "4",
+        "connect_timeout": "10",
+        "read_timeout": "30",
+        "pack_token_budget": "0",
+        "pack_max_rows": "20",
+        "dedup_enabled": "1",
+        "cache_enabled": "1",
+        "cache_max_mb": "200",
+        "cache_max_age_days": "30",
+        "engine": "threads",
+        "async_concurrency": "100",
+        "adaptive_concurrency": "1",
+        "max_retries": "3",
+        "backoff_base": "1",
+        "backoff_max": "30",
+        "profile_enabled": "1",
+        "cprofile_enabled": "0",
+        "metrics_port": "0",
+        "metrics_host": "127.0.0.1",
+        "prompt_columns": "",
+        "extract_rules": "",
+        "column_projection": "1",
+        "output_format": "text",
+        "json_retries": "1",
+        "stream_enabled": "0",
+        "adaptive_max_tokens": "1",
+        "hedge_enabled": "0",
+        "hedge_percentile": "95",
+        "hedge_max_ratio": "0.05",
+        "plan_target_minutes": "30",
+        "price_prompt_per_million": "2",
+        "price_completion_per_million": "8"
+    }
+def extract_fields(prompt):
+    """从提示词中动态提取字段名（"- 字段名：说明"格式的行）"""
+    pattern = r'[-*]\s*([^\n:：]+?)\s*[:：]'
+    matches = re.findall(pattern, prompt)
+    
+    fields = []
+    for field in matches:
+        cleaned_field = re.sub(r'[^\w\u4e00-\u9fa5]', '', field).strip()
+        if cleaned_field and cleaned_field not in fields:
+            fields.append(cleaned_field)
+    
+    return fields
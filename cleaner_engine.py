@@ -0,0 +1,1765 @@
+"""
+清洗引擎
+字段提取、提示词构建、API调用、结果解析与写回，不依赖界面，
+Tk界面和命令行共用
+"""
+import pandas as pd
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+import os
+import traceback
+import time
+import re
+import random
+import math
+import collections
+from email.utils import parsedate_to_datetime
+import concurrent.futures
+import asyncio
+import queue
+import json
+from result_cache import ResultCache
+from checkpoint import CheckpointWriter, checkpoint_path, file_fingerprint, prompt_hash, make_header, read_checkpoint
+from table_reader import TableChunkReader, read_table, save_table
+from run_profile import RunProfiler, profile_paths
+from metrics_server import MetricsServer
+from rule_extractor import RuleExtractor, parse_rules
+from cleaner_config import extract_fields
+# 异步引擎依赖aiohttp，未安装时只能使用线程引擎
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+# 打包模式：多行数据合并为一次请求时追加的说明
+PACK_INSTRUCTION = """
+### 批量处理说明
+以下共{count}条数据，每条以【行号】标记开头（如【行12】）。请逐条处理，不要遗漏：
+- 每条结果先单独输出一行该条的行号标记，标记必须与输入完全一致
+- 标记之后按上述格式逐行输出该条的全部字段
+"""
+PACK_MARKER_PATTERN = re.compile(r'[【\[]\s*行\s*(\d+)\s*[】\]]')
+# JSON输出模式：要求模型只输出JSON对象，键为提取到的字段
+JSON_INSTRUCTION = """
+### JSON输出要求（优先于上文的输出格式要求）
+只输出一个JSON对象，不要输出其他文字。键为以下字段名，值为字符串，没有信息的字段填空字符串：
+{schema}
+"""
+PACK_JSON_INSTRUCTION = """
+### 批量处理说明
+以下共{count}条数据，每条以【行号】标记开头（如【行12】）。请逐条处理，不要遗漏。
+只输出一个JSON对象，不要输出其他文字。键为行号（如"12"），值为该条数据的字段对象，字段对象的键为以下字段名，值为字符串，没有信息的字段填空字符串：
+{schema}
+"""
+# 规则已填充部分字段时，只请求其余字段
+FIELD_SUBSET_INSTRUCTION = """
+### 本次只需输出以下字段（其余字段已提取，不要输出）：
+{fields}
+"""
+# 定向重试：附上上次输出无法通过校验的原因
+JSON_REPAIR_INSTRUCTION = "\n上次输出不符合要求（{error}），请只输出符合上述字段要求的JSON对象。"
+def estimate_tokens(text):
+    """粗略估算token数：中文约1字1token，其余约4字符1token"""
+    cjk_count = len(re.findall(r'[\u4e00-\u9fa5]', text))
+    return cjk_count + (len(text) - cjk_count) // 4 + 1
+# 提示词中以【列名】引用的列
+PROMPT_COLUMN_PATTERN = re.compile(r'【([^【】\n]+)】')
+def select_prompt_columns(prompt_template, columns, configured="", infer=True):
+    """选出发送给模型的列（保持输入顺序）：优先使用配置的列名（逗号分隔），其次为提示词中以【列名】引用的列，都没有时发送全部列"""
+    by_name = {str(col): col for col in columns}
+    if configured.strip():
+        wanted = [name.strip() for name in re.split(r'[,，]', configured) if name.strip()]
+        missing = [name for name in wanted if name not in by_name]
+        if missing:
+            raise ValueError(f"配置的发送列在输入中不存在：{missing}")
+    elif infer:
+        wanted = [name for name in PROMPT_COLUMN_PATTERN.findall(prompt_template) if name in by_name]
+    else:
+        wanted = []
+    if not wanted:
+        return list(columns)
+    wanted = set(wanted)
+    return [col for col in columns if str(col) in wanted]
+def key_columns(prompt_columns, rule_extractor=None):
+    """去重和缓存键依据的列：发送列加上规则读取但不发送的列（规则结果随这些列变化）"""
+    extra = [col for col in rule_extractor.columns if col not in prompt_columns] if rule_extractor else []
+    return list(prompt_columns) + extra
+def serialize_rows(df, columns):
+    """按列向量化序列化每行数据（"列名: 值"逐行拼接），与build_row_data格式一致，返回文本列表"""
+    text = None
+    for col in columns:
+        part = f"{col}: " + df[col].map(str)
+        text = part if text is None else text + "\n" + part
+    return text.tolist() if text is not None else [""] * len(df)
+# 可重试的HTTP状态码：限流和服务端错误
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=30.0):
+    """计算重试等待时间：优先遵循Retry-After，否则带抖动的指数退避"""
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), cap)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0), cap)
+            except (TypeError, ValueError):
+                pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+class AdaptiveLimiter:
+    """AIMD自适应并发：延迟和错误率健康时逐步加并发，遇到429/5xx/超时时减半；adaptive=False时固定为上限，只计数"""
+    def __init__(self, max_limit, min_limit=1, latency_tolerance=2.0, adaptive=True):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        # 从上限的一半起步，逐步探测
+        self.limit = float(max(min_limit, max_limit // 2)) if adaptive else float(max_limit)
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.overloads = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+    
+    @property
+    def current_limit(self):
+        """当前允许的在途请求数"""
+        return int(self.limit)
+    
+    def on_success(self, latency):
+        """请求成功：延迟未明显劣化时加性增加"""
+        if not self.adaptive:
+            return
+        with self.lock:
+            if self.baseline_latency is None:
+                self.baseline_latency = latency
+            else:
+                # 基线贴近最小延迟，随网络变化缓慢上浮
+                self.baseline_latency = min(latency, self.baseline_latency * 0.99 + latency * 0.01)
+            if latency <= self.baseline_latency * self.latency_tolerance:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+    
+    def on_overload(self):
+        """限流/服务端错误/超时：乘性减少，冷却期内只减一次"""
+        with self.lock:
+            self.overloads += 1
+            if not self.adaptive:
+                return
+            now = time.time()
+            cooldown = max(1.0, self.baseline_latency or 0.0)
+            if now - self.last_decrease >= cooldown:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+                self.last_decrease = now
+    
+    def on_retry(self):
+        """记录一次重试"""
+        with self.lock:
+            self.retries += 1
+class HedgePolicy:
+    """请求对冲：任务耗时超过近期任务耗时的分位数时再发一份副本，副本数不超过已提交任务数的max_ratio"""
+    def __init__(self, percentile=95.0, max_ratio=0.05, min_samples=20, min_delay=1.0, window=500):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.latencies = collections.deque(maxlen=window)
+        # 对冲阈值（秒），样本不足时不对冲
+        self.delay = None
+        self.pending = 0
+        self.tasks = 0
+        self.fired = 0
+        self.won = 0
+        # 落败的另一份已在执行、无法取消的次数（线程引擎中正在运行的请求不能中断）
+        self.abandoned = 0
+    
+    def record(self, seconds):
+        """记录一个任务的耗时，每积累16个重新计算阈值"""
+        self.latencies.append(seconds)
+        self.pending += 1
+        if len(self.latencies) >= self.min_samples and self.pending >= 16:
+            self.delay = max(self.min_delay, float(np.percentile(self.latencies, self.percentile)))
+            self.pending = 0
+    
+    def should_hedge(self, elapsed):
+        """已耗时elapsed秒的任务是否发出对冲副本"""
+        return self.delay is not None and elapsed >= self.delay and self.fired < self.max_ratio * self.tasks
+# 单次请求的输出Token上限
+MAX_OUTPUT_TOKENS = 8192
+class OutputTokenBudget:
+    """自适应max_tokens：观测不足时按字段数估算，之后取每行输出Token数的p99乘以余量"""
+    def __init__(self, field_count, margin=1.25, extra_tokens=16, min_samples=20, window=2000):
+        # 每个字段按字段名加值约30个Token估算
+        self.default_row_tokens = field_count * 30 + 10
+        self.margin = margin
+        self.extra_tokens = extra_tokens
+        self.min_samples = min_samples
+        self.samples = collections.deque(maxlen=window)
+        self.row_tokens = float(self.default_row_tokens)
+        self.pending = 0
+        self.lock = threading.Lock()
+    
+    def observe(self, completion_tokens, rows=1):
+        """记录一次完整输出的Token数，每积累16次重新计算p99"""
+        with self.lock:
+            self.samples.append(completion_tokens / max(rows, 1))
+            self.pending += 1
+            if len(self.samples) >= self.min_samples and self.pending >= 16:
+                self.row_tokens = float(np.percentile(self.samples, 99)) * self.margin
+                self.pending = 0
+    
+    def max_tokens(self, rows=1):
+        """rows行输出所需的max_tokens"""
+        return int(min(MAX_OUTPUT_TOKENS, math.ceil(rows * self.row_tokens) + self.extra_tokens))
+class StreamedCompletion:
+    """累积SSE流式响应的内容增量、usage和结束原因"""
+    def __init__(self):
+        self.parts = []
+        self.usage = None
+        self.finish_reason = None
+        self.stopped_early = False
+    
+    def feed(self, line):
+        """解析一行SSE，返回本行的内容增量"""
+        line = line.strip()
+        if not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return ""
+        event = json.loads(data)
+        if event.get("usage"):
+            self.usage = event["usage"]
+        choices = event.get("choices") or []
+        if not choices:
+            return ""
+        if choices[0].get("finish_reason"):
+            self.finish_reason = choices[0]["finish_reason"]
+        text = (choices[0].get("delta") or {}).get("content") or ""
+        if text:
+            self.parts.append(text)
+        return text
+    
+    @property
+    def content(self):
+        """已收到的完整内容"""
+        return "".join(self.parts)
+class CountingHTTPAdapter(HTTPAdapter):
+    """统计实际建立的TCP/TLS连接：连接对象每次connect()都计数，断开后经同一对象重连也计入"""
+    def __init__(self, *args, **kwargs):
+        self.connects = 0
+        # 已连接过的连接对象再次connect()：服务端或本端（如流式提前断开）关闭连接后的重连
+        self.reconnects = 0
+        self.connect_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+        
+        def counting(connection_cls):
+            class CountingConnection(connection_cls):
+                def connect(self):
+                    with adapter.connect_lock:
+                        adapter.connects += 1
+                        if getattr(self, "connected_before", False):
+                            adapter.reconnects += 1
+                    self.connected_before = True
+                    return super().connect()
+            return CountingConnection
+        
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": counting(pool_cls.ConnectionCls)})
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+class APISessionPool:
+    """共享HTTP连接池：keep-alive复用TCP/TLS连接，线程安全"""
+    def __init__(self, pool_size, connect_timeout=10, read_timeout=30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        # 连接池大小跟随线程数，pool_block保证并发请求不会超出池容量而临时建连
+        self.adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+        self.request_count = 0
+        self.lock = threading.Lock()
+    
+    def post(self, url, **kwargs):
+        """发送POST请求（复用连接）"""
+        kwargs.setdefault("timeout", self.timeout)
+        with self.lock:
+            self.request_count += 1
+        return self.session.post(url, **kwargs)
+    
+    def connection_count(self):
+        """统计实际建立的TCP/TLS连接数（包括连接断开后的重连）"""
+        with self.adapter.connect_lock:
+            return self.adapter.connects
+    
+    def reconnect_count(self):
+        """连接断开后经同一连接对象重连的次数"""
+        with self.adapter.connect_lock:
+            return self.adapter.reconnects
+    
+    def stats(self):
+        """返回(请求数, 新建连接数, 复用次数)"""
+        with self.lock:
+            requests_sent = self.request_count
+        connections = self.connection_count()
+        return requests_sent, connections, max(requests_sent - connections, 0)
+    
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+class PackQueue:
+    """待发送的任务队列：一次性给出全部任务，或由feed边读取边补充"""
+    def __init__(self, packs=(), feed=None):
+        self.packs = collections.deque(packs)
+        # feed(block)返回(新任务列表, 是否已读完)
+        self.feed = feed
+    
+    def __bool__(self):
+        return bool(self.packs) or self.feed is not None
+    
+    def pop(self, block=False):
+        """取出下一个任务；暂无可用任务时返回None"""
+        if not self.packs and self.feed is not None:
+            packs, finished = self.feed(block)
+            self.packs.extend(packs)
+            if finished:
+                self.feed = None
+        return self.packs.popleft() if self.packs else None
+class CleanerEngine:
+    """清洗引擎：进度和日志通过progress_queue输出，("status"|"progress"|"rate", 内容)"""
+    def __init__(self, config, progress_queue=None, on_finished=None):
+        self.config = config
+        self.progress_queue = progress_queue or queue.Queue()
+        # 处理结束（成功、失败或停止）后的回调
+        self.on_finished = on_finished
+        self.processing = False
+        # 停止后是否仍导出已处理的结果，由stop()设置
+        self.save_on_stop = True
+        self.df = None
+        self.fields = []
+        
+        # 线程池
+        self.executor = None
+        
+        # HTTP连接池
+        self.api_pool = None
+        
+        # 结果缓存
+        self.result_cache = None
+        
+        # 增量检查点
+        self.checkpoint = None
+        
+        # 行内去重：{代表行索引: [重复行索引]}
+        self.duplicate_groups = {}
+        
+        # 规则预提取：{行索引: 规则已填充的字段}、{行索引: 需请求API的字段}
+        self.rule_extractor = None
+        self.local_fields = {}
+        self.request_fields = {}
+        self.rule_rows = 0
+        self.local_cells = 0
+        
+        # 结果写回缓冲：{字段: ([行位置], [值])}，按检查点间隔批量写入表格
+        self.field_buffers = {}
+        self.write_lock = threading.Lock()
+        # 工作线程更新的统计计数
+        self.stats_lock = threading.Lock()
+        
+        # 流式读取：读取线程放入已解析分块的队列；表格按倍数预分配，loaded_rows为已读入的行数
+        # input_buffer承载原始列（结果列除外），output_columns为导出时的列顺序
+        self.streaming = False
+        self.chunk_queue = None
+        self.loaded_rows = 0
+        self.estimated_rows = 0
+        self.input_buffer = None
+        self.output_columns = []
+        
+        # 自适应并发与重试
+        self.limiter = None
+        self.max_retries = 3
+        self.backoff_base = 1.0
+        self.backoff_max = 30.0
+        self.throughput_samples = collections.deque()
+        
+        # API地址（可指向本地模拟服务）
+        self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        
+        # 输出格式：text逐行解析"字段名:值"，json按字段校验JSON对象
+        self.output_format = "text"
+        self.json_retries = 1
+        
+        # 流式输出：字段全部到达后提前断开；max_tokens按观测的输出长度自适应
+        self.stream_completions = False
+        self.output_budget = None
+        self.early_stops = 0
+        self.truncated_outputs = 0
+        
+        # 请求对冲：{任务: 另一份}，以及对冲发出的副本
+        self.hedge = None
+        self.hedge_twins = {}
+        self.hedge_copies = set()
+        
+        # 本次运行统计
+        self.total_rows = 0
+        self.completed_rows = 0
+        self.failed_rows = 0
+        self.elapsed = 0.0
+        self.save_time = 0.0
+        self.row_latencies = []
+        self.resumed_rows = 0
+        self.cached_rows = 0
+        self.avoided_calls = 0
+        self.in_flight_requests = 0
+        
+        # 各阶段耗时和Token用量
+        self.profiler = RunProfiler()
+        
+        # 指标接口（metrics_port非0时启动）
+        self.metrics_server = None
+    
+    def stop(self, save=True):
+        """停止处理，不再提交新任务；结果由处理线程在收尾时导出，save为False时不导出"""
+        self.save_on_stop = save
+        self.processing = False
+        if self.executor:
+            self.executor.shutdown(wait=False)
+    
+    def extract_dynamic_fields(self, prompt):
+        """从提示词中动态提取字段名"""
+        return extract_fields(prompt)
+    
+    def clean_field_name(self, field):
+        """清理字段名"""
+        return re.sub(r'[^\w\u4e00-\u9fa5]', '', field).strip()
+    
+    def save_excel_file(self, output_file):
+        """保存结果文件（按扩展名保存为Excel、CSV或分片中间文件）"""
+        try:
+            self.flush_row_writes()
+            # 流式读取未读完时截去预分配的空行；fillna已返回新对象，无需再整表复制
+            table = self.df.iloc[:self.loaded_rows][self.output_columns] if self.streaming else self.df
+            save_table(table.fillna(""), output_file)
+            return True
+        except Exception as e:
+            error_msg = f"保存文件错误：{str(e)}"
+            self.progress_queue.put(("status", f"\n❌ {error_msg}\n"))
+            return False
+    
+    def process_data(self, input_file, output_file):
+        """处理数据，全部完成并导出成功时返回True"""
+        succeeded = False
+        try:
+            # 获取配置
+            api_key = self.config["DEFAULT"]["api_key"]
+            prompt_template = self.config["DEFAULT"]["prompt"]
+            checkpoint_rows = int(self.config["DEFAULT"].get("checkpoint_rows", "200"))
+            checkpoint_seconds = float(self.config["DEFAULT"].get("checkpoint_seconds", "10"))
+            resume_enabled = self.config["DEFAULT"].get("resume_enabled", "1") == "1"
+            stream_chunk_rows = int(self.config["DEFAULT"].get("stream_chunk_rows", "0"))
+            max_workers = int(self.config["DEFAULT"]["max_workers"])
+            connect_timeout = float(self.config["DEFAULT"].get("connect_timeout", "10"))
+            read_timeout = float(self.config["DEFAULT"].get("read_timeout", "30"))
+            pack_token_budget = int(self.config["DEFAULT"].get("pack_token_budget", "0"))
+            pack_max_rows = int(self.config["DEFAULT"].get("pack_max_rows", "20"))
+            dedup_enabled = self.config["DEFAULT"].get("dedup_enabled", "1") == "1"
+            cache_enabled = self.config["DEFAULT"].get("cache_enabled", "1") == "1"
+            cache_max_mb = float(self.config["DEFAULT"].get("cache_max_mb", "200"))
+            cache_max_age_days = float(self.config["DEFAULT"].get("cache_max_age_days", "30"))
+            engine = self.config["DEFAULT"].get("engine", "threads")
+            async_concurrency = int(self.config["DEFAULT"].get("async_concurrency", "100"))
+            adaptive_concurrency = self.config["DEFAULT"].get("adaptive_concurrency", "1") == "1"
+            self.max_retries = int(self.config["DEFAULT"].get("max_retries", "3"))
+            self.backoff_base = float(self.config["DEFAULT"].get("backoff_base", "1"))
+            self.backoff_max = float(self.config["DEFAULT"].get("backoff_max", "30"))
+            self.api_url = self.config["DEFAULT"].get("api_url", "https://api.deepseek.com/v1/chat/completions")
+            self.output_format = self.config["DEFAULT"].get("output_format", "text")
+            self.json_retries = int(self.config["DEFAULT"].get("json_retries", "1"))
+            self.stream_completions = self.config["DEFAULT"].get("stream_enabled", "0") == "1"
+            adaptive_max_tokens = self.config["DEFAULT"].get("adaptive_max_tokens", "1") == "1"
+            hedge_enabled = self.config["DEFAULT"].get("hedge_enabled", "0") == "1"
+            hedge_percentile = float(self.config["DEFAULT"].get("hedge_percentile", "95"))
+            hedge_max_ratio = float(self.config["DEFAULT"].get("hedge_max_ratio", "0.05"))
+            profile_enabled = self.config["DEFAULT"].get("profile_enabled", "1") == "1"
+            cprofile_enabled = self.config["DEFAULT"].get("cprofile_enabled", "0") == "1"
+            metrics_port = int(self.config["DEFAULT"].get("metrics_port", "0"))
+            metrics_host = self.config["DEFAULT"].get("metrics_host", "127.0.0.1")
+            configured_columns = self.config["DEFAULT"].get("prompt_columns", "")
+            extract_rules = parse_rules(self.config["DEFAULT"].get("extract_rules", ""))
+            column_projection = self.config["DEFAULT"].get("column_projection", "1") == "1"
+            self.profiler = RunProfiler()
+            
+            # 读取输入：流式模式边解析边调度，否则一次性读入整表
+            self.streaming = stream_chunk_rows > 0
+            read_started_at = time.time()
+            if self.streaming:
+                reader = TableChunkReader(input_file, stream_chunk_rows)
+                self.df = pd.DataFrame(columns=reader.columns)
+                self.loaded_rows = 0
+                self.estimated_rows = reader.estimated_rows or 0
+                self.input_buffer = None
+                total_rows = self.estimated_rows
+                self.progress_queue.put(("status", f"📥 流式读取：每块{stream_chunk_rows}行，预计共{total_rows}行\n"))
+            else:
+                with self.profiler.span("read_input"):
+                    self.df = read_table(input_file)
+                total_rows = len(self.df)
+                self.progress_queue.put(("status", f"✅ 读取原始数据成功，共{total_rows}行\n"))
+            original_columns = self.df.columns.tolist()
+            # 列投影：只把提示词用到的列序列化后发送给模型
+            prompt_columns = select_prompt_columns(prompt_template, original_columns, configured_columns, column_projection)
+            if len(prompt_columns) < len(original_columns):
+                self.progress_queue.put(("status", f"🎯 发送列：{prompt_columns}（共{len(original_columns)}列中的{len(prompt_columns)}列）\n"))
+            # 规则预提取：只保留提示词中存在的字段
+            self.rule_extractor = RuleExtractor(extract_rules, self.fields, original_columns) if extract_rules else None
+            if self.rule_extractor:
+                self.progress_queue.put(("status", f"🧩 规则预提取：{len(self.rule_extractor.rules)}条规则，覆盖字段{self.rule_extractor.fields}\n"))
+            elif extract_rules:
+                self.progress_queue.put(("status", "⚠️ 提取规则中的字段都不在提示词中，规则未生效\n"))
+            
+            self.progress_queue.put(("status", f"📋 动态提取字段：{self.fields}（共{len(self.fields)}个）\n"))
+            
+            # 添加新字段
+            self.add_result_columns(self.df)
+            self.output_columns = self.df.columns.tolist()
+            self.field_buffers = {field: ([], []) for field in self.fields}
+            
+            if engine == "async" and aiohttp is None:
+                self.progress_queue.put(("status", "⚠️ 未安装aiohttp，异步引擎不可用，改用线程引擎\n"))
+                engine = "threads"
+            concurrency = async_concurrency if engine == "async" else max_workers
+            # 自适应并发：配置值作为上限；关闭时固定为上限
+            self.limiter = AdaptiveLimiter(concurrency, adaptive=adaptive_concurrency)
+            
+            self.progress_queue.put(("status", f"⚡ 提速配置：{engine}引擎，并发数={concurrency}，每{checkpoint_rows}行或{checkpoint_seconds:g}秒写一次检查点\n"))
+            if hedge_enabled:
+                self.progress_queue.put(("status", f"🪁 请求对冲：耗时超过p{hedge_percentile:g}的请求再发一份副本（副本另行计费，最多为已提交请求的{hedge_max_ratio:.0%}），"
+                                                   f"副本不占并发名额，在途请求会超出并发数\n"))
+            
+            # 检查点：只追加新完成的行，Excel在结束或停止时导出一次
+            # 检查点首行记录输入文件指纹、提示词哈希和发送列，都一致时从中断处续跑
+            journal_path = checkpoint_path(output_file)
+            journal_header = make_header(file_fingerprint(input_file), prompt_hash(prompt_template), self.fields, prompt_columns)
+            resumed_records = read_checkpoint(journal_path, journal_header) if resume_enabled else None
+            self.checkpoint = CheckpointWriter(
+                journal_path, journal_header, checkpoint_rows, checkpoint_seconds, resume=resumed_records is not None
+            )
+            self.load_resumed_records(resumed_records or [])
+            
+            # 本次运行的共享状态（两种引擎共用）
+            self.dedup_enabled = dedup_enabled
+            self.pack_token_budget = pack_token_budget
+            self.pack_max_rows = pack_max_rows
+            self.duplicate_groups = {}
+            self.local_fields = {}
+            self.request_fields = {}
+            self.rule_rows = 0
+            self.local_cells = 0
+            self.row_owners = {}
+            self.queued_rows = set()
+            self.row_texts = {}
+            self.cache_keys = {}
+            self.resumed_rows = 0
+            self.cached_rows = 0
+            self.avoided_calls = 0
+            self.in_flight_requests = 0
+            self.json_repairs = 0
+            self.early_stops = 0
+            self.truncated_outputs = 0
+            self.output_budget = OutputTokenBudget(len(self.fields)) if adaptive_max_tokens else None
+            self.hedge = HedgePolicy(hedge_percentile, hedge_max_ratio) if hedge_enabled else None
+            self.hedge_twins = {}
+            self.hedge_copies = set()
+            self.prompt_size = len(prompt_template.encode("utf-8"))
+            self.total_rows = total_rows
+            self.completed_rows = 0
+            self.failed_rows = 0
+            self.row_latencies = []
+            self.finished_tasks = 0
+            self.last_rate_update = 0.0
+            self.read_started_at = read_started_at
+            
+            # 结果缓存：命中的行直接写回，跳过网络请求
+            if cache_enabled:
+                self.result_cache = ResultCache(max_mb=cache_max_mb, max_age_days=cache_max_age_days)
+            
+            # 指标接口：端口被占用时只提示，不影响清洗
+            if metrics_port:
+                try:
+                    self.metrics_server = MetricsServer(self, metrics_host, metrics_port)
+                    self.progress_queue.put(("status", f"📡 指标接口：{self.metrics_server.url}\n"))
+                except OSError as e:
+                    self.progress_queue.put(("status", f"⚠️ 指标接口启动失败（端口{metrics_port}）：{str(e)}\n"))
+            
+            if self.streaming:
+                # 读取线程解析分块，调度循环随时取用已解析的行
+                self.chunk_queue = queue.Queue(maxsize=4)
+                threading.Thread(target=self.read_input_chunks, args=(reader,), name="cleaner-reader", daemon=True).start()
+                packs = PackQueue(feed=lambda block: self.pull_input_chunks(block, prompt_template, prompt_columns))
+            else:
+                done_mask = self.apply_resumed_records(0, total_rows)
+                if done_mask.any():
+                    self.progress_queue.put(("status", f"⏯️ 断点续跑：从检查点恢复{int(done_mask.sum())}行\n"))
+                elif not resumed_records and resume_enabled and os.path.exists(output_file):
+                    done_mask = self.resume_from_output(output_file, original_columns)
+                    if done_mask.any():
+                        self.progress_queue.put(("status", f"⏯️ 断点续跑：从已有输出文件恢复{int(done_mask.sum())}行\n"))
+                with self.profiler.span("prepare_rows"):
+                    packs = PackQueue(self.prepare_rows(0, total_rows, done_mask, prompt_template, prompt_columns))
+            self.throughput_samples = collections.deque([(time.time(), self.completed_rows)])
+            
+            start_time = time.time()
+            
+            # cProfile剖析调度线程；线程引擎的工作线程以cleaner-worker命名，便于py-spy区分
+            if cprofile_enabled:
+                self.profiler.enable_cprofile()
+            if engine == "async":
+                asyncio.run(self.process_packs_async(
+                    packs, api_key, prompt_template, concurrency, connect_timeout, read_timeout
+                ))
+            else:
+                # 落败的对冲副本无法中断，为其预留线程；连接池大小跟随线程数，否则预留的线程会在pool_block上等待连接
+                # 因此开启对冲时，同时进行的请求最多比max_workers多hedge_threads个
+                hedge_threads = math.ceil(max_workers * self.hedge.max_ratio) if self.hedge else 0
+                self.api_pool = APISessionPool(max_workers + hedge_threads, connect_timeout, read_timeout)
+                self.process_packs_threaded(packs, api_key, prompt_template, max_workers, hedge_threads)
+            
+            # 计算耗时
+            total_time = time.time() - start_time
+            json_profile, csv_profile, cprofile_file = profile_paths(output_file)
+            if self.profiler.dump_cprofile(cprofile_file):
+                self.progress_queue.put(("status", f"🔬 cProfile结果：{cprofile_file}\n"))
+            self.elapsed = total_time
+            stopped = not self.processing
+            avg_time_per_row = total_time / self.total_rows if self.total_rows > 0 else 0
+            
+            # 最终保存：写完检查点后一次性导出Excel
+            with self.profiler.span("checkpoint"):
+                self.checkpoint.flush()
+            saved = False
+            if stopped and not self.save_on_stop:
+                self.progress_queue.put(("status", "\n🛑 已停止，未保存结果（检查点已保留，可断点续跑）\n"))
+            else:
+                save_started_at = time.time()
+                with self.profiler.span("save"):
+                    saved = self.save_excel_file(output_file)
+                self.save_time = time.time() - save_started_at
+                if saved and stopped:
+                    self.progress_queue.put(("status", f"\n🛑 已停止，已保存结果到：{output_file}\n"))
+            if saved:
+                new_columns = self.df.columns.tolist()
+                added_fields = [col for col in new_columns if col not in original_columns]
+                
+                self.progress_queue.put(("status", "\n🎉 处理完成！\n"))
+                self.progress_queue.put(("status", f"⏱️ 总耗时：{total_time:.2f}秒\n"))
+                self.progress_queue.put(("status", f"⚡ 平均每行：{avg_time_per_row:.2f}秒\n"))
+                self.progress_queue.put(("status", f"📊 原字段：{original_columns}\n"))
+                self.progress_queue.put(("status", f"➕ 新增字段：{added_fields}（共{len(added_fields)}个）\n"))
+                self.progress_queue.put(("status", f"📁 输出文件：{output_file}\n"))
+                if self.resumed_rows:
+                    self.progress_queue.put(("status", f"⏯️ 断点续跑：恢复{self.resumed_rows}行，未重复请求API\n"))
+                self.progress_queue.put(("status", f"💾 检查点：追加{self.checkpoint.rows_written}行，写入{self.checkpoint.flush_count}次，"
+                                                   f"耗时{self.checkpoint.flush_time:.2f}秒；Excel导出耗时{self.save_time:.2f}秒\n"))
+                if self.row_latencies:
+                    p50, p99 = np.percentile(self.row_latencies, [50, 99])
+                    self.progress_queue.put(("status", f"⏱️ 行延迟：p50 {p50:.2f}秒，p99 {p99:.2f}秒\n"))
+                
+                if self.api_pool:
+                    requests_sent, connections, reused = self.api_pool.stats()
+                    reuse_rate = (reused / requests_sent * 100) if requests_sent > 0 else 0
+                    self.progress_queue.put(("status", f"🔗 连接复用：请求{requests_sent}次，新建连接{connections}个（其中断开后重连{self.api_pool.reconnect_count()}次），"
+                                                       f"复用率{reuse_rate:.1f}%\n"))
+                limiter_mode = "自适应并发" if self.limiter.adaptive else "固定并发"
+                self.progress_queue.put(("status", f"📈 {limiter_mode}：最终上限{self.limiter.current_limit}/{self.limiter.max_limit}，过载信号{self.limiter.overloads}次，重试{self.limiter.retries}次\n"))
+                if dedup_enabled:
+                    self.progress_queue.put(("status", f"♻️ 行内去重：避免{self.avoided_calls}行重复请求API\n"))
+                if self.output_format == "json":
+                    self.progress_queue.put(("status", f"🧾 JSON输出：校验失败定向重试{self.json_repairs}次\n"))
+                if self.rule_extractor:
+                    local_ratio = self.local_cells / max(self.total_rows * len(self.fields), 1)
+                    self.progress_queue.put(("status", f"🧩 规则预提取：{self.rule_rows}行跳过API，本地填充单元格占{local_ratio:.1%}\n"))
+                if self.stream_completions or self.output_budget:
+                    dropped = "（每次断开一个keep-alive连接，之后需重新建连）" if self.early_stops else ""
+                    self.progress_queue.put(("status", f"🌊 输出长度：流式提前结束{self.early_stops}次{dropped}，"
+                                                       f"截断后加大max_tokens重试{self.truncated_outputs}次，"
+                                                       f"单行max_tokens={self.output_max_tokens()}\n"))
+                if self.hedge:
+                    hedge_delay = f"{self.hedge.delay:.2f}秒" if self.hedge.delay is not None else "样本不足"
+                    abandoned = f"，落败的另一份{self.hedge.abandoned}次未能取消（仍占用线程和连接直到返回）" if self.hedge.abandoned else ""
+                    self.progress_queue.put(("status", f"🪁 请求对冲：发出{self.hedge.fired}次副本（阈值p{self.hedge.percentile:g}={hedge_delay}），"
+                                                       f"副本先返回{self.hedge.won}次{abandoned}\n"))
+                if self.result_cache:
+                    self.progress_queue.put(("status", self.result_cache.stats_line() + "\n"))
+                self.progress_queue.put(("status", self.profiler.summary_line() + "\n"))
+                if profile_enabled:
+                    self.profiler.write(json_profile, csv_profile, {
+                        "input_file": input_file, "output_file": output_file, "engine": engine,
+                        "concurrency": concurrency, "total_rows": self.total_rows, "completed_rows": self.completed_rows,
+                        "failed_rows": self.failed_rows, "elapsed_seconds": total_time,
+                    })
+                    self.progress_queue.put(("status", f"📁 性能剖析：{json_profile}\n"))
+                succeeded = not stopped
+        
+        except Exception as e:
+            error_msg = f"处理错误：{str(e)}\n{traceback.format_exc()}"
+            self.progress_queue.put(("status", f"\n❌ {error_msg}\n"))
+        finally:
+            # 出错时也要停止cProfile
+            if self.profiler.cprofile is not None:
+                self.profiler.cprofile.disable()
+                self.profiler.cprofile = None
+            if self.metrics_server:
+                self.metrics_server.stop()
+                self.metrics_server = None
+            if self.api_pool:
+                self.api_pool.close()
+                self.api_pool = None
+            if self.result_cache:
+                self.result_cache.close()
+                self.result_cache = None
+            if self.checkpoint:
+                self.checkpoint.close()
+                self.checkpoint = None
+            self.processing = False
+            if self.on_finished:
+                self.on_finished()
+        return succeeded
+    
+    def read_input_chunks(self, reader):
+        """读取线程：逐块解析输入放入队列，读完放入None，出错放入异常"""
+        try:
+            chunks = iter(reader)
+            while True:
+                with self.profiler.span("read_input"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if not self.put_input_chunk(chunk):
+                    return
+            self.put_input_chunk(None)
+        except Exception as e:
+            self.put_input_chunk(e)
+        finally:
+            reader.close()
+    
+    def put_input_chunk(self, item):
+        """队列满时等待调度循环取用，停止处理后放弃"""
+        while self.processing:
+            try:
+                self.chunk_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def pull_input_chunks(self, block, prompt_template, prompt_columns):
+        """取出已解析的分块追加到表格并生成任务，返回(任务列表, 是否已读完)"""
+        chunks = []
+        try:
+            chunks.append(self.chunk_queue.get(timeout=0.5) if block else self.chunk_queue.get_nowait())
+            while True:
+                chunks.append(self.chunk_queue.get_nowait())
+        except queue.Empty:
+            pass
+        for chunk in chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+        
+        packs = []
+        frames = [chunk for chunk in chunks if chunk is not None]
+        if frames:
+            new_rows = pd.concat(frames, ignore_index=True)
+            self.add_result_columns(new_rows)
+            start, stop = self.append_input_rows(new_rows)
+            self.total_rows = max(self.total_rows, stop)
+            with self.profiler.span("prepare_rows"):
+                packs = self.prepare_rows(start, stop, self.apply_resumed_records(start, stop), prompt_template, prompt_columns)
+        
+        finished = any(chunk is None for chunk in chunks)
+        if finished:
+            # 读完后截去预分配的空行，恢复导出时的列顺序
+            self.df = self.df.iloc[:self.loaded_rows][self.output_columns]
+            self.input_buffer = None
+            self.total_rows = len(self.df)
+            self.progress_queue.put(("status", f"📥 读取完成：共{self.total_rows}行，耗时{time.time() - self.read_started_at:.2f}秒\n"))
+        return packs, finished
+    
+    def append_input_rows(self, new_rows):
+        """把新分块写入预分配的表格，返回新行范围(start, stop)；容量不足时按倍数扩容，整表只复制对数次"""
+        start = self.loaded_rows
+        stop = start + len(new_rows)
+        input_columns = [col for col in self.output_columns if col not in self.fields]
+        # pandas写入多块表格中的object列会逐列复制整列，因此原始列由input_buffer承载，新行直接写入数组；
+        # 结果列保持string类型，写回只触及对应的行；表格不再共用input_buffer时（不应发生）同样重建
+        attached = self.input_buffer is not None and (not input_columns or np.may_share_memory(self.df[input_columns[0]].to_numpy(), self.input_buffer))
+        if stop > len(self.df) or not attached:
+            capacity = max(stop, 2 * len(self.df), self.estimated_rows)
+            buffer = np.empty((capacity, len(input_columns)), dtype=object)
+            buffer[:start] = self.df[input_columns].iloc[:start].to_numpy(dtype=object)
+            table = pd.DataFrame(buffer, columns=input_columns, dtype=object, copy=False)
+            for field in self.fields:
+                values = pd.array(np.full(capacity, "", dtype=object), dtype="string")
+                values[:start] = self.df[field].iloc[:start].astype("string").array
+                table[field] = values
+            self.df = table
+            self.input_buffer = buffer
+        self.input_buffer[start:stop] = new_rows[input_columns].to_numpy(dtype=object)
+        for field in self.fields:
+            self.df.iloc[start:stop, self.df.columns.get_loc(field)] = new_rows[field].astype("string").array
+        self.loaded_rows = stop
+        return start, stop
+    
+    def prepare_rows(self, start, stop, done_mask, prompt_template, prompt_columns):
+        """对[start, stop)范围的行去重、查缓存并分组，返回需要请求API的任务列表"""
+        self.resumed_rows += int(done_mask.sum())
+        pending_indices = (start + np.flatnonzero(~done_mask)).tolist()
+        attached_rows = 0
+        dedup_columns = key_columns(prompt_columns, self.rule_extractor)
+        
+        # 行内去重：相同数据只请求一次，结果分发到所有重复行
+        if self.dedup_enabled and pending_indices:
+            row_count = len(pending_indices)
+            pending_indices, attached_rows = self.group_duplicate_rows(dedup_columns, pending_indices)
+            if not self.streaming:
+                self.progress_queue.put(("status", f"♻️ 行内去重：{row_count}行归并为{len(pending_indices)}组不同数据\n"))
+        
+        # 规则预提取：规则填满全部字段的行直接写回，其余行只请求缺少的字段
+        if self.rule_extractor and pending_indices:
+            pending_indices = self.apply_rule_fields(pending_indices)
+        
+        # 序列化发送列（缓存键、打包和提示词共用）
+        self.row_texts.update(self.build_all_row_data(prompt_columns, pending_indices))
+        
+        # 结果缓存：命中的行直接写回，跳过网络请求；缓存的结果含规则填充的字段，键中加入规则读取的其他列
+        if self.result_cache:
+            key_texts = {idx: self.row_texts[idx] for idx in pending_indices}
+            rule_only_columns = dedup_columns[len(prompt_columns):]
+            if rule_only_columns:
+                for idx, text in self.build_all_row_data(rule_only_columns, pending_indices).items():
+                    key_texts[idx] += "\n" + text
+            rules = self.rule_extractor.signature() if self.rule_extractor else ""
+            cache_keys = {idx: ResultCache.make_key(prompt_template, key_texts[idx], self.output_format, rules) for idx in pending_indices}
+            uncached_indices = self.apply_cached_results(pending_indices, cache_keys)
+            if not self.streaming:
+                self.progress_queue.put(("status", f"🗄️ 缓存命中{len(pending_indices) - len(uncached_indices)}条，剩余{len(uncached_indices)}条需请求API\n"))
+            cached_indices = set(pending_indices).difference(uncached_indices)
+            self.cached_rows += sum(self.row_group_size(idx) for idx in cached_indices)
+            for idx in uncached_indices:
+                self.cache_keys[idx] = cache_keys[idx]
+            for idx in cached_indices:
+                self.row_texts.pop(idx, None)
+                self.local_fields.pop(idx, None)
+                self.request_fields.pop(idx, None)
+            pending_indices = uncached_indices
+        
+        queued_rows = sum(self.row_group_size(idx) for idx in pending_indices)
+        self.completed_rows += (stop - start) - attached_rows - queued_rows
+        self.avoided_calls += queued_rows - len(pending_indices)
+        self.queued_rows.update(pending_indices)
+        
+        # 构建任务分组（打包模式下每组包含多行，共用一次请求）
+        if self.pack_token_budget > 0:
+            # 需请求的字段相同的行才能打包在一起
+            groups = {}
+            for idx in pending_indices:
+                groups.setdefault(self.request_fields.get(idx), []).append(idx)
+            packs = [pack for group in groups.values()
+                     for pack in self.build_row_packs(group, self.row_texts, self.pack_token_budget, self.pack_max_rows)]
+            if not self.streaming:
+                self.progress_queue.put(("status", f"📦 打包模式：{len(pending_indices)}行合并为{len(packs)}个请求（Token预算={self.pack_token_budget}）\n"))
+        else:
+            packs = [[idx] for idx in pending_indices]
+        return packs
+    
+    def apply_rule_fields(self, indices):
+        """执行规则预提取：填满全部字段的行写回，部分填充的行记下已填充和需请求的字段，返回仍需请求API的行"""
+        extracted = self.rule_extractor.extract(self.df.iloc[indices])
+        filled_counts = extracted.notna().sum(axis=1).to_numpy()
+        remaining = []
+        full_rows = partial_rows = 0
+        for idx, count, record in zip(indices, filled_counts, extracted.to_dict("records")):
+            if count == 0:
+                remaining.append(idx)
+                continue
+            local = {field: value for field, value in record.items() if isinstance(value, str)}
+            self.local_cells += int(count) * self.row_group_size(idx)
+            if count == len(self.fields):
+                self.write_row_fields(idx, local)
+                self.rule_rows += self.row_group_size(idx)
+                full_rows += 1
+            else:
+                self.local_fields[idx] = local
+                self.request_fields[idx] = tuple(field for field in self.fields if field not in local)
+                remaining.append(idx)
+                partial_rows += 1
+        if not self.streaming:
+            self.progress_queue.put(("status", f"🧩 规则预提取：{full_rows}组数据由规则填满全部字段，{partial_rows}组只需请求缺少的字段\n"))
+        return remaining
+    
+    def process_packs_threaded(self, packs, api_key, prompt_template, max_workers, hedge_threads=0):
+        """线程引擎：滑动窗口调度，始终保持max_workers个任务在途，完成一个立即补充一个；hedge_threads为落败的对冲副本预留的线程数"""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers + hedge_threads, thread_name_prefix="cleaner-worker") as self.executor:
+            in_flight = {}
+            while self.processing and (packs or in_flight):
+                # 补满窗口；没有在途任务时等待读取线程产出新行
+                while self.processing and len(in_flight) < min(max_workers, self.limiter.current_limit):
+                    pack = packs.pop(block=not in_flight)
+                    if pack is None:
+                        break
+                    in_flight[self.submit_pack(pack, api_key, prompt_template)] = (pack, time.time())
+                    if self.hedge:
+                        self.hedge.tasks += 1
+                self.in_flight_requests = len(in_flight)
+                if not in_flight:
+                    continue
+                
+                done, _ = concurrent.futures.wait(
+                    list(in_flight), timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                
+                # 收集结果
+                finished_packs = []
+                for future in done:
+                    # 对冲的另一份已先返回
+                    if future not in in_flight:
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = e
+                    settled = self.settle_task(in_flight, future, result)
+                    if settled is None:
+                        continue
+                    pack, submitted_at = settled
+                    finished_packs.append(pack)
+                    self.row_latencies.extend([time.time() - submitted_at] * len(pack))
+                    try:
+                        if isinstance(result, Exception):
+                            raise result
+                        self.finish_pack(pack, result)
+                    except Exception as e:
+                        self.fail_pack(pack, f"处理错误：{str(e)}")
+                
+                # 超时的任务不再等待，腾出窗口位置
+                now = time.time()
+                for future, (pack, submitted_at) in list(in_flight.items()):
+                    if future in in_flight and now - submitted_at > self.task_timeout(pack):
+                        self.drop_task(in_flight, future)
+                        finished_packs.append(pack)
+                        self.fail_pack(pack, "处理超时")
+                
+                # 耗时过长的任务发出对冲副本
+                if self.hedge:
+                    self.hedge_stragglers(in_flight, lambda pack, submitted_at: self.submit_pack(pack, api_key, prompt_template))
+                
+                self.in_flight_requests = len(in_flight)
+                if finished_packs:
+                    self.record_progress(finished_packs)
+            
+            # 停止时取消尚未开始的任务
+            for future in in_flight:
+                future.cancel()
+    
+    async def process_packs_async(self, packs, api_key, prompt_template, concurrency, connect_timeout, read_timeout):
+        """异步引擎：单线程事件循环维持数百个在途请求，信号量限制并发"""
+        # 连接池上限与并发数一致，keep-alive复用连接
+        connector = aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        semaphore = asyncio.Semaphore(concurrency)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            
+            def submit(pack, timeout):
+                return asyncio.create_task(asyncio.wait_for(
+                    self.process_pack_async(session, semaphore, pack, api_key, prompt_template), timeout=timeout
+                ))
+            
+            in_flight = {}
+            while self.processing and (packs or in_flight):
+                # 补满窗口；没有在途任务时等待读取线程产出新行
+                while self.processing and len(in_flight) < min(concurrency, self.limiter.current_limit):
+                    pack = packs.pop(block=not in_flight)
+                    if pack is None:
+                        break
+                    in_flight[submit(pack, self.task_timeout(pack))] = (pack, time.time())
+                    if self.hedge:
+                        self.hedge.tasks += 1
+                self.in_flight_requests = len(in_flight)
+                if not in_flight:
+                    continue
+                
+                done, _ = await asyncio.wait(list(in_flight), timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+                
+                # 收集结果
+                finished_packs = []
+                for task in done:
+                    # 对冲的另一份已先返回
+                    if task not in in_flight:
+                        continue
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        result = e
+                    settled = self.settle_task(in_flight, task, result)
+                    if settled is None:
+                        continue
+                    pack, submitted_at = settled
+                    finished_packs.append(pack)
+                    self.row_latencies.extend([time.time() - submitted_at] * len(pack))
+                    try:
+                        if isinstance(result, Exception):
+                            raise result
+                        self.finish_pack(pack, result)
+                    except asyncio.TimeoutError:
+                        self.fail_pack(pack, "处理超时")
+                    except Exception as e:
+                        self.fail_pack(pack, f"处理错误：{str(e)}")
+                
+                # 耗时过长的任务发出对冲副本，与原任务共用截止时间
+                if self.hedge:
+                    self.hedge_stragglers(in_flight, lambda pack, submitted_at: submit(
+                        pack, max(1.0, self.task_timeout(pack) - (time.time() - submitted_at))
+                    ))
+                
+                self.in_flight_requests = len(in_flight)
+                if finished_packs:
+                    self.record_progress(finished_packs)
+            
+            # 停止时取消在途请求
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+    
+    def settle_task(self, in_flight, task, result):
+        """任务完成时处理对冲：结果有效时取消另一份；结果无效而另一份仍在途时继续等待，返回None"""
+        pack, submitted_at = in_flight.pop(task)
+        twin = self.hedge_twins.pop(task, None)
+        is_copy = task in self.hedge_copies
+        self.hedge_copies.discard(task)
+        if self.hedge:
+            self.hedge.record(time.time() - submitted_at)
+        if twin is None or twin not in in_flight:
+            return pack, submitted_at
+        self.hedge_twins.pop(twin, None)
+        if not self.valid_result(pack, result):
+            return None
+        self.hedge_copies.discard(twin)
+        in_flight.pop(twin)
+        if not twin.cancel():
+            self.hedge.abandoned += 1
+        if is_copy:
+            self.hedge.won += 1
+        return pack, submitted_at
+    
+    def drop_task(self, in_flight, task):
+        """放弃一个任务及其对冲的另一份"""
+        for item in (task, self.hedge_twins.pop(task, None)):
+            if item is not None and item in in_flight:
+                in_flight.pop(item)
+                self.hedge_twins.pop(item, None)
+                self.hedge_copies.discard(item)
+                item.cancel()
+    
+    def hedge_stragglers(self, in_flight, submit):
+        """为耗时超过对冲阈值的任务再发一份，副本与原任务共用提交时间；submit(任务, 提交时间)返回新任务"""
+        now = time.time()
+        for task, (pack, submitted_at) in list(in_flight.items()):
+            if task in self.hedge_twins or not self.hedge.should_hedge(now - submitted_at):
+                continue
+            copy = submit(pack, submitted_at)
+            in_flight[copy] = (pack, submitted_at)
+            self.hedge_twins[task] = copy
+            self.hedge_twins[copy] = task
+            self.hedge_copies.add(copy)
+            self.hedge.fired += 1
+    
+    def valid_result(self, pack, result):
+        """任务结果是否有效：每行都提取到了字段"""
+        if isinstance(result, Exception):
+            return False
+        if len(pack) == 1:
+            return isinstance(result, dict) and bool(result)
+        return isinstance(result, dict) and all(result.get(idx) for idx in pack)
+    
+    def task_timeout(self, pack):
+        """任务超时：每行30秒，并为重试预留时间"""
+        return 30 * len(pack) * (self.max_retries + 1)
+    
+    def report_rate(self):
+        """每秒刷新一次并发上限和最近10秒吞吐"""
+        now = time.time()
+        self.throughput_samples.append((now, self.completed_rows))
+        while len(self.throughput_samples) > 2 and now - self.throughput_samples[0][0] > 10:
+            self.throughput_samples.popleft()
+        if now - self.last_rate_update < 1.0:
+            return
+        self.last_rate_update = now
+        start_at, start_rows = self.throughput_samples[0]
+        rows_per_second = (self.completed_rows - start_rows) / max(now - start_at, 1e-6)
+        self.progress_queue.put(("rate", (
+            f"并发上限: {self.limiter.current_limit}/{self.limiter.max_limit}    "
+            f"吞吐: {rows_per_second:.1f}行/秒    重试: {self.limiter.retries}次"
+        )))
+    
+    def finish_pack(self, pack, result):
+        """写回一个任务的结果并写入缓存"""
+        for idx in pack:
+            row_result = result if len(pack) == 1 else result.get(idx)
+            # 合并规则已填充的字段（模型多输出的同名字段以规则为准）
+            local = self.local_fields.pop(idx, None)
+            self.request_fields.pop(idx, None)
+            if local and isinstance(row_result, dict) and row_result:
+                row_result = dict(row_result, **local)
+            with self.profiler.span("write_back"):
+                self.apply_row_result(idx, row_result)
+            self.queued_rows.discard(idx)
+            row_text = self.row_texts.pop(idx, None)
+            cache_key = self.cache_keys.pop(idx, None)
+            if self.result_cache and isinstance(row_result, dict) and row_result:
+                request_size = self.prompt_size + len(row_text.encode("utf-8"))
+                self.result_cache.put(cache_key, row_result, request_size)
+    
+    def fail_pack(self, pack, message):
+        """报告一个任务失败"""
+        for idx in pack:
+            self.progress_queue.put(("status", f"❌ 行 {idx+1} {message}\n"))
+            self.failed_rows += self.row_group_size(idx)
+            self.queued_rows.discard(idx)
+            self.row_texts.pop(idx, None)
+            self.cache_keys.pop(idx, None)
+            self.local_fields.pop(idx, None)
+            self.request_fields.pop(idx, None)
+    
+    def record_progress(self, finished_packs):
+        """更新进度，按检查点间隔追加写入新完成的行"""
+        self.finished_tasks += len(finished_packs)
+        self.completed_rows += sum(self.row_group_size(idx) for pack in finished_packs for idx in pack)
+        progress = min(self.completed_rows / max(self.total_rows, 1) * 100, 100)
+        self.progress_queue.put(("progress", progress))
+        self.report_rate()
+        
+        if self.checkpoint.due():
+            with self.profiler.span("flush_rows"):
+                self.flush_row_writes()
+            with self.profiler.span("checkpoint"):
+                if self.result_cache:
+                    self.result_cache.commit()
+                written = self.checkpoint.flush()
+            if written:
+                self.progress_queue.put(("status", f"💾 已完成{self.completed_rows}/{self.total_rows}行，检查点追加{written}行\n"))
+    
+    def apply_row_result(self, idx, result):
+        """将单行结果写回DataFrame"""
+        if result:
+            if isinstance(result, dict):
+                self.progress_queue.put(("status", f"   行 {idx+1}: 成功提取 {len(result)} 个字段\n"))
+                self.write_row_fields(idx, result)
+            else:
+                self.progress_queue.put(("status", f"   行 {idx+1}: 提取结果格式错误\n"))
+                self.failed_rows += self.row_group_size(idx)
+        else:
+            self.progress_queue.put(("status", f"   行 {idx+1}: 未提取到任何字段\n"))
+            self.failed_rows += self.row_group_size(idx)
+    
+    def build_row_data(self, row, columns):
+        """将单行数据序列化为提示词文本"""
+        return "\n".join([f"{col}: {row[col]}" for col in columns])
+    
+    def build_all_row_data(self, columns, indices):
+        """批量序列化指定行的发送列，与build_row_data格式一致，返回{行索引: 文本}"""
+        return dict(zip(indices, serialize_rows(self.df[columns].iloc[indices], columns)))
+    
+    def add_result_columns(self, df):
+        """添加结果列，预先分配为字符串类型（输入中已有的同名列保持不变）"""
+        for field in self.fields:
+            if field not in df.columns:
+                df[field] = pd.Series("", index=df.index, dtype="string")
+    
+    def write_row_fields(self, idx, fields):
+        """缓冲单行字段（并分发到该行的所有重复行），由flush_row_writes批量写入表格"""
+        target_indices = [idx] + self.duplicate_groups.get(idx, [])
+        with self.write_lock:
+            for field, value in fields.items():
+                buffer = self.field_buffers.get(field)
+                if buffer is not None:
+                    buffer[0].extend(target_indices)
+                    buffer[1].extend([value] * len(target_indices))
+        if self.checkpoint:
+            self.checkpoint.add(target_indices, fields)
+    
+    def flush_row_writes(self):
+        """把缓冲的结果按列一次性写入表格"""
+        with self.write_lock:
+            buffers = self.field_buffers
+            self.field_buffers = {field: ([], []) for field in buffers}
+        for field, (positions, values) in buffers.items():
+            if positions:
+                self.df.iloc[positions, self.df.columns.get_loc(field)] = values
+    
+    def row_group_size(self, idx):
+        """代表行及其重复行的总行数"""
+        return 1 + len(self.duplicate_groups.get(idx, ()))
+    
+    def row_fields(self, idx):
+        """读取单行已写回的字段"""
+        row = self.df.iloc[idx]
+        return {field: row[field] for field in self.fields if isinstance(row[field], str) and row[field]}
+    
+    def group_duplicate_rows(self, columns, indices):
+        """按发送列内容哈希对指定行分组，重复行记入duplicate_groups，返回(代表行索引, 并入在途代表行的行数)"""
+        indices = np.asarray(indices)
+        row_hashes = pd.util.hash_pandas_object(self.df[columns].iloc[indices], index=False).to_numpy()
+        codes, _ = pd.factorize(row_hashes)
+        # factorize按首次出现顺序编号，因此各组首行位置递增
+        _, first_positions = np.unique(codes, return_index=True)
+        first_of_row = first_positions[codes]
+        duplicate_mask = first_of_row != np.arange(len(codes))
+        representatives = indices[first_positions].tolist()
+        batch_groups = {}
+        if duplicate_mask.any():
+            duplicates = pd.Series(indices[duplicate_mask])
+            batch_groups = duplicates.groupby(indices[first_of_row[duplicate_mask]]).agg(list).to_dict()
+        if not self.streaming:
+            self.duplicate_groups.update(batch_groups)
+            return representatives, 0
+        
+        # 流式读取时还要与之前分块中的相同数据合并；先写入缓冲的结果，row_fields才能读到
+        self.flush_row_writes()
+        new_representatives = []
+        attached_rows = 0
+        for idx, row_hash in zip(representatives, row_hashes[first_positions].tolist()):
+            group = batch_groups.get(idx, [])
+            owner = self.row_owners.get(row_hash)
+            if owner in self.queued_rows:
+                # 代表行仍在请求中，完成时一并写回
+                self.duplicate_groups.setdefault(owner, []).extend([idx] + group)
+                attached_rows += 1 + len(group)
+                self.avoided_calls += 1 + len(group)
+                continue
+            if group:
+                self.duplicate_groups[idx] = group
+            owner_fields = self.row_fields(owner) if owner is not None else {}
+            if owner_fields:
+                # 代表行已有结果，直接复制
+                self.write_row_fields(idx, owner_fields)
+                self.avoided_calls += 1 + len(group)
+                continue
+            self.row_owners[row_hash] = idx
+            new_representatives.append(idx)
+        return new_representatives, attached_rows
+    
+    def load_resumed_records(self, records):
+        """把检查点记录展开为按行号排序的(行索引, 字段字典)，供各批次按范围写回"""
+        rows = []
+        row_fields = []
+        for record_rows, fields in records:
+            rows.extend(record_rows)
+            row_fields.extend([fields] * len(record_rows))
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind="stable")
+        self.resume_rows = rows[order]
+        self.resume_fields = [row_fields[i] for i in order]
+    
+    def apply_resumed_records(self, start, stop):
+        """把检查点中[start, stop)范围的结果按列批量写回，返回这些行是否已完成的布尔掩码"""
+        done_mask = np.zeros(stop - start, dtype=bool)
+        lo, hi = np.searchsorted(self.resume_rows, [start, stop])
+        if lo == hi:
+            return done_mask
+        rows = self.resume_rows[lo:hi]
+        done_mask[rows - start] = True
+        field_positions = {field: ([], []) for field in self.fields}
+        for idx, fields in zip(rows.tolist(), self.resume_fields[lo:hi]):
+            for field, value in fields.items():
+                if field in field_positions:
+                    field_positions[field][0].append(idx)
+                    field_positions[field][1].append(value)
+        for field, (positions, values) in field_positions.items():
+            if positions:
+                self.df.iloc[positions, self.df.columns.get_loc(field)] = values
+        return done_mask
+    
+    def resume_from_output(self, output_file, original_columns):
+        """从已有输出文件恢复：原始列与输入一致时，目标列非空的行视为已完成"""
+        done_mask = np.zeros(len(self.df), dtype=bool)
+        try:
+            existing = read_table(output_file)
+        except Exception:
+            return done_mask
+        if len(existing) != len(self.df) or any(col not in existing.columns for col in original_columns + self.fields):
+            return done_mask
+        existing_original = existing[original_columns].fillna("").astype(str).to_numpy()
+        current_original = self.df[original_columns].fillna("").astype(str).to_numpy()
+        if not (existing_original == current_original).all():
+            return done_mask
+        
+        existing_fields = existing[self.fields].fillna("").astype(str)
+        done_mask = (existing_fields != "").any(axis=1).to_numpy()
+        positions = np.flatnonzero(done_mask)
+        for field in self.fields:
+            self.df.iloc[positions, self.df.columns.get_loc(field)] = existing_fields[field].to_numpy()[positions]
+        # 恢复的行写入新检查点，再次中断时无需重新读取输出文件
+        for idx in positions:
+            self.checkpoint.add([idx], existing_fields.iloc[idx].to_dict())
+        return done_mask
+    
+    def apply_cached_results(self, indices, cache_keys):
+        """写回缓存命中的行，返回仍需请求API的行索引"""
+        cached = self.result_cache.get_many([cache_keys[idx] for idx in indices])
+        pending_indices = []
+        for idx in indices:
+            fields = cached.get(cache_keys[idx])
+            if fields:
+                self.write_row_fields(idx, fields)
+            else:
+                pending_indices.append(idx)
+        return pending_indices
+    
+    def build_row_packs(self, indices, row_texts, token_budget, max_rows):
+        """按Token预算将待处理的行分组，每组共用一次请求"""
+        packs = []
+        current_pack = []
+        current_tokens = 0
+        for idx in indices:
+            row_tokens = estimate_tokens(row_texts[idx])
+            if current_pack and (current_tokens + row_tokens > token_budget or len(current_pack) >= max_rows):
+                packs.append(current_pack)
+                current_pack = []
+                current_tokens = 0
+            current_pack.append(idx)
+            current_tokens += row_tokens
+        if current_pack:
+            packs.append(current_pack)
+        return packs
+    
+    def parse_ai_result(self, result):
+        """解析"字段名:值"格式的输出"""
+        field_values = {}
+        lines = result.strip().split('\n')
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            
+            if ':' in line:
+                field, value = line.split(':', 1)
+            elif '：' in line:
+                field, value = line.split('：', 1)
+            else:
+                continue
+            
+            field = field.strip()
+            cleaned_field = self.clean_field_name(field)
+            value = value.strip()
+            
+            if cleaned_field in self.fields:
+                field_values[cleaned_field] = value
+        
+        return field_values
+    
+    def load_json_object(self, result):
+        """解析模型输出中的JSON对象，容忍代码块标记和前后的说明文字"""
+        start = result.find("{")
+        end = result.rfind("}")
+        if start < 0 or end < start:
+            raise ValueError("输出中没有JSON对象")
+        try:
+            data = json.loads(result[start:end + 1])
+        except ValueError as e:
+            raise ValueError(f"JSON解析失败：{e}")
+        if not isinstance(data, dict):
+            raise ValueError("输出不是JSON对象")
+        return data
+    
+    def validate_json_fields(self, data, fields=None):
+        """按字段校验JSON对象：所有字段（默认为全部提取字段）必须存在，值为字符串（数字、空值和字符串列表会被转换）"""
+        fields = fields or self.fields
+        if not isinstance(data, dict):
+            raise ValueError("字段结果不是JSON对象")
+        missing = [field for field in fields if field not in data]
+        if missing:
+            raise ValueError(f"缺少字段{missing}")
+        field_values = {}
+        for field in fields:
+            value = data[field]
+            if value is None:
+                value = ""
+            elif isinstance(value, list) and all(isinstance(item, (str, int, float)) for item in value):
+                value = "、".join(str(item) for item in value)
+            elif isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                value = str(value)
+            else:
+                raise ValueError(f"字段{field}的值不是字符串")
+            field_values[field] = value.strip()
+        return field_values
+    
+    def parse_row_result(self, result, fields=None):
+        """解析单行输出：JSON模式下校验失败时抛出ValueError"""
+        if self.output_format == "json":
+            return self.validate_json_fields(self.load_json_object(result), fields)
+        return self.parse_ai_result(result)
+    
+    def parse_packed_json_result(self, result, indices, fields=None):
+        """解析打包请求的JSON输出（键为行号），返回{行索引: 字段字典}，仅保留通过校验的行"""
+        data = self.load_json_object(result)
+        wanted = set(indices)
+        results = {}
+        for key, value in data.items():
+            match = re.search(r'\d+', str(key))
+            if not match:
+                continue
+            idx = int(match.group()) - 1
+            if idx not in wanted or idx in results:
+                continue
+            try:
+                results[idx] = self.validate_json_fields(value, fields)
+            except ValueError:
+                continue
+        return results
+    
+    def parse_packed_result(self, result, indices, fields=None):
+        """按行号标记拆分打包输出，返回{行索引: 字段字典}，仅保留字段完整的行"""
+        if self.output_format == "json":
+            return self.parse_packed_json_result(result, indices, fields)
+        parts = PACK_MARKER_PATTERN.split(result)
+        wanted = set(indices)
+        results = {}
+        # split结果形如 [前缀, 行号1, 内容1, 行号2, 内容2, ...]
+        for i in range(1, len(parts) - 1, 2):
+            idx = int(parts[i]) - 1
+            if idx not in wanted or idx in results:
+                continue
+            field_values = self.parse_ai_result(parts[i + 1])
+            if all(field in field_values for field in fields or self.fields):
+                results[idx] = field_values
+        return results
+    
+    def submit_pack(self, pack, api_key, prompt_template):
+        """提交一个任务：单行或打包的多行（行数据取自预先序列化的文本，只请求规则未填充的字段）"""
+        fields = self.request_fields.get(pack[0])
+        if len(pack) == 1:
+            return self.executor.submit(
+                self.process_single_row,
+                pack[0], self.row_texts[pack[0]], api_key, prompt_template, fields
+            )
+        return self.executor.submit(
+            self.process_packed_rows,
+            [(idx, self.row_texts[idx]) for idx in pack], api_key, prompt_template, fields
+        )
+    
+    def build_single_prompt(self, row_data, prompt_template, fields=None):
+        """构建单行请求的提示词；fields为只需输出的部分字段"""
+        prompt_template = self.field_subset_prompt(prompt_template, fields)
+        if self.output_format == "json":
+            return (prompt_template + JSON_INSTRUCTION.format(schema=self.json_schema_example(fields))
+                    + "\n当前数据：\n" + row_data + "\n请严格按照要求输出JSON：")
+        return prompt_template + "\n当前数据：\n" + row_data + "\n请严格按照要求输出结果："
+    
+    def build_packed_prompt(self, rows, prompt_template, fields=None):
+        """构建打包请求的提示词，rows为[(行索引, 行数据文本)]，返回(提示词, max_tokens)"""
+        prompt_template = self.field_subset_prompt(prompt_template, fields)
+        rows_text = "\n".join([f"【行{idx+1}】\n{row_data}" for idx, row_data in rows])
+        if self.output_format == "json":
+            current_prompt = (prompt_template + PACK_JSON_INSTRUCTION.format(count=len(rows), schema=self.json_schema_example(fields))
+                              + "\n当前数据：\n" + rows_text + "\n请严格按照要求输出JSON：")
+        else:
+            current_prompt = (prompt_template + PACK_INSTRUCTION.format(count=len(rows))
+                              + "\n当前数据：\n" + rows_text + "\n请严格按照要求逐条输出结果：")
+        return current_prompt, self.output_max_tokens(len(rows))
+    
+    def output_max_tokens(self, rows=1):
+        """请求的max_tokens：自适应时按观测的每行输出长度计算，否则单行500、打包按行数和字段数估算"""
+        if self.output_budget:
+            return self.output_budget.max_tokens(rows)
+        if rows == 1:
+            return 500
+        return min(MAX_OUTPUT_TOKENS, max(500, rows * (len(self.fields) * 30 + 10)))
+    
+    def field_subset_prompt(self, prompt_template, fields):
+        """只请求部分字段时在提示词后注明需要输出的字段"""
+        if not fields:
+            return prompt_template
+        return prompt_template + FIELD_SUBSET_INSTRUCTION.format(fields="、".join(fields))
+    
+    def json_schema_example(self, fields=None):
+        """JSON输出的字段示例"""
+        return json.dumps({field: "" for field in fields or self.fields}, ensure_ascii=False)
+    
+    def repair_prompt(self, idx, prompt, error):
+        """JSON校验失败：记录并在原提示词后附上失败原因，用于定向重试"""
+        with self.stats_lock:
+            self.json_repairs += 1
+        self.progress_queue.put(("status", f"🔁 行 {idx+1} 输出未通过校验（{error}），定向重试\n"))
+        return prompt + JSON_REPAIR_INSTRUCTION.format(error=error)
+    
+    def process_single_row(self, idx, row_data, api_key, prompt_template, fields=None):
+        """处理单行数据"""
+        try:
+            with self.profiler.span("build_prompt"):
+                current_prompt = self.build_single_prompt(row_data, prompt_template, fields)
+            
+            # JSON模式下校验失败的行带上失败原因重试
+            retries = self.json_retries if self.output_format == "json" else 0
+            for attempt in range(retries + 1):
+                result = self.call_ai_api(api_key, current_prompt, max_tokens=self.output_max_tokens(), fields=fields)
+                with self.profiler.span("parse"):
+                    try:
+                        return self.parse_row_result(result, fields)
+                    except ValueError as e:
+                        error = str(e)
+                if attempt == retries or not self.processing:
+                    break
+                current_prompt = self.repair_prompt(idx, current_prompt, error)
+            self.progress_queue.put(("status", f"❌ 行 {idx+1} 输出未通过校验：{error}\n"))
+            return {}
+        
+        except Exception as e:
+            self.progress_queue.put(("status", f"❌ 行 {idx+1} API错误：{str(e)}\n"))
+            return {}
+    
+    def process_packed_rows(self, rows, api_key, prompt_template, fields=None):
+        """多行打包为一次请求处理，缺失或格式错误的行单独重试"""
+        indices = [idx for idx, _ in rows]
+        results = {}
+        try:
+            with self.profiler.span("build_prompt"):
+                current_prompt, max_tokens = self.build_packed_prompt(rows, prompt_template, fields)
+            result = self.call_ai_api(api_key, current_prompt, max_tokens=max_tokens, rows=len(rows), fields=fields)
+            with self.profiler.span("parse"):
+                results = self.parse_packed_result(result, indices, fields)
+        except Exception as e:
+            self.progress_queue.put(("status", f"❌ 行 {indices[0]+1}-{indices[-1]+1} 打包请求API错误：{str(e)}\n"))
+        
+        # 缺失或格式错误的行单独重试
+        missing = [(idx, row_data) for idx, row_data in rows if idx not in results]
+        if missing:
+            self.progress_queue.put(("status", f"🔁 打包结果缺失{len(missing)}行，逐行重试\n"))
+            for idx, row_data in missing:
+                if not self.processing:
+                    break
+                results[idx] = self.process_single_row(idx, row_data, api_key, prompt_template, fields)
+        return results
+    
+    async def process_pack_async(self, session, semaphore, pack, api_key, prompt_template):
+        """异步处理一个任务，返回值与process_single_row/process_packed_rows一致"""
+        rows = [(idx, self.row_texts[idx]) for idx in pack]
+        fields = self.request_fields.get(pack[0])
+        if len(rows) == 1:
+            idx, row_data = rows[0]
+            return await self.process_single_row_async(session, semaphore, idx, row_data, api_key, prompt_template, fields)
+        
+        indices = [idx for idx, _ in rows]
+        results = {}
+        try:
+            with self.profiler.span("build_prompt"):
+                current_prompt, max_tokens = self.build_packed_prompt(rows, prompt_template, fields)
+            result = await self.call_ai_api_async(session, semaphore, api_key, current_prompt, max_tokens=max_tokens,
+                                                  rows=len(rows), fields=fields)
+            with self.profiler.span("parse"):
+                results = self.parse_packed_result(result, indices, fields)
+        except Exception as e:
+            self.progress_queue.put(("status", f"❌ 行 {indices[0]+1}-{indices[-1]+1} 打包请求API错误：{str(e)}\n"))
+        
+        # 缺失或格式错误的行单独重试
+        missing = [(idx, row_data) for idx, row_data in rows if idx not in results]
+        if missing:
+            self.progress_queue.put(("status", f"🔁 打包结果缺失{len(missing)}行，逐行重试\n"))
+            for idx, row_data in missing:
+                if not self.processing:
+                    break
+                results[idx] = await self.process_single_row_async(
+                    session, semaphore, idx, row_data, api_key, prompt_template, fields
+                )
+        return results
+    
+    async def process_single_row_async(self, session, semaphore, idx, row_data, api_key, prompt_template, fields=None):
+        """异步处理单行数据"""
+        try:
+            with self.profiler.span("build_prompt"):
+                current_prompt = self.build_single_prompt(row_data, prompt_template, fields)
+            retries = self.json_retries if self.output_format == "json" else 0
+            for attempt in range(retries + 1):
+                result = await self.call_ai_api_async(session, semaphore, api_key, current_prompt,
+                                                      max_tokens=self.output_max_tokens(), fields=fields)
+                with self.profiler.span("parse"):
+                    try:
+                        return self.parse_row_result(result, fields)
+                    except ValueError as e:
+                        error = str(e)
+                if attempt == retries or not self.processing:
+                    break
+                current_prompt = self.repair_prompt(idx, current_prompt, error)
+            self.progress_queue.put(("status", f"❌ 行 {idx+1} 输出未通过校验：{error}\n"))
+            return {}
+        except Exception as e:
+            self.progress_queue.put(("status", f"❌ 行 {idx+1} API错误：{str(e)}\n"))
+            return {}
+    
+    def build_api_request(self, api_key, prompt, max_tokens=500):
+        """构建API请求，返回(url, headers, payload)"""
+        url = self.api_url
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        }
+        payload = {
+            "model": "deepseek-chat",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.1,
+            "max_tokens": max_tokens,
+            "stream": self.stream_completions
+        }
+        # 流式输出时在最后一个事件中返回usage
+        if self.stream_completions:
+            payload["stream_options"] = {"include_usage": True}
+        # JSON模式：要求接口返回合法的JSON对象
+        if self.output_format == "json":
+            payload["response_format"] = {"type": "json_object"}
+        return url, headers, payload
+    
+    def should_retry(self, attempt):
+        """记录一次过载信号，判断是否还能重试"""
+        if self.limiter:
+            self.limiter.on_overload()
+        if attempt >= self.max_retries or not self.processing:
+            return False
+        if self.limiter:
+            self.limiter.on_retry()
+        return True
+    
+    def call_ai_api(self, api_key, prompt, max_tokens=500, rows=1, fields=None):
+        """调用API（限流、服务端错误和超时按Retry-After或指数退避重试；输出被max_tokens截断时加倍上限重试）；
+        fields为本次请求的字段（规则已填充部分字段时只请求其余字段），流式输出据此判断是否到齐"""
+        url, headers, payload = self.build_api_request(api_key, prompt, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            started_at = time.time()
+            retry_after = None
+            try:
+                with self.profiler.span("api_wait"):
+                    if self.api_pool:
+                        response = self.api_pool.post(url, headers=headers, json=payload, stream=self.stream_completions)
+                    else:
+                        response = requests.post(url, headers=headers, json=payload, timeout=30, stream=self.stream_completions)
+                    if response.status_code in RETRYABLE_STATUS and self.should_retry(attempt):
+                        retry_after = response.headers.get("Retry-After", "")
+                        response.close()
+                    else:
+                        response.raise_for_status()
+                        content, usage, finish_reason = self.read_response(response, prompt, rows, fields)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+                if not self.should_retry(attempt):
+                    raise
+                retry_after = ""
+            
+            if retry_after is not None:
+                with self.profiler.span("backoff"):
+                    time.sleep(backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+                continue
+            if self.limiter:
+                self.limiter.on_success(time.time() - started_at)
+            if self.finish_response(payload, content, usage, finish_reason, rows, attempt):
+                return content.strip()
+    
+    async def call_ai_api_async(self, session, semaphore, api_key, prompt, max_tokens=500, rows=1, fields=None):
+        """异步调用API（重试策略与call_ai_api一致）"""
+        url, headers, payload = self.build_api_request(api_key, prompt, max_tokens)
+        for attempt in range(self.max_retries + 1):
+            started_at = time.time()
+            retry_after = None
+            try:
+                async with semaphore:
+                    with self.profiler.span("api_wait"):
+                        async with session.post(url, headers=headers, json=payload) as response:
+                            if response.status in RETRYABLE_STATUS and self.should_retry(attempt):
+                                retry_after = response.headers.get("Retry-After", "")
+                                # 读完错误响应体，连接才会放回连接池复用，否则aiohttp会关闭该连接
+                                await response.read()
+                            else:
+                                response.raise_for_status()
+                                content, usage, finish_reason = await self.read_response_async(response, prompt, rows, fields)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError):
+                if not self.should_retry(attempt):
+                    raise
+                retry_after = ""
+            
+            if retry_after is None:
+                if self.limiter:
+                    self.limiter.on_success(time.time() - started_at)
+                if self.finish_response(payload, content, usage, finish_reason, rows, attempt):
+                    return content.strip()
+                continue
+            with self.profiler.span("backoff"):
+                await asyncio.sleep(backoff_delay(attempt, retry_after, self.backoff_base, self.backoff_max))
+    
+    def finish_response(self, payload, content, usage, finish_reason, rows, attempt):
+        """记录用量和输出长度；输出被max_tokens截断且还能重试时加倍上限并返回False"""
+        self.profiler.add_usage(usage)
+        if finish_reason == "length" and payload["max_tokens"] < MAX_OUTPUT_TOKENS and attempt < self.max_retries and self.processing:
+            with self.stats_lock:
+                self.truncated_outputs += 1
+            payload["max_tokens"] = min(MAX_OUTPUT_TOKENS, payload["max_tokens"] * 2)
+            return False
+        if self.output_budget and finish_reason != "length":
+            self.output_budget.observe(int((usage or {}).get("completion_tokens") or estimate_tokens(content)), rows)
+        return True
+    
+    def read_response(self, response, prompt, rows, fields=None):
+        """读取响应，返回(内容, usage, 结束原因)；流式响应在字段全部到达后提前断开（该连接不再复用）"""
+        if "text/event-stream" not in response.headers.get("Content-Type", ""):
+            data = response.json()
+            choice = data["choices"][0]
+            return choice["message"]["content"], data.get("usage"), choice.get("finish_reason")
+        response.encoding = "utf-8"
+        stream = StreamedCompletion()
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if self.stream_event(stream, line, rows, fields):
+                    break
+        finally:
+            response.close()
+        return stream.content, self.stream_usage(stream, prompt), stream.finish_reason
+    
+    async def read_response_async(self, response, prompt, rows, fields=None):
+        """异步读取响应，与read_response一致"""
+        if "text/event-stream" not in response.headers.get("Content-Type", ""):
+            data = await response.json(content_type=None)
+            choice = data["choices"][0]
+            return choice["message"]["content"], data.get("usage"), choice.get("finish_reason")
+        stream = StreamedCompletion()
+        async for line in response.content:
+            if self.stream_event(stream, line.decode("utf-8"), rows, fields):
+                response.close()
+                break
+        return stream.content, self.stream_usage(stream, prompt), stream.finish_reason
+    
+    def stream_event(self, stream, line, rows, fields=None):
+        """处理一行SSE，字段已全部到达时返回True（调用方断开连接，不再为后续输出计费）"""
+        text = stream.feed(line)
+        # JSON模式由接口保证只输出JSON对象，对象闭合即结束，无需提前断开；文本模式只在换行后检查
+        if text and self.output_format != "json" and "\n" in text and self.stream_complete(stream.content, rows, fields):
+            stream.stopped_early = True
+            with self.stats_lock:
+                self.early_stops += 1
+            return True
+        return False
+    
+    def stream_complete(self, content, rows=1, fields=None):
+        """流式输出是否已包含本次请求的全部字段（默认为全部字段）：每条结果的字段行都已换行结束"""
+        complete = content[:content.rfind("\n") + 1]
+        expected = set(fields or self.fields)
+        if rows == 1:
+            return expected <= self.parse_ai_result(complete).keys()
+        # split结果形如 [前缀, 行号1, 内容1, 行号2, 内容2, ...]
+        blocks = PACK_MARKER_PATTERN.split(complete)[2::2]
+        return sum(expected <= self.parse_ai_result(block).keys() for block in blocks) >= rows
+    
+    def stream_usage(self, stream, prompt):
+        """流式响应的usage；提前断开时没有usage，按估算计入"""
+        if stream.usage:
+            return stream.usage
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(stream.content)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
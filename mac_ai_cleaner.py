@@ -1,16 +1,22 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
-import requests
 import threading
 import configparser
+import json
 import os
 import sys
 import traceback
-import time
-import re
-import concurrent.futures
 import queue
+import time
+# 只导入轻量的配置模块；cleaner_engine（pandas、requests等）在窗口显示后由后台线程加载
+from cleaner_config import default_config, extract_fields
+# 界面刷新间隔（毫秒）和每帧最多处理的消息数
+UI_FRAME_MS = 100
+UI_MAX_MESSAGES_PER_FRAME = 20000
+# 状态栏最多保留的日志行数，超出后丢弃最早的行
+STATUS_MAX_LINES = 2000
+# 启动探针：设置该环境变量为文件路径时，记录启动各阶段的时间戳后退出（用于测量打包后的启动耗时）
+STARTUP_PROBE_ENV = "AI_CLEANER_STARTUP_PROBE"
 # PyInstaller兼容处理
 def resource_path(relative_path):
     """获取资源路径，兼容PyInstaller打包"""
@@ -19,6 +25,74 @@ def resource_path(relative_path):
     except Exception:
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
+class ProgressDigest:
+    """合并一帧内的进度消息：逐行结果只计数，其余日志合并为一次插入"""
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """新一轮处理开始时清零计数"""
+        self.rows_succeeded = 0
+        self.rows_empty = 0
+    
+    def drain(self, progress_queue, max_messages=UI_MAX_MESSAGES_PER_FRAME):
+        """取出队列中已有的消息，返回(日志文本, 最新进度, 最新吞吐, 是否处理结束)，没有对应消息时为None"""
+        log_parts = []
+        progress = None
+        rate = None
+        finished = False
+        for _ in range(max_messages):
+            try:
+                msg_type, content = progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if msg_type == "status":
+                # 逐行结果（"   行 N: ..."）只计数，不逐条显示
+                if content.startswith("   行"):
+                    if "成功提取" in content:
+                        self.rows_succeeded += 1
+                    else:
+                        self.rows_empty += 1
+                else:
+                    log_parts.append(content)
+            elif msg_type == "progress":
+                progress = content
+            elif msg_type == "rate":
+                rate = content
+            elif msg_type == "finished":
+                finished = True
+        return "".join(log_parts), progress, rate, finished
+    
+    def summary(self):
+        """逐行结果的汇总计数"""
+        return f"逐行结果：成功 {self.rows_succeeded} 行，未提取或格式错误 {self.rows_empty} 行"
+class EngineLoader:
+    """在后台线程中预热清洗引擎模块，首次使用时若仍在加载则等待加载完成"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.module = None
+        self.load_seconds = None
+    
+    def load(self):
+        """导入cleaner_engine并返回模块，已加载时直接返回"""
+        with self.lock:
+            if self.module is None:
+                start = time.perf_counter()
+                import cleaner_engine
+                self.load_seconds = time.perf_counter() - start
+                self.module = cleaner_engine
+        return self.module
+    
+    def warm_up(self, progress_queue):
+        """后台预热，完成或失败后通过状态栏提示"""
+        def run():
+            try:
+                self.load()
+                progress_queue.put(("status", f"✅ 数据处理模块已就绪（{self.load_seconds:.2f}秒）\n"))
+            except Exception as e:
+                progress_queue.put(("status", f"❌ 数据处理模块加载失败：{str(e)}\n"))
+        
+        threading.Thread(target=run, daemon=True).start()
 class MacAICleaner:
     def __init__(self, root):
         self.root = root
@@ -39,23 +113,29 @@ class MacAICleaner:
         
         self.input_file = ""
         self.output_file = ""
-        self.processing = False
-        self.df = None
-        self.fields = []
-        
-        # 线程池
-        self.executor = None
-        self.futures = []
         
         # 进度队列
         self.progress_queue = queue.Queue()
         
-        self.create_widgets()
+        # 清洗引擎（与命令行共用）在首次开始处理时创建，模块在首帧绘制后于后台预热
+        self.engine_loader = EngineLoader()
+        self.engine = None
+        self.progress_digest = ProgressDigest()
         
-        # 启动进度更新线程
-        self.update_progress_thread = threading.Thread(target=self.update_progress_from_queue, daemon=True)
-        self.update_progress_thread.start()
+        self.create_widgets()
         
+        # 在Tk主循环中按固定帧率批量刷新界面
+        self.root.after(UI_FRAME_MS, self.update_progress_from_queue)
+        self.root.after_idle(lambda: self.engine_loader.warm_up(self.progress_queue))
+    
+    def ensure_engine(self):
+        """返回清洗引擎，首次调用时创建；结束回调在工作线程中执行，经队列交给主线程处理"""
+        if self.engine is None:
+            cleaner_engine = self.engine_loader.load()
+            self.engine = cleaner_engine.CleanerEngine(self.config, self.progress_queue,
+                                                       on_finished=lambda: self.progress_queue.put(("finished", None)))
+        return self.engine
+    
     def load_config(self):
         """加载配置文件"""
         if os.path.exists(self.config_file):
@@ -69,41 +149,7 @@ class MacAICleaner:
     
     def generate_default_config(self):
         """生成默认配置"""
-        dynamic_prompt = """
-### 动态字段清洗规则（根据此提示词自动提取字段）
-请作为专业数据分析师，按照以下规则处理数据：
-1. 从【宝贝名】字段提取以下信息：
-   - 产品名称：提取产品的完整名称
-   - 规格：提取产品的容量规格
-   - 功效：提取产品的主要功效
-   - 核心成分：提取产品的主要有效成分
-   - 适用肤质：提取适用肤质信息
-2. 输出格式要求：
-   - 每个字段单独一行
-   - 格式为"字段名:值"，使用英文冒号
-   - 字段名必须与上述列表完全一致
-   - 没有信息的字段留空
-3. 示例输入：兰蔻小黑瓶精华液 30ml 保湿抗皱 二裂酵母成分 所有肤质适用
-4. 示例输出：
-产品名称:兰蔻小黑瓶精华液
-规格:30ml
-功效:保湿抗皱
-核心成分:二裂酵母
-适用肤质:所有肤质
-### 重要说明：
-- 工具会自动从第1条规则中提取字段名
-- 你可以修改第1条规则中的字段列表
-- 字段数量没有限制，可根据需要增删
-- 严格按照示例格式输出，不要添加额外内容
-"""
-        self.config["DEFAULT"] = {
-            "api_key": "",
-            "prompt": dynamic_prompt.strip(),
-            "input_file": "",
-            "output_file": "",
-            "batch_size": "5",
-            "max_workers": "4"
-        }
+        self.config["DEFAULT"] = default_config()
         self.save_config()
     
     def save_config(self):
@@ -125,19 +171,42 @@ class MacAICleaner:
         self.api_key_entry.grid(row=0, column=1, padx=(10, 0), sticky=tk.W)
         self.api_key_entry.insert(0, self.config["DEFAULT"].get("api_key", ""))
         
+        ttk.Label(api_frame, text="API地址:").grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        self.api_url_entry = ttk.Entry(api_frame, width=80)
+        self.api_url_entry.grid(row=1, column=1, padx=(10, 0), pady=(5, 0), sticky=tk.W)
+        self.api_url_entry.insert(0, self.config["DEFAULT"].get("api_url", "https://api.deepseek.com/v1/chat/completions"))
+        
         # 提速配置
         speed_frame = ttk.LabelFrame(main_frame, text="提速配置", padding="10")
         speed_frame.pack(fill=tk.X, pady=(0, 15))
         
-        ttk.Label(speed_frame, text="批量处理大小:").grid(row=0, column=0, sticky=tk.W)
-        self.batch_size_var = tk.StringVar(value=self.config["DEFAULT"].get("batch_size", "5"))
-        self.batch_size_entry = ttk.Entry(speed_frame, width=10, textvariable=self.batch_size_var)
-        self.batch_size_entry.grid(row=0, column=1, padx=(10, 20), sticky=tk.W)
+        ttk.Label(speed_frame, text="检查点间隔(行):").grid(row=0, column=0, sticky=tk.W)
+        self.checkpoint_rows_var = tk.StringVar(value=self.config["DEFAULT"].get("checkpoint_rows", "200"))
+        self.checkpoint_rows_entry = ttk.Entry(speed_frame, width=10, textvariable=self.checkpoint_rows_var)
+        self.checkpoint_rows_entry.grid(row=0, column=1, padx=(10, 20), sticky=tk.W)
         
         ttk.Label(speed_frame, text="最大线程数:").grid(row=0, column=2, sticky=tk.W)
         self.max_workers_var = tk.StringVar(value=self.config["DEFAULT"].get("max_workers", "4"))
         self.max_workers_entry = ttk.Entry(speed_frame, width=10, textvariable=self.max_workers_var)
-        self.max_workers_entry.grid(row=0, column=3, padx=(10, 0), sticky=tk.W)
+        self.max_workers_entry.grid(row=0, column=3, padx=(10, 20), sticky=tk.W)
+        
+        ttk.Label(speed_frame, text="打包Token预算(0=不打包):").grid(row=0, column=4, sticky=tk.W)
+        self.pack_budget_var = tk.StringVar(value=self.config["DEFAULT"].get("pack_token_budget", "0"))
+        self.pack_budget_entry = ttk.Entry(speed_frame, width=10, textvariable=self.pack_budget_var)
+        self.pack_budget_entry.grid(row=0, column=5, padx=(10, 0), sticky=tk.W)
+        
+        self.output_format_var = tk.StringVar(value=self.config["DEFAULT"].get("output_format", "text"))
+        ttk.Checkbutton(speed_frame, text="JSON结构化输出（校验失败自动重试）", variable=self.output_format_var,
+                        onvalue="json", offvalue="text").grid(row=1, column=0, columnspan=4, pady=(5, 0), sticky=tk.W)
+        
+        self.stream_enabled_var = tk.StringVar(value=self.config["DEFAULT"].get("stream_enabled", "0"))
+        ttk.Checkbutton(speed_frame, text="流式输出（字段到齐后提前断开，省输出Token但断开的连接需重新建连）", variable=self.stream_enabled_var,
+                        onvalue="1", offvalue="0").grid(row=2, column=0, columnspan=4, pady=(5, 0), sticky=tk.W)
+        
+        ttk.Label(speed_frame, text="发送列(逗号分隔，空=按【列名】推断):").grid(row=1, column=4, pady=(5, 0), sticky=tk.W)
+        self.prompt_columns_var = tk.StringVar(value=self.config["DEFAULT"].get("prompt_columns", ""))
+        self.prompt_columns_entry = ttk.Entry(speed_frame, width=20, textvariable=self.prompt_columns_var)
+        self.prompt_columns_entry.grid(row=1, column=5, padx=(10, 0), pady=(5, 0), sticky=tk.W)
         
         # 提示词配置
         prompt_frame = ttk.LabelFrame(main_frame, text="清洗规则（动态字段版）", padding="10")
@@ -188,6 +257,9 @@ class MacAICleaner:
         self.start_btn = ttk.Button(action_frame, text="开始清洗", command=self.start_processing)
         self.start_btn.pack(side=tk.LEFT)
         
+        self.plan_btn = ttk.Button(action_frame, text="预估用量", command=self.plan_processing)
+        self.plan_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
         self.stop_save_btn = ttk.Button(action_frame, text="停止并保存", command=self.stop_and_save, state=tk.DISABLED)
         self.stop_save_btn.pack(side=tk.LEFT, padx=(10, 0))
         
@@ -198,6 +270,12 @@ class MacAICleaner:
         status_frame = ttk.LabelFrame(main_frame, text="处理状态", padding="10")
         status_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
         
+        self.rate_var = tk.StringVar(value="并发上限: -    吞吐: -")
+        ttk.Label(status_frame, textvariable=self.rate_var).pack(anchor=tk.W, pady=(0, 5))
+        
+        self.row_stats_var = tk.StringVar(value=self.progress_digest.summary())
+        ttk.Label(status_frame, textvariable=self.row_stats_var).pack(anchor=tk.W, pady=(0, 5))
+        
         self.status_text = tk.Text(status_frame, wrap=tk.WORD, height=10, font=('SF Pro Display', 12))
         self.status_text.pack(fill=tk.BOTH, expand=True)
         self.status_text.insert(tk.END, "准备就绪...\n")
@@ -213,7 +291,7 @@ class MacAICleaner:
     def update_field_preview(self):
         """更新字段预览"""
         prompt = self.prompt_text.get("1.0", tk.END)
-        fields = self.extract_dynamic_fields(prompt)
+        fields = extract_fields(prompt)
         self.fields_text.config(state=tk.NORMAL)
         self.fields_text.delete("1.0", tk.END)
         if fields:
@@ -222,27 +300,10 @@ class MacAICleaner:
             self.fields_text.insert(tk.END, "未提取到字段，请检查提示词格式")
         self.fields_text.config(state=tk.DISABLED)
     
-    def extract_dynamic_fields(self, prompt):
-        """从提示词中动态提取字段名"""
-        pattern = r'[-*]\s*([^\n:：]+?)\s*[:：]'
-        matches = re.findall(pattern, prompt)
-        
-        fields = []
-        for field in matches:
-            cleaned_field = re.sub(r'[^\w\u4e00-\u9fa5]', '', field).strip()
-            if cleaned_field and cleaned_field not in fields:
-                fields.append(cleaned_field)
-        
-        return fields
-    
-    def clean_field_name(self, field):
-        """清理字段名"""
-        return re.sub(r'[^\w\u4e00-\u9fa5]', '', field).strip()
-    
     def select_input_file(self):
         """选择输入文件"""
         file_path = filedialog.askopenfilename(
-            filetypes=[("Excel文件", "*.xlsx;*.xls"), ("所有文件", "*.*")],
+            filetypes=[("Excel文件", "*.xlsx;*.xls"), ("CSV文件", "*.csv"), ("所有文件", "*.*")],
             initialdir=os.path.expanduser("~"),
             title="选择输入文件"
         )
@@ -266,13 +327,44 @@ class MacAICleaner:
             self.config["DEFAULT"]["output_file"] = file_path
             self.save_config()
     
-    def start_processing(self):
-        """开始处理"""
+    def collect_settings(self):
+        """把界面上的设置写入配置并保存"""
         self.config["DEFAULT"]["api_key"] = self.api_key_entry.get()
+        self.config["DEFAULT"]["api_url"] = self.api_url_entry.get().strip()
         self.config["DEFAULT"]["prompt"] = self.prompt_text.get("1.0", tk.END)
-        self.config["DEFAULT"]["batch_size"] = self.batch_size_var.get()
+        self.config["DEFAULT"]["checkpoint_rows"] = self.checkpoint_rows_var.get()
         self.config["DEFAULT"]["max_workers"] = self.max_workers_var.get()
+        self.config["DEFAULT"]["pack_token_budget"] = self.pack_budget_var.get()
+        self.config["DEFAULT"]["output_format"] = self.output_format_var.get()
+        self.config["DEFAULT"]["prompt_columns"] = self.prompt_columns_var.get().strip()
+        self.config["DEFAULT"]["stream_enabled"] = self.stream_enabled_var.get()
         self.save_config()
+    
+    def plan_processing(self):
+        """运行前预估：抽样估算Token、费用和耗时，不请求API"""
+        self.collect_settings()
+        input_file = self.input_file_entry.get()
+        output_file = self.output_file_entry.get()
+        if not input_file or not os.path.exists(input_file):
+            messagebox.showwarning("警告", "请选择输入文件！")
+            return
+        fields = extract_fields(self.config["DEFAULT"]["prompt"])
+        if not fields:
+            messagebox.showwarning("字段提取失败", "未从提示词中提取到字段，请检查提示词格式")
+            return
+        
+        def run_plan():
+            try:
+                from run_planner import format_plan, plan_run
+                self.progress_queue.put(("status", "\n" + format_plan(plan_run(self.config, fields, input_file, output_file))))
+            except Exception as e:
+                self.progress_queue.put(("status", f"\n❌ 预估失败：{str(e)}\n"))
+        
+        threading.Thread(target=run_plan, daemon=True).start()
+    
+    def start_processing(self):
+        """开始处理"""
+        self.collect_settings()
         
         if not self.config["DEFAULT"]["api_key"]:
             messagebox.showwarning("警告", "请输入API Key！")
@@ -296,36 +388,42 @@ class MacAICleaner:
         
         # 提取字段
         prompt = self.prompt_text.get("1.0", tk.END)
-        self.fields = self.extract_dynamic_fields(prompt)
-        if not self.fields:
+        fields = extract_fields(prompt)
+        if not fields:
             messagebox.showwarning("字段提取失败", "未从提示词中提取到字段，请检查提示词格式")
             return
         
+        # 后台预热尚未完成时在此等待
+        try:
+            self.ensure_engine().fields = fields
+        except Exception as e:
+            messagebox.showerror("启动失败", f"数据处理模块加载失败：{str(e)}")
+            return
+        
         self.start_btn.config(state=tk.DISABLED)
         self.stop_save_btn.config(state=tk.NORMAL)
         self.stop_no_save_btn.config(state=tk.NORMAL)
-        self.processing = True
+        self.engine.processing = True
+        self.progress_digest.reset()
         
-        threading.Thread(target=self.process_data, args=(input_file, output_file)).start()
+        threading.Thread(target=self.engine.process_data, args=(input_file, output_file)).start()
     
     def stop_and_save(self):
-        """停止并保存"""
-        self.processing = False
-        if self.executor:
-            self.executor.shutdown(wait=False)
-        if self.df is not None:
-            output_file = self.output_file_entry.get()
-            if self.save_excel_file(output_file):
-                self.progress_queue.put(("status", f"\n🛑 已保存结果到：{output_file}\n"))
-        self.reset_buttons()
+        """停止并保存：只设置停止标志，由处理线程等进行中的请求结束后保存，界面线程不访问引擎的表格和检查点"""
+        self.engine.stop(save=True)
+        self.progress_queue.put(("status", "\n🛑 正在停止，等待进行中的请求结束后保存结果...\n"))
+        self.disable_stop_buttons()
     
     def stop_no_save(self):
         """停止不保存"""
-        self.processing = False
-        if self.executor:
-            self.executor.shutdown(wait=False)
-        self.progress_queue.put(("status", "\n🛑 已停止，未保存结果\n"))
-        self.reset_buttons()
+        self.engine.stop(save=False)
+        self.progress_queue.put(("status", "\n🛑 正在停止，等待进行中的请求结束...\n"))
+        self.disable_stop_buttons()
+    
+    def disable_stop_buttons(self):
+        """停止期间禁用停止按钮，处理线程结束后由finished消息恢复开始按钮"""
+        self.stop_save_btn.config(state=tk.DISABLED)
+        self.stop_no_save_btn.config(state=tk.DISABLED)
     
     def reset_buttons(self):
         """重置按钮状态"""
@@ -333,185 +431,50 @@ class MacAICleaner:
         self.stop_save_btn.config(state=tk.DISABLED)
         self.stop_no_save_btn.config(state=tk.DISABLED)
     
-    def save_excel_file(self, output_file):
-        """保存Excel文件"""
-        try:
-            df_to_save = self.df.copy()
-            df_to_save = df_to_save.fillna("")
-            df_to_save.to_excel(output_file, index=False, engine='openpyxl')
-            return True
-        except Exception as e:
-            error_msg = f"保存文件错误：{str(e)}"
-            self.progress_queue.put(("status", f"\n❌ {error_msg}\n"))
-            return False
-    
     def update_progress_from_queue(self):
-        """从队列更新进度"""
-        while True:
-            try:
-                msg_type, content = self.progress_queue.get(timeout=0.1)
-                if msg_type == "status":
-                    self.status_text.insert(tk.END, content)
-                    self.status_text.see(tk.END)
-                elif msg_type == "progress":
-                    self.progress_var.set(content)
-                self.root.update()
-            except queue.Empty:
-                continue
-            except Exception:
-                break
-    
-    def process_data(self, input_file, output_file):
-        """处理数据"""
+        """每帧取出队列中的全部消息，合并后一次性刷新界面"""
         try:
-            self.df = pd.read_excel(input_file, engine='openpyxl')
-            original_columns = self.df.columns.tolist()
-            total_rows = len(self.df)
-            
-            self.progress_queue.put(("status", f"✅ 读取原始数据成功，共{total_rows}行\n"))
-            self.progress_queue.put(("status", f"📋 动态提取字段：{self.fields}（共{len(self.fields)}个）\n"))
-            
-            # 添加新字段
-            for field in self.fields:
-                if field not in self.df.columns:
-                    self.df[field] = ""
-            
-            # 保存初始状态
-            if self.save_excel_file(output_file):
-                self.progress_queue.put(("status", f"💾 已保存初始状态到：{output_file}\n"))
-            
-            # 获取配置
-            api_key = self.config["DEFAULT"]["api_key"]
-            prompt_template = self.config["DEFAULT"]["prompt"]
-            batch_size = int(self.config["DEFAULT"]["batch_size"])
-            max_workers = int(self.config["DEFAULT"]["max_workers"])
-            
-            self.progress_queue.put(("status", f"⚡ 提速配置：批量大小={batch_size}，线程数={max_workers}\n"))
-            
-            # 批量处理
-            start_time = time.time()
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as self.executor:
-                for batch_start in range(0, total_rows, batch_size):
-                    if not self.processing:
-                        break
-                    
-                    batch_end = min(batch_start + batch_size, total_rows)
-                    batch_indices = list(range(batch_start, batch_end))
-                    
-                    self.progress_queue.put(("status", f"\n📦 处理批次 {batch_start//batch_size + 1}（行 {batch_start+1}-{batch_end}）...\n"))
-                    
-                    # 提交任务
-                    batch_futures = []
-                    for idx in batch_indices:
-                        future = self.executor.submit(
-                            self.process_single_row,
-                            idx, self.df.iloc[idx], api_key, prompt_template, original_columns
-                        )
-                        batch_futures.append((idx, future))
-                    
-                    # 收集结果
-                    for idx, future in batch_futures:
-                        try:
-                            result = future.result(timeout=30)
-                            if result:
-                                if isinstance(result, dict):
-                                    self.progress_queue.put(("status", f"   行 {idx+1}: 成功提取 {len(result)} 个字段\n"))
-                                    for field, value in result.items():
-                                        self.df.at[idx, field] = value
-                                else:
-                                    self.progress_queue.put(("status", f"   行 {idx+1}: 提取结果格式错误\n"))
-                            else:
-                                self.progress_queue.put(("status", f"   行 {idx+1}: 未提取到任何字段\n"))
-                        except concurrent.futures.TimeoutError:
-                            self.progress_queue.put(("status", f"❌ 行 {idx+1} 处理超时\n"))
-                        except Exception as e:
-                            self.progress_queue.put(("status", f"❌ 行 {idx+1} 处理错误：{str(e)}\n"))
-                    
-                    # 更新进度
-                    progress = (batch_end / total_rows) * 100
-                    self.progress_queue.put(("progress", progress))
-                    
-                    # 保存进度
-                    if self.save_excel_file(output_file):
-                        self.progress_queue.put(("status", f"💾 批次完成，已保存进度\n"))
-            
-            # 计算耗时
-            total_time = time.time() - start_time
-            avg_time_per_row = total_time / total_rows if total_rows > 0 else 0
-            
-            # 最终保存
-            if self.save_excel_file(output_file):
-                new_columns = self.df.columns.tolist()
-                added_fields = [col for col in new_columns if col not in original_columns]
-                
-                self.progress_queue.put(("status", f"\n🎉 处理完成！\n"))
-                self.progress_queue.put(("status", f"⏱️ 总耗时：{total_time:.2f}秒\n"))
-                self.progress_queue.put(("status", f"⚡ 平均每行：{avg_time_per_row:.2f}秒\n"))
-                self.progress_queue.put(("status", f"📊 原字段：{original_columns}\n"))
-                self.progress_queue.put(("status", f"➕ 新增字段：{added_fields}（共{len(added_fields)}个）\n"))
-                self.progress_queue.put(("status", f"📁 输出文件：{output_file}\n"))
-            
-        except Exception as e:
-            error_msg = f"处理错误：{str(e)}\n{traceback.format_exc()}"
-            self.progress_queue.put(("status", f"\n❌ {error_msg}\n"))
+            log_text, progress, rate, finished = self.progress_digest.drain(self.progress_queue)
+            if log_text:
+                self.status_text.insert(tk.END, log_text)
+                # 只保留最近STATUS_MAX_LINES行，避免长时间运行后文本框无限增长
+                line_count = int(self.status_text.index("end-1c").split(".")[0])
+                if line_count > STATUS_MAX_LINES:
+                    self.status_text.delete("1.0", f"{line_count - STATUS_MAX_LINES + 1}.0")
+                self.status_text.see(tk.END)
+            if progress is not None:
+                self.progress_var.set(progress)
+            if rate is not None:
+                self.rate_var.set(rate)
+            self.row_stats_var.set(self.progress_digest.summary())
+            if finished:
+                self.reset_buttons()
         finally:
-            self.processing = False
-            self.reset_buttons()
-    
-    def process_single_row(self, idx, row, api_key, prompt_template, original_columns):
-        """处理单行数据"""
-        try:
-            row_data = "\n".join([f"{col}: {row[col]}" for col in original_columns])
-            current_prompt = prompt_template + "\n当前数据：\n" + row_data + "\n请严格按照要求输出结果："
-            
-            result = self.call_ai_api(api_key, current_prompt)
-            
-            field_values = {}
-            lines = result.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                if ':' in line:
-                    field, value = line.split(':', 1)
-                elif '：' in line:
-                    field, value = line.split('：', 1)
-                else:
-                    continue
-                
-                field = field.strip()
-                cleaned_field = self.clean_field_name(field)
-                value = value.strip()
-                
-                if cleaned_field in self.fields:
-                    field_values[cleaned_field] = value
-            
-            return field_values
-        
-        except Exception as e:
-            self.progress_queue.put(("status", f"❌ 行 {idx+1} API错误：{str(e)}\n"))
-            return {}
-    
-    def call_ai_api(self, api_key, prompt):
-        """调用API"""
-        url = "https://api.deepseek.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.1,
-            "max_tokens": 500,
-            "stream": False
-        }
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
+            self.root.after(UI_FRAME_MS, self.update_progress_from_queue)
+def run_startup_probe(probe_file):
+    """记录界面模块就绪、首帧绘制和数据处理模块就绪的时间戳（time.time()）并写入probe_file；无显示时只记录导入和预热"""
+    result = {"imported": time.time()}
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        root = None
+    if root is not None:
+        app = MacAICleaner(root)
+        root.update()
+        result["first_frame"] = time.time()
+        loader = app.engine_loader
+    else:
+        loader = EngineLoader()
+    loader.load()
+    result["engine_ready"] = time.time()
+    with open(probe_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    if root is not None:
+        root.destroy()
 if __name__ == "__main__":
+    if os.environ.get(STARTUP_PROBE_ENV):
+        run_startup_probe(os.environ[STARTUP_PROBE_ENV])
+        sys.exit(0)
     try:
         root = tk.Tk()
         app = MacAICleaner(root)
@@ -0,0 +1,96 @@
+"""
+运行指标接口
+清洗过程中在本地端口提供Prometheus文本格式的指标（GET /metrics），
+数值直接读取引擎中驱动进度条和状态消息的计数器，长时间任务无需看界面即可监控
+"""
+import http.server
+import threading
+from run_profile import HISTOGRAM_BUCKETS_MS
+def render_metrics(engine):
+    """把引擎当前的计数器渲染为Prometheus文本格式"""
+    lines = []
+    
+    def metric(name, metric_type, help_text, samples):
+        lines.append(f"# HELP ai_cleaner_{name} {help_text}")
+        lines.append(f"# TYPE ai_cleaner_{name} {metric_type}")
+        for labels, value in samples:
+            lines.append(f"ai_cleaner_{name}{labels} {value}")
+    
+    def histogram(name, help_text, stats):
+        # Prometheus直方图的分桶为累计计数
+        samples = []
+        cumulative = 0
+        counts = list(stats["histogram"].values()) if stats else [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for bucket, count in zip(HISTOGRAM_BUCKETS_MS, counts):
+            cumulative += count
+            samples.append((f'_bucket{{le="{bucket / 1000:g}"}}', cumulative))
+        samples.append(('_bucket{le="+Inf"}', cumulative + counts[-1]))
+        samples.append(("_sum", f"{stats['total_seconds']:.6f}" if stats else 0))
+        samples.append(("_count", stats["count"] if stats else 0))
+        metric(name, "histogram", help_text, samples)
+    
+    limiter = engine.limiter
+    checkpoint = engine.checkpoint
+    stage_stats = engine.profiler.stage_stats()
+    metric("processing", "gauge", "是否正在处理", [("", int(engine.processing))])
+    metric("rows_total", "gauge", "输入总行数（流式读取时随读取增长）", [("", engine.total_rows)])
+    metric("rows_completed_total", "counter", "已完成行数（含缓存、续跑和去重复制的行）", [("", engine.completed_rows)])
+    metric("rows_failed_total", "counter", "失败行数", [("", engine.failed_rows)])
+    metric("rows_cached_total", "counter", "缓存命中直接写回的行数", [("", engine.cached_rows)])
+    metric("rows_resumed_total", "counter", "从检查点或输出文件恢复的行数", [("", engine.resumed_rows)])
+    metric("rows_rule_filled_total", "counter", "规则预提取填满全部字段、跳过API的行数", [("", engine.rule_rows)])
+    metric("cells_rule_filled_total", "counter", "规则预提取填充的单元格数", [("", engine.local_cells)])
+    metric("rows_deduplicated_total", "counter", "行内去重省下的请求行数", [("", engine.avoided_calls)])
+    metric("requests_in_flight", "gauge", "在途任务数", [("", engine.in_flight_requests)])
+    metric("concurrency_limit", "gauge", "自适应并发当前上限", [("", limiter.current_limit if limiter else 0)])
+    metric("retries_total", "counter", "重试次数", [("", limiter.retries if limiter else 0)])
+    metric("overloads_total", "counter", "限流/服务端错误/超时次数", [("", limiter.overloads if limiter else 0)])
+    metric("api_requests_total", "counter", "成功的API请求数", [("", engine.profiler.requests)])
+    metric("tokens_total", "counter", "API返回的Token用量", [
+        (f'{{type="{key.replace("_tokens", "")}"}}', value) for key, value in engine.profiler.tokens.items()
+    ])
+    metric("stream_early_stops_total", "counter", "流式输出在字段到齐后提前断开的次数", [("", engine.early_stops)])
+    metric("truncated_outputs_total", "counter", "输出被max_tokens截断后重试的次数", [("", engine.truncated_outputs)])
+    hedge = engine.hedge
+    metric("hedges_fired_total", "counter", "对冲副本发出次数", [("", hedge.fired if hedge else 0)])
+    metric("hedges_won_total", "counter", "对冲副本先于原请求返回的次数", [("", hedge.won if hedge else 0)])
+    metric("hedges_abandoned_total", "counter", "落败的另一份已在执行、未能取消的次数", [("", hedge.abandoned if hedge else 0)])
+    histogram("request_latency_seconds", "单次API请求耗时（不含退避等待）", stage_stats.get("api_wait"))
+    histogram("checkpoint_write_seconds", "检查点写入耗时", stage_stats.get("checkpoint"))
+    metric("checkpoint_rows_written_total", "counter", "检查点已追加的行数", [("", checkpoint.rows_written if checkpoint else 0)])
+    return "\n".join(lines) + "\n"
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    engine = None
+    
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = render_metrics(self.engine).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+class MetricsServer:
+    """在后台线程提供指标接口"""
+    def __init__(self, engine, host="127.0.0.1", port=9464):
+        handler = type("EngineMetricsHandler", (MetricsHandler,), {"engine": engine})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="cleaner-metrics", daemon=True)
+        self.thread.start()
+    
+    @property
+    def url(self):
+        """指标地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+    
+    def stop(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,255 @@
+"""
+本地模拟API服务
+兼容chat/completions接口，可配置延迟分布和错误/429注入，
+按提示词中的字段和行数据返回确定性结果，不花费API费用即可测量吞吐；
+支持stream=true的SSE流式输出、逐Token的生成耗时和max_tokens截断
+用法：python -m mock_api_server --port 8000 --latency-ms 200 --latency-dist lognormal --rate-limit-rate 0.02 --token-ms 20
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from cleaner_engine import CleanerEngine, PACK_MARKER_PATTERN, estimate_tokens
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+# 模拟模型在字段之后追加的说明文字
+CHATTER = "\n\n说明：以上字段均根据商品标题提取，标题中没有提到的信息已留空，如需补充其他字段请告知。"
+# 模拟分词：中文1字1个Token，其余约4字符1个Token（与estimate_tokens口径一致）
+TOKEN_PATTERN = re.compile(r'[\u4e00-\u9fa5]|[^\u4e00-\u9fa5]{1,4}')
+class LatencyModel:
+    """响应延迟分布：mean_ms为固定值/均值，对数正态分布时为中位数"""
+    def __init__(self, distribution="lognormal", mean_ms=200.0, sigma=0.5, seed=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的延迟分布：{distribution}")
+        self.distribution = distribution
+        self.mean = mean_ms / 1000.0
+        self.sigma = sigma
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+    
+    def sample(self):
+        """抽取一次延迟（秒）"""
+        if self.mean <= 0:
+            return 0.0
+        with self.lock:
+            if self.distribution == "fixed":
+                return self.mean
+            if self.distribution == "uniform":
+                return self.random.uniform(0, 2 * self.mean)
+            if self.distribution == "exponential":
+                return self.random.expovariate(1 / self.mean)
+            return self.random.lognormvariate(math.log(self.mean), self.sigma)
+def mock_field_value(field, row_data):
+    """确定性的字段值：同一行数据同一字段总是相同"""
+    return f"{field}_{hashlib.sha1((field + chr(0) + row_data).encode('utf-8')).hexdigest()[:8]}"
+def mock_reply(prompt, json_mode=False):
+    """按提示词生成回复：提取字段名，打包请求按【行N】逐条输出；json_mode时输出JSON对象"""
+    template, _, data = prompt.partition("\n当前数据：\n")
+    data = data.rsplit("\n请严格按照要求", 1)[0]
+    fields = CleanerEngine(None).extract_dynamic_fields(template)
+    
+    def values(row_data):
+        return {field: mock_field_value(field, row_data.strip()) for field in fields}
+    
+    def block(row_data):
+        return "\n".join(f"{field}:{value}" for field, value in values(row_data).items())
+    
+    parts = PACK_MARKER_PATTERN.split(data)
+    if len(parts) == 1:
+        return json.dumps(values(data), ensure_ascii=False) if json_mode else block(data)
+    # split结果形如 [前缀, 行号1, 内容1, 行号2, 内容2, ...]
+    if json_mode:
+        return json.dumps({parts[i]: values(parts[i + 1]) for i in range(1, len(parts) - 1, 2)}, ensure_ascii=False)
+    return "\n".join(f"【行{parts[i]}】\n{block(parts[i + 1])}" for i in range(1, len(parts) - 1, 2))
+class MockChatHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 以下由MockAPIServer按实例覆盖
+    latency = LatencyModel("fixed", 0)
+    error_rate = 0.0
+    rate_limit_rate = 0.0
+    bad_output_rate = 0.0
+    chatter_rate = 0.0
+    token_ms = 0.0
+    retry_after = "1"
+    stats = None
+    
+    def setup(self):
+        # 每个处理器实例对应一个新接受的TCP连接
+        super().setup()
+        self.stats.record("connections")
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            self.stats.record("rate_limited")
+            self.send_json(429, {"error": {"message": "rate limited"}}, {"Retry-After": self.retry_after})
+            return
+        time.sleep(self.latency.sample())
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats.record("errors")
+            self.send_json(500, {"error": {"message": "injected error"}})
+            return
+        
+        prompt = body["messages"][-1]["content"]
+        content = mock_reply(prompt, (body.get("response_format") or {}).get("type") == "json_object")
+        if random.random() < self.bad_output_rate:
+            # 模拟模型多话或输出被截断
+            content = "好的，以下是处理结果：\n" + content[:len(content) // 2]
+            self.stats.record("bad_outputs")
+        if random.random() < self.chatter_rate:
+            content += CHATTER
+        # 超过max_tokens的部分被截断
+        tokens = TOKEN_PATTERN.findall(content)
+        finish_reason = "stop"
+        if len(tokens) > int(body.get("max_tokens") or len(tokens)):
+            tokens = tokens[:int(body["max_tokens"])]
+            finish_reason = "length"
+            self.stats.record("truncated")
+        usage = {
+            "prompt_tokens": estimate_tokens(prompt),
+            "completion_tokens": len(tokens),
+            "total_tokens": estimate_tokens(prompt) + len(tokens),
+        }
+        self.stats.record("completed")
+        if body.get("stream"):
+            self.send_stream(body, tokens, finish_reason, usage)
+            return
+        time.sleep(self.token_ms * len(tokens) / 1000)
+        self.send_json(200, {
+            "object": "chat.completion",
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        })
+    
+    def send_stream(self, body, tokens, finish_reason, usage):
+        """以SSE分块输出，每个Token一个事件；客户端提前断开时停止生成"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        def event(choices, extra=None):
+            payload = dict({"object": "chat.completion.chunk", "model": body.get("model", ""), "choices": choices}, **(extra or {}))
+            self.write_chunk(("data: " + json.dumps(payload, ensure_ascii=False) + "\n\n").encode("utf-8"))
+        
+        try:
+            for token in tokens:
+                time.sleep(self.token_ms / 1000)
+                event([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            event([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event([], {"usage": usage})
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except ConnectionError:
+            self.stats.record("streams_closed")
+            self.close_connection = True
+    
+    def write_chunk(self, data):
+        """写出一个HTTP分块，空数据为结束块"""
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+    
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+class MockStats:
+    """按结果分类的请求计数"""
+    def __init__(self):
+        self.counts = {"completed": 0, "rate_limited": 0, "errors": 0, "bad_outputs": 0, "truncated": 0, "streams_closed": 0, "connections": 0}
+        self.lock = threading.Lock()
+    
+    def record(self, kind):
+        with self.lock:
+            self.counts[kind] += 1
+    
+    def summary(self):
+        with self.lock:
+            return dict(self.counts)
+class MockServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # 数百个并发连接同时建连时不被拒绝
+    request_queue_size = 1024
+    
+    def handle_error(self, request, client_address):
+        # 客户端停止或超时后断开连接属于正常情况
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+class MockAPIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=None, error_rate=0.0, rate_limit_rate=0.0, retry_after="1",
+                 bad_output_rate=0.0, chatter_rate=0.0, token_ms=0.0):
+        self.stats = MockStats()
+        handler = type("ConfiguredMockChatHandler", (MockChatHandler,), {
+            "latency": latency or LatencyModel("fixed", 0),
+            "error_rate": error_rate,
+            "rate_limit_rate": rate_limit_rate,
+            "retry_after": retry_after,
+            "bad_output_rate": bad_output_rate,
+            "chatter_rate": chatter_rate,
+            "token_ms": token_ms,
+            "stats": self.stats,
+        })
+        self.server = MockServer((host, port), handler)
+        self.thread = None
+    
+    @property
+    def url(self):
+        """chat/completions接口地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+    
+    def start(self):
+        """在后台线程启动，返回接口地址"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+    
+    def stop(self):
+        """停止服务"""
+        self.server.shutdown()
+        self.server.server_close()
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mock_api_server", description="本地模拟chat/completions服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=200, help="延迟均值（对数正态分布时为中位数）")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布的sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--retry-after", default="1", help="429响应的Retry-After")
+    parser.add_argument("--bad-output-rate", type=float, default=0.0, help="返回带多余文字且被截断的结果的比例")
+    parser.add_argument("--chatter-rate", type=float, default=0.0, help="在字段之后追加说明文字的比例")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="每个输出Token的生成耗时（毫秒）")
+    args = parser.parse_args(argv)
+    
+    server = MockAPIServer(
+        args.host, args.port, LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma),
+        args.error_rate, args.rate_limit_rate, args.retry_after, args.bad_output_rate, args.chatter_rate, args.token_ms
+    )
+    print(f"🧪 模拟API已启动：{server.url}（在配置中设置api_url即可使用）", flush=True)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 请求统计：{server.stats.summary()}")
+    finally:
+        server.server.server_close()
+if __name__ == "__main__":
+    main()
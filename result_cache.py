@@ -0,0 +1,163 @@
+"""
+清洗结果缓存
+以(提示词模板, 行数据)的哈希为键，把清洗结果持久化到SQLite，
+相同的数据跨文件、跨运行直接复用，不再请求API
+"""
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+def user_data_dir(app_name="AI清洗工具"):
+    """获取用户数据目录"""
+    if sys.platform == "darwin":
+        base_path = os.path.expanduser("~/Library/Application Support")
+    elif os.name == "nt":
+        base_path = os.environ.get("APPDATA", os.path.expanduser("~"))
+    else:
+        base_path = os.environ.get("XDG_DATA_HOME", os.path.expanduser("~/.local/share"))
+    path = os.path.join(base_path, app_name)
+    os.makedirs(path, exist_ok=True)
+    return path
+class ResultCache:
+    # 单条SQL的参数个数上限
+    LOOKUP_CHUNK = 500
+    
+    def __init__(self, db_path=None, max_mb=200, max_age_days=30, read_only=False):
+        self.db_path = db_path or os.path.join(user_data_dir(), "result_cache.sqlite3")
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.lock = threading.Lock()
+        # 只读（试运行预估命中率）：只查询，不刷新访问时间、不淘汰；缓存库不存在时视为空库
+        self.read_only = read_only
+        if read_only and os.path.exists(self.db_path):
+            uri = pathlib.Path(os.path.abspath(self.db_path)).as_uri() + "?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+        else:
+            # 分片批处理时多个进程共用同一个缓存库，写锁等待放宽
+            self.conn = sqlite3.connect(":memory:" if read_only else self.db_path, timeout=30, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "request_size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+            self.conn.commit()
+        
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.hit_keys = []
+    
+    @staticmethod
+    def make_key(prompt_template, row_data, output_format="text", rules=""):
+        """生成缓存键；输出格式计入键中，文本模式可能只解析出部分字段，其结果不能当作JSON模式校验通过的结果复用；
+        缓存的结果含规则填充的字段，有生效规则时规则文本也计入键中"""
+        digest = hashlib.sha256()
+        digest.update(output_format.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(prompt_template.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(row_data.encode("utf-8"))
+        if rules:
+            digest.update(b"\0")
+            digest.update(rules.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def get_many(self, keys):
+        """批量查询，返回{键: 字段字典}"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            for start in range(0, len(unique_keys), self.LOOKUP_CHUNK):
+                chunk = unique_keys[start:start + self.LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, value, size, request_size FROM cache WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, value, size, request_size in rows:
+                    found[key] = (json.loads(value), size + request_size)
+        
+        results = {}
+        for key in keys:
+            if key in found:
+                fields, saved = found[key]
+                results[key] = fields
+                self.hits += 1
+                self.bytes_saved += saved
+                if not self.read_only:
+                    self.hit_keys.append(key)
+            else:
+                self.misses += 1
+        return results
+    
+    def put(self, key, fields, request_size=0):
+        """写入一条结果"""
+        value = json.dumps(fields, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, request_size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), request_size, now, now)
+            )
+    
+    def commit(self):
+        """提交写入并刷新命中记录的访问时间"""
+        now = time.time()
+        with self.lock:
+            if self.hit_keys:
+                self.conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in dict.fromkeys(self.hit_keys)]
+                )
+                self.hit_keys = []
+            self.conn.commit()
+    
+    def evict(self):
+        """按存活时间和总大小淘汰旧条目，返回删除条数"""
+        removed = 0
+        with self.lock:
+            if self.max_age > 0:
+                cursor = self.conn.execute(
+                    "DELETE FROM cache WHERE created_at < ?", (time.time() - self.max_age,)
+                )
+                removed += cursor.rowcount
+            
+            total_size = self.conn.execute("SELECT COALESCE(SUM(size + request_size), 0) FROM cache").fetchone()[0]
+            if self.max_bytes > 0 and total_size > self.max_bytes:
+                excess = total_size - self.max_bytes
+                stale_keys = []
+                for key, size in self.conn.execute(
+                    "SELECT key, size + request_size FROM cache ORDER BY accessed_at"
+                ).fetchall():
+                    stale_keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self.conn.executemany("DELETE FROM cache WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+            self.conn.commit()
+        return removed
+    
+    def stats_line(self):
+        """生成统计信息"""
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total > 0 else 0
+        return (f"🗄️ 结果缓存：命中{self.hits}次，未命中{self.misses}次，"
+                f"命中率{hit_rate:.1f}%，节省约{self.bytes_saved / 1024:.1f} KB")
+    
+    def close(self):
+        """提交、淘汰并关闭；只读时直接关闭"""
+        if not self.read_only:
+            self.commit()
+            self.evict()
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,59 @@
+"""
+规则预提取
+按配置的正则对输入列做向量化提取（pandas str.extract），
+规则填满全部字段的行不再请求API，其余行只请求缺少的字段
+规则格式：每行"字段 | 列 | 正则"，取正则的第一个分组（没有分组时取整个匹配）；
+同一字段可写多条规则，靠前的优先；#开头的行为注释
+"""
+import re
+import pandas as pd
+def parse_rules(text):
+    """解析规则文本，返回[(字段, 列, 正则)]；格式错误时抛出ValueError"""
+    rules = []
+    for line_no, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        # 正则中可能有|，只按前两个|拆分
+        parts = [part.strip() for part in line.split("|", 2)]
+        if len(parts) != 3 or not all(parts):
+            raise ValueError(f"第{line_no}行规则格式应为“字段 | 列 | 正则”：{line}")
+        field, column, pattern = parts
+        try:
+            compiled = re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f"第{line_no}行规则的正则无效：{e}")
+        if compiled.groups == 0:
+            compiled = re.compile(f"({pattern})")
+        rules.append((field, column, compiled))
+    return rules
+class RuleExtractor:
+    """对一批行执行提取规则，只保留提示词中存在的字段"""
+    def __init__(self, rules, fields, columns):
+        by_name = {str(col): col for col in columns}
+        missing = sorted({column for _, column, _ in rules if column not in by_name})
+        if missing:
+            raise ValueError(f"提取规则引用的列在输入中不存在：{missing}")
+        self.rules = [(field, by_name[column], pattern) for field, column, pattern in rules if field in fields]
+        self.fields = [field for field in fields if any(rule[0] == field for rule in self.rules)]
+        # 规则读取的输入列：去重和缓存键必须包含这些列，否则规则结果会在重复行间错用
+        self.columns = list(dict.fromkeys(column for _, column, _ in self.rules))
+    
+    def __bool__(self):
+        return bool(self.rules)
+    
+    def signature(self):
+        """生效规则的文本（字段、列、正则），计入缓存键：规则变化后，缓存中旧规则填充的字段不再命中"""
+        return "\n".join(f"{field} | {column} | {pattern.pattern}" for field, column, pattern in self.rules)
+    
+    def extract(self, df):
+        """向量化提取，返回与df同索引的DataFrame（列为有规则的字段），未匹配或匹配为空的位置为NA"""
+        texts = {}
+        results = {}
+        for field, column, pattern in self.rules:
+            if column not in texts:
+                texts[column] = df[column].astype("string")
+            values = texts[column].str.extract(pattern, expand=True).iloc[:, 0].str.strip()
+            values = values.mask(values == "")
+            results[field] = results[field].fillna(values) if field in results else values
+        return pd.DataFrame(results, index=df.index, columns=self.fields)
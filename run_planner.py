@@ -0,0 +1,202 @@
+"""
+运行前预估
+只读取表格开头的样本行，向量化估算每行Token数，
+推算整表的输入/输出Token、费用和耗时，并给出打包和并发建议，不请求API
+"""
+import json
+import math
+import os
+import re
+import numpy as np
+import pandas as pd
+from cleaner_engine import JSON_INSTRUCTION, PACK_INSTRUCTION, estimate_tokens, key_columns, select_prompt_columns, serialize_rows
+from result_cache import ResultCache
+from rule_extractor import RuleExtractor, parse_rules
+from run_profile import profile_paths
+from table_reader import TableChunkReader
+# 没有上次运行的剖析文件时假设的单次请求耗时（秒）
+DEFAULT_LATENCY_SECONDS = 3.0
+# 每个输出字段的Token估算：字段名加约10个Token的值
+COMPLETION_TOKENS_PER_FIELD = 10
+# 推荐打包时单个请求的目标输入Token数
+TARGET_PACK_TOKENS = 2000
+# 打包节省的Token不足该比例时不建议打包
+MIN_PACK_SAVING = 0.2
+CJK_PATTERN = r'[\u4e00-\u9fa5]'
+def read_sample(input_file, sample_rows):
+    """读取开头的样本行，返回(样本, 总行数)；工作表没有记录行数时逐行计数"""
+    reader = TableChunkReader(input_file, sample_rows)
+    try:
+        chunks = iter(reader)
+        sample = next(chunks, None)
+        if sample is None:
+            sample = pd.DataFrame(columns=reader.columns)
+        total_rows = reader.estimated_rows
+        if total_rows is None:
+            total_rows = len(sample) + sum(len(chunk) for chunk in chunks)
+    finally:
+        reader.close()
+    return sample, max(total_rows, len(sample))
+def estimate_row_tokens(df, columns):
+    """向量化估算每行序列化文本（"列名: 值"逐行拼接）的Token数，与estimate_tokens口径一致"""
+    lengths = np.full(len(df), max(len(columns) - 1, 0), dtype=np.int64)
+    cjk_counts = np.zeros(len(df), dtype=np.int64)
+    for col in columns:
+        values = df[col].map(str)
+        header = f"{col}: "
+        lengths += len(header) + values.str.len().to_numpy()
+        cjk_counts += len(re.findall(CJK_PATTERN, header)) + values.str.count(CJK_PATTERN).to_numpy()
+    return cjk_counts + (lengths - cjk_counts) // 4 + 1
+def pack_latency(latency, pack_rows):
+    """打包请求输出更长：按每4行约增加一倍单次耗时估算"""
+    return latency * max(1.0, pack_rows / 4)
+def previous_latency(output_file):
+    """上次运行剖析文件中单次请求耗时的中位数（秒），不存在时返回None"""
+    json_path = profile_paths(output_file)[0]
+    if not output_file or not os.path.exists(json_path):
+        return None
+    try:
+        with open(json_path, encoding="utf-8") as f:
+            return json.load(f)["stages"]["api_wait"]["p50_ms"] / 1000
+    except (ValueError, KeyError, TypeError):
+        return None
+def plan_run(config, fields, input_file, output_file="", sample_rows=2000):
+    """预估整表运行的Token、费用和耗时，返回结果字典"""
+    settings = config["DEFAULT"]
+    prompt_template = settings["prompt"]
+    engine = settings.get("engine", "threads")
+    concurrency = int(settings.get("async_concurrency", "100")) if engine == "async" else int(settings["max_workers"])
+    pack_token_budget = int(settings.get("pack_token_budget", "0"))
+    pack_max_rows = int(settings.get("pack_max_rows", "20"))
+    target_seconds = float(settings.get("plan_target_minutes", "30")) * 60
+    
+    sample, total_rows = read_sample(input_file, sample_rows)
+    all_columns = sample.columns.tolist()
+    columns = select_prompt_columns(prompt_template, all_columns, settings.get("prompt_columns", ""),
+                                    settings.get("column_projection", "1") == "1")
+    row_tokens = estimate_row_tokens(sample, columns) if len(sample) else np.ones(1, dtype=np.int64)
+    extractor = RuleExtractor(parse_rules(settings.get("extract_rules", "")), fields, all_columns)
+    # 去重和缓存键与引擎一致：发送列加上规则读取的其他列
+    dedup_columns = key_columns(columns, extractor)
+    
+    # 去重：按样本中的重复比例外推
+    unique_ratio = 1.0
+    if settings.get("dedup_enabled", "1") == "1" and len(sample):
+        unique_ratio = pd.util.hash_pandas_object(sample[dedup_columns], index=False).nunique() / len(sample)
+    # 缓存：样本行的命中比例
+    cache_hit_ratio = 0.0
+    if settings.get("cache_enabled", "1") == "1" and len(sample):
+        row_texts = serialize_rows(sample, columns)
+        if len(dedup_columns) > len(columns):
+            row_texts = [text + "\n" + extra for text, extra in zip(row_texts, serialize_rows(sample, dedup_columns[len(columns):]))]
+        # 只读查询：试运行不能刷新访问时间或淘汰用户缓存中的条目
+        cache = ResultCache(read_only=True)
+        try:
+            keys = [ResultCache.make_key(prompt_template, text, settings.get("output_format", "text"), extractor.signature())
+                    for text in row_texts]
+            cache_hit_ratio = len(cache.get_many(keys)) / len(set(keys))
+        finally:
+            cache.close()
+    # 规则预提取：样本中规则填满全部字段的比例
+    rule_ratio = 0.0
+    if extractor and len(sample):
+        rule_ratio = float((extractor.extract(sample).notna().sum(axis=1) == len(fields)).mean())
+    request_rows = math.ceil(round(total_rows * unique_ratio * (1 - cache_hit_ratio) * (1 - rule_ratio), 6))
+    
+    # 单行请求的Token：提示词模板 + 行数据 + 固定结尾
+    template_tokens = estimate_tokens(prompt_template + "\n当前数据：\n" + "\n请严格按照要求输出结果：")
+    if settings.get("output_format", "text") == "json":
+        template_tokens += estimate_tokens(JSON_INSTRUCTION.format(schema=json.dumps({field: "" for field in fields}, ensure_ascii=False)))
+    mean_row_tokens = float(row_tokens.mean())
+    measured_latency = previous_latency(output_file)
+    latency = measured_latency or DEFAULT_LATENCY_SECONDS
+    completion_per_row = sum(estimate_tokens(field) + COMPLETION_TOKENS_PER_FIELD for field in fields)
+    
+    # 打包建议：按每行Token的p90计算单包行数，输出长度不超过打包请求的max_tokens上限
+    p90_row_tokens = float(np.percentile(row_tokens, 90))
+    max_rows_by_output = max(1, (8192 - 10) // max(len(fields) * 30 + 10, 1))
+    pack_rows = int(max(1, min(TARGET_PACK_TOKENS // max(p90_row_tokens, 1), pack_max_rows, max_rows_by_output)))
+    pack_overhead = estimate_tokens(PACK_INSTRUCTION.format(count=pack_rows)) / pack_rows + 3
+    single_prompt_tokens = template_tokens + mean_row_tokens
+    packed_prompt_tokens = template_tokens / pack_rows + pack_overhead + mean_row_tokens
+    pack_saving = 1 - packed_prompt_tokens / single_prompt_tokens
+    if pack_saving < MIN_PACK_SAVING:
+        pack_rows = 1
+    
+    # 当前配置的Token和请求数
+    if pack_token_budget > 0:
+        configured_pack_rows = int(max(1, min(pack_token_budget // max(mean_row_tokens, 1), pack_max_rows)))
+    else:
+        configured_pack_rows = 1
+    configured_prompt_tokens = (template_tokens / configured_pack_rows + mean_row_tokens
+                                + (pack_overhead if configured_pack_rows > 1 else 0))
+    requests = math.ceil(request_rows / configured_pack_rows)
+    prompt_tokens = int(request_rows * configured_prompt_tokens)
+    completion_tokens = int(request_rows * completion_per_row)
+    wall_seconds = math.ceil(requests / max(concurrency, 1)) * pack_latency(latency, configured_pack_rows)
+    
+    recommended_requests = math.ceil(request_rows / pack_rows)
+    recommended_latency = pack_latency(latency, pack_rows)
+    # 并发建议：在目标时长内完成所需的并发，不低于当前配置
+    recommended_concurrency = max(concurrency, math.ceil(recommended_requests * recommended_latency / target_seconds))
+    recommended_engine = "async" if recommended_concurrency > 32 else "threads"
+    recommended_concurrency = min(recommended_concurrency, 500 if recommended_engine == "async" else 32)
+    
+    prompt_price = float(settings.get("price_prompt_per_million", "2"))
+    completion_price = float(settings.get("price_completion_per_million", "8"))
+    return {
+        "total_rows": total_rows,
+        "sample_rows": len(sample),
+        "columns": [str(col) for col in columns],
+        "input_columns": len(all_columns),
+        "unique_ratio": unique_ratio,
+        "cache_hit_ratio": cache_hit_ratio,
+        "rule_ratio": rule_ratio,
+        "request_rows": request_rows,
+        "template_tokens": template_tokens,
+        "mean_row_tokens": mean_row_tokens,
+        "p90_row_tokens": p90_row_tokens,
+        "requests": requests,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6,
+        "latency": latency,
+        "latency_measured": measured_latency is not None,
+        "engine": engine,
+        "concurrency": concurrency,
+        "wall_seconds": wall_seconds,
+        "recommended_pack_rows": pack_rows,
+        "recommended_pack_token_budget": int(math.ceil(pack_rows * p90_row_tokens)) if pack_rows > 1 else 0,
+        "pack_saving": max(pack_saving, 0.0),
+        "recommended_engine": recommended_engine,
+        "recommended_concurrency": recommended_concurrency,
+        "recommended_wall_seconds": math.ceil(recommended_requests / recommended_concurrency) * recommended_latency,
+    }
+def format_duration(seconds):
+    """耗时显示为时/分/秒"""
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes}分"
+    if minutes:
+        return f"{minutes}分{secs}秒"
+    return f"{secs}秒"
+def format_plan(plan):
+    """预估结果的状态栏文本"""
+    latency_source = "上次运行实测中位数" if plan["latency_measured"] else "未找到上次运行的剖析文件，按默认值估算"
+    lines = [
+        f"🧮 运行预估（抽样{plan['sample_rows']}行，共{plan['total_rows']}行，未请求API）",
+        f"   发送列：{plan['columns']}（共{plan['input_columns']}列中的{len(plan['columns'])}列）",
+        f"   每行约{plan['mean_row_tokens']:.0f}个Token（p90 {plan['p90_row_tokens']:.0f}），提示词模板约{plan['template_tokens']}个Token",
+        f"   去重后保留{plan['unique_ratio']:.0%}，缓存命中{plan['cache_hit_ratio']:.0%}，规则填满{plan['rule_ratio']:.0%}，需请求{plan['request_rows']}行，共{plan['requests']}次请求",
+        f"   Token：输入约{plan['prompt_tokens']:,}，输出约{plan['completion_tokens']:,}，费用约¥{plan['cost']:.2f}",
+        f"   耗时：单次请求{plan['latency']:.2f}秒（{latency_source}），{plan['engine']}引擎并发{plan['concurrency']}，预计{format_duration(plan['wall_seconds'])}",
+    ]
+    if plan["recommended_pack_rows"] > 1:
+        lines.append(f"💡 建议打包：每次{plan['recommended_pack_rows']}行（pack_token_budget={plan['recommended_pack_token_budget']}），"
+                     f"输入Token可减少约{plan['pack_saving']:.0%}")
+    else:
+        lines.append("💡 建议不打包：提示词模板占比不高，打包节省有限")
+    lines.append(f"💡 建议并发：{plan['recommended_engine']}引擎并发{plan['recommended_concurrency']}，"
+                 f"预计{format_duration(plan['recommended_wall_seconds'])}")
+    return "\n".join(lines) + "\n"
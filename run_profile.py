@@ -0,0 +1,127 @@
+"""
+运行剖析
+记录各阶段（读取、预处理、构建提示词、等待API、解析、写回、检查点、导出）的耗时分布
+和API返回的Token用量，运行结束后导出JSON/CSV剖析文件；
+可选用cProfile剖析调度线程，输出的.prof文件可用snakeviz等工具查看
+"""
+import array
+import collections
+import contextlib
+import cProfile
+import csv
+import json
+import threading
+import time
+import numpy as np
+# 阶段名（剖析文件中使用）及状态栏显示名
+STAGE_LABELS = {
+    "read_input": "读取输入",
+    "prepare_rows": "去重/缓存/打包",
+    "build_prompt": "构建提示词",
+    "api_wait": "等待API",
+    "backoff": "退避等待",
+    "parse": "解析结果",
+    "write_back": "写回缓冲",
+    "flush_rows": "批量写入表格",
+    "checkpoint": "检查点",
+    "save": "导出文件",
+}
+# 直方图分桶上界（毫秒）
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+HISTOGRAM_LABELS = [f"<={bucket}ms" for bucket in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+def profile_paths(output_file):
+    """剖析文件路径（与输出文件同目录）：(JSON, CSV, cProfile)"""
+    return output_file + ".profile.json", output_file + ".profile.csv", output_file + ".prof"
+class RunProfiler:
+    """线程安全的阶段计时器，协程中同样可用"""
+    def __init__(self):
+        # 每个阶段的耗时（秒），array比list省内存
+        self.durations = collections.defaultdict(lambda: array.array("d"))
+        self.tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.cprofile = None
+    
+    @contextlib.contextmanager
+    def span(self, stage):
+        """计时一个阶段"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started_at)
+    
+    def record(self, stage, seconds):
+        """记录一次阶段耗时"""
+        with self.lock:
+            self.durations[stage].append(seconds)
+    
+    def add_usage(self, usage):
+        """累计API响应中的usage字段"""
+        with self.lock:
+            self.requests += 1
+            for key in self.tokens:
+                self.tokens[key] += int((usage or {}).get(key) or 0)
+    
+    def stage_stats(self):
+        """各阶段的次数、总耗时、分位数和直方图"""
+        with self.lock:
+            durations = {stage: np.frombuffer(values, dtype=np.float64).copy() for stage, values in self.durations.items()}
+        stats = {}
+        edges = [0.0] + [bucket / 1000 for bucket in HISTOGRAM_BUCKETS_MS] + [float("inf")]
+        # 按流水线顺序排列
+        order = list(STAGE_LABELS)
+        for stage in sorted(durations, key=lambda name: order.index(name) if name in order else len(order)):
+            values = durations[stage]
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            counts, _ = np.histogram(values, bins=edges)
+            stats[stage] = {
+                "count": int(len(values)),
+                "total_seconds": float(values.sum()),
+                "mean_ms": float(values.mean() * 1000),
+                "p50_ms": float(p50 * 1000),
+                "p90_ms": float(p90 * 1000),
+                "p99_ms": float(p99 * 1000),
+                "max_ms": float(values.max() * 1000),
+                "histogram": dict(zip(HISTOGRAM_LABELS, counts.tolist())),
+            }
+        return stats
+    
+    def summary_line(self):
+        """状态栏显示的简要统计：各阶段总耗时和Token用量"""
+        stats = self.stage_stats()
+        parts = [f"{STAGE_LABELS.get(stage, stage)}{item['total_seconds']:.2f}秒" for stage, item in stats.items()]
+        line = "🔬 阶段耗时：" + "，".join(parts)
+        if self.requests:
+            line += (f"\n🔢 Token用量：{self.requests}次请求，输入{self.tokens['prompt_tokens']}，"
+                     f"输出{self.tokens['completion_tokens']}，合计{self.tokens['total_tokens']}")
+        return line
+    
+    def write(self, json_path, csv_path, run_info=None):
+        """导出剖析文件：JSON含完整直方图，CSV每阶段一行"""
+        stats = self.stage_stats()
+        with self.lock:
+            tokens = dict(self.tokens, requests=self.requests)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"run": run_info or {}, "tokens": tokens, "stages": stats}, f, ensure_ascii=False, indent=2)
+        
+        columns = ["count", "total_seconds", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+        with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["stage"] + columns + HISTOGRAM_LABELS)
+            for stage, item in stats.items():
+                writer.writerow([stage] + [round(item[col], 3) for col in columns] + [item["histogram"][label] for label in HISTOGRAM_LABELS])
+    
+    def enable_cprofile(self):
+        """在当前线程开启cProfile（异步引擎时覆盖全部请求处理，线程引擎时覆盖调度和写回）"""
+        self.cprofile = cProfile.Profile()
+        self.cprofile.enable()
+    
+    def dump_cprofile(self, path):
+        """停止cProfile并写出.prof文件，未开启时返回False"""
+        if self.cprofile is None:
+            return False
+        self.cprofile.disable()
+        self.cprofile.dump_stats(path)
+        self.cprofile = None
+        return True
@@ -0,0 +1,171 @@
+"""
+分片批处理
+多个输入文件（目录或通配符）按行范围切成分片，由进程池并行清洗，
+每个分片有独立的连接池和检查点，完成后按原始行顺序合并输出。
+总并发数在各进程间平分，合计不超过API限流
+"""
+import concurrent.futures
+import configparser
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import pandas as pd
+from checkpoint import file_fingerprint
+from table_reader import read_table, save_table
+INPUT_EXTENSIONS = (".xlsx", ".xls", ".csv")
+def expand_inputs(pattern):
+    """目录取其中的Excel/CSV文件，否则按通配符匹配"""
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern)
+    # 跳过Excel打开文件时生成的~$临时文件
+    return sorted(
+        path for path in paths
+        if os.path.isfile(path) and path.lower().endswith(INPUT_EXTENSIONS) and not os.path.basename(path).startswith("~$")
+    )
+def output_name(input_file, used_names):
+    """合并输出的文件名：原文件名_cleaned.xlsx，同名时带上原扩展名，仍重名时再加序号"""
+    stem, ext = os.path.splitext(os.path.basename(input_file))
+    name = f"{stem}_cleaned"
+    if name in used_names:
+        base = f"{stem}_{ext.lstrip('.')}"
+        name = f"{base}_cleaned"
+        index = 2
+        while name in used_names:
+            name = f"{base}_{index}_cleaned"
+            index += 1
+    used_names.add(name)
+    return name
+def split_input(input_file, work_dir, name, shard_rows):
+    """按行范围切分输入，返回分片文件列表；输入未变化时复用上次的分片，检查点才能续跑"""
+    manifest_path = os.path.join(work_dir, f"{name}.manifest.json")
+    fingerprint = file_fingerprint(input_file)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if (manifest.get("input_fingerprint") == fingerprint and manifest.get("shard_rows") == shard_rows
+                and all(os.path.exists(path) for path in manifest["shards"])):
+            return manifest["shards"]
+    
+    df = read_table(input_file)
+    shards = []
+    for shard_index, start in enumerate(range(0, max(len(df), 1), shard_rows)):
+        shard_path = os.path.join(work_dir, f"{name}.part{shard_index:03d}.pkl")
+        df.iloc[start:start + shard_rows].reset_index(drop=True).to_pickle(shard_path)
+        shards.append(shard_path)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"input_fingerprint": fingerprint, "shard_rows": shard_rows, "shards": shards}, f, ensure_ascii=False)
+    return shards
+def shard_output_path(shard_input):
+    """分片结果文件，检查点与其同目录"""
+    return shard_input[:-len(".pkl")] + ".out.pkl"
+def run_shard(settings, fields, shard_input, shard_output):
+    """子进程：用独立的引擎清洗一个分片，返回统计"""
+    from cleaner_engine import CleanerEngine
+    
+    config = configparser.ConfigParser(interpolation=None)
+    config["DEFAULT"] = settings
+    engine = CleanerEngine(config)
+    engine.fields = fields
+    shard_name = os.path.basename(shard_input)
+    
+    # 子进程只打印错误，避免多个进程的日志混在一起
+    done_event = threading.Event()
+    
+    def drain():
+        while not (done_event.is_set() and engine.progress_queue.empty()):
+            try:
+                msg_type, content = engine.progress_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if msg_type == "status" and content.lstrip().startswith("❌"):
+                print(f"[{shard_name}] {content.strip()}", flush=True)
+    
+    printer = threading.Thread(target=drain, daemon=True)
+    printer.start()
+    engine.processing = True
+    succeeded = engine.process_data(shard_input, shard_output)
+    done_event.set()
+    printer.join()
+    return {
+        "succeeded": succeeded,
+        "total_rows": engine.total_rows,
+        "completed_rows": engine.completed_rows,
+        "failed_rows": engine.failed_rows,
+        "elapsed": engine.elapsed,
+    }
+def merge_shards(shard_outputs, output_file):
+    """按分片顺序（即原始行顺序）合并结果"""
+    merged = pd.concat([pd.read_pickle(path) for path in shard_outputs], ignore_index=True)
+    save_table(merged.fillna(""), output_file)
+    return len(merged)
+def run_batch(config, fields, input_files, output_dir, processes, shard_rows, total_concurrency, log=print):
+    """分片批处理入口，返回(成功合并的文件数, 失败行数, 是否全部成功)"""
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = os.path.join(output_dir, ".shards")
+    os.makedirs(work_dir, exist_ok=True)
+    
+    # 每个进程分到的并发上限，合计不超过总并发；总并发小于进程数时减少进程，每个进程至少1个并发
+    processes = max(1, min(processes, total_concurrency))
+    per_process = max(1, total_concurrency // processes)
+    settings = dict(config["DEFAULT"])
+    settings["max_workers"] = str(per_process)
+    settings["async_concurrency"] = str(per_process)
+    # 分片已按行数切小，子进程一次读入即可
+    settings["stream_chunk_rows"] = "0"
+    # 各子进程不能共用同一个指标端口
+    settings["metrics_port"] = "0"
+    log(f"⚡ 分片批处理：{len(input_files)}个文件，{processes}个进程，每片{shard_rows}行，"
+        f"总并发{total_concurrency}（每进程{per_process}）\n")
+    
+    started_at = time.time()
+    used_names = set()
+    file_shards = {}
+    futures = {}
+    # 子进程使用spawn启动，避免fork继承父进程的线程和连接
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # 每个文件切分完立即提交，不必等所有文件切完
+        for input_file in input_files:
+            name = output_name(input_file, used_names)
+            shards = split_input(input_file, work_dir, name, shard_rows)
+            file_shards[input_file] = (name, shards)
+            log(f"📂 {os.path.basename(input_file)}：切分为{len(shards)}个分片\n")
+            for shard_index, shard_input in enumerate(shards):
+                future = pool.submit(run_shard, settings, fields, shard_input, shard_output_path(shard_input))
+                futures[future] = (input_file, shard_index)
+        
+        shard_results = {}
+        for future in concurrent.futures.as_completed(futures):
+            input_file, shard_index = futures[future]
+            total_shards = len(file_shards[input_file][1])
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"succeeded": False, "total_rows": 0, "completed_rows": 0, "failed_rows": 0, "elapsed": 0.0}
+                log(f"❌ {os.path.basename(input_file)} 分片{shard_index + 1}/{total_shards} 出错：{str(e)}\n")
+            shard_results[(input_file, shard_index)] = result
+            log(f"{'✅' if result['succeeded'] else '❌'} {os.path.basename(input_file)} 分片{shard_index + 1}/{total_shards}："
+                f"{result['completed_rows']}/{result['total_rows']}行，失败{result['failed_rows']}行，耗时{result['elapsed']:.2f}秒\n")
+    
+    # 合并：文件的所有分片都成功才输出
+    merged_files = 0
+    total_rows = 0
+    failed_rows = sum(result["failed_rows"] for result in shard_results.values())
+    for input_file, (name, shards) in file_shards.items():
+        if not all(shard_results[(input_file, shard_index)]["succeeded"] for shard_index in range(len(shards))):
+            log(f"⚠️ {os.path.basename(input_file)} 有分片未完成，跳过合并；重新运行会从检查点续跑\n")
+            continue
+        output_file = os.path.join(output_dir, f"{name}.xlsx")
+        total_rows += merge_shards([shard_output_path(shard) for shard in shards], output_file)
+        merged_files += 1
+        log(f"📁 合并输出：{output_file}\n")
+    
+    elapsed = time.time() - started_at
+    log(f"📊 批处理完成：{merged_files}/{len(input_files)}个文件，共{total_rows}行，失败{failed_rows}行，"
+        f"耗时{elapsed:.2f}秒，{total_rows / elapsed if elapsed > 0 else 0:.1f}行/秒\n")
+    return merged_files, failed_rows, merged_files == len(input_files)
@@ -0,0 +1,155 @@
+"""
+启动基准测试
+在子进程中冷启动图形界面，测量首帧耗时（进程启动到窗口绘制完成）和后台加载数据处理模块的耗时，
+并用python -X importtime统计导入耗时明细；首帧前加载了重型依赖或超过阈值时返回非0，用于发现启动回退
+Linux无显示时自动启动Xvfb虚拟显示；未安装Xvfb时退化为无显示模式，只测量导入耗时
+用法：python startup_benchmark.py --repeat 5 --max-first-frame-ms 1500 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+# 首帧前不应加载的重型依赖
+HEAVY_MODULES = ["pandas", "numpy", "requests", "aiohttp", "openpyxl", "concurrent.futures"]
+# 子进程：导入界面模块、创建窗口并绘制首帧，再等待后台预热完成；无显示模式跳过窗口
+DRIVER = """
+import json, sys, time
+heavy_modules = json.loads(sys.argv[2])
+import mac_ai_cleaner
+result = {"imported": time.time()}
+if sys.argv[1] == "gui":
+    import tkinter as tk
+    root = tk.Tk()
+    app = mac_ai_cleaner.MacAICleaner(root)
+    root.update()
+    result["first_frame"] = time.time()
+    result["heavy_loaded"] = [name for name in heavy_modules if name in sys.modules]
+    loader = app.engine_loader
+else:
+    result["heavy_loaded"] = [name for name in heavy_modules if name in sys.modules]
+    loader = mac_ai_cleaner.EngineLoader()
+loader.load()
+result["engine_ready"] = time.time()
+print(json.dumps(result))
+if sys.argv[1] == "gui":
+    root.destroy()
+"""
+def start_virtual_display():
+    """启动Xvfb，返回(进程, DISPLAY)；未安装Xvfb时返回(None, None)"""
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        return None, None
+    read_fd, write_fd = os.pipe()
+    process = subprocess.Popen([xvfb, "-displayfd", str(write_fd), "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                               pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        display = f.readline().strip()
+    if not display:
+        process.kill()
+        return None, None
+    return process, f":{display}"
+def run_once(mode, env):
+    """冷启动一次，返回各阶段相对进程启动的耗时（毫秒）和首帧前已加载的重型依赖"""
+    start = time.time()
+    completed = subprocess.run([sys.executable, "-c", DRIVER, mode, json.dumps(HEAVY_MODULES)],
+                               capture_output=True, text=True, env=env, timeout=120)
+    if completed.returncode != 0:
+        raise RuntimeError(f"启动失败：{completed.stderr.strip()}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    timings = {key: (result[key] - start) * 1000 for key in ("imported", "first_frame", "engine_ready") if key in result}
+    return timings, result["heavy_loaded"]
+def import_breakdown(module, env, top=10):
+    """python -X importtime的导入耗时：返回(模块总耗时毫秒, [(直接导入的模块, 累计毫秒)])，按耗时降序"""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, env=env, timeout=120)
+    total = 0.0
+    children = []
+    pending = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # 名称前的缩进表示嵌套层级，每层2个空格；子模块先于父模块输出
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                children = pending
+            pending = []
+        elif depth == 1:
+            pending.append((name.strip(), int(cumulative) / 1000))
+    return total, sorted(children, key=lambda item: -item[1])[:top]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI清洗工具启动基准测试")
+    parser.add_argument("--repeat", type=int, default=5, help="冷启动次数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="导入耗时明细显示的模块数")
+    parser.add_argument("--headless", action="store_true", help="不创建窗口，只测量导入耗时")
+    parser.add_argument("--max-first-frame-ms", type=float, help="首帧耗时上限（毫秒），超出时返回非0")
+    parser.add_argument("--max-import-ms", type=float, help="界面模块导入耗时上限（毫秒），超出时返回非0")
+    parser.add_argument("--json", help="结果另存为JSON")
+    args = parser.parse_args(argv)
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    # 使用临时主目录，避免读写用户的配置文件
+    home = tempfile.mkdtemp(prefix="startup_benchmark_")
+    os.makedirs(os.path.join(home, "Documents"))
+    env = dict(os.environ, HOME=home, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    xvfb = None
+    mode = "headless" if args.headless else "gui"
+    if mode == "gui" and sys.platform.startswith("linux") and not env.get("DISPLAY"):
+        xvfb, display = start_virtual_display()
+        if display:
+            env["DISPLAY"] = display
+            print(f"🖥️ 已启动虚拟显示 {display}")
+        else:
+            mode = "headless"
+            print("⚠️ 无显示且未安装Xvfb，退化为无显示模式（不测量首帧）")
+    
+    try:
+        runs = [run_once(mode, env) for _ in range(args.repeat)]
+        total_ms, children = import_breakdown("mac_ai_cleaner", env, args.top)
+        engine_ms, _ = import_breakdown("cleaner_engine", env, 0)
+    finally:
+        if xvfb:
+            xvfb.kill()
+        shutil.rmtree(home, ignore_errors=True)
+    
+    medians = {key: statistics.median(timings[key] for timings, _ in runs) for key in runs[0][0]}
+    heavy_loaded = sorted({name for _, loaded in runs for name in loaded})
+    print(f"模式: {mode}，冷启动{args.repeat}次取中位数（耗时从进程启动算起）")
+    print(f"   界面模块导入完成: {medians['imported']:.0f} ms")
+    if "first_frame" in medians:
+        print(f"   首帧绘制完成: {medians['first_frame']:.0f} ms")
+    print(f"   数据处理模块就绪: {medians['engine_ready']:.0f} ms")
+    print(f"导入耗时明细（-X importtime）：mac_ai_cleaner {total_ms:.1f} ms，cleaner_engine {engine_ms:.1f} ms")
+    for name, ms in children:
+        print(f"   {name:<24} {ms:8.1f} ms")
+    
+    failures = []
+    if heavy_loaded:
+        failures.append(f"首帧前加载了重型依赖：{heavy_loaded}")
+    if args.max_first_frame_ms and medians.get("first_frame", 0) > args.max_first_frame_ms:
+        failures.append(f"首帧耗时{medians['first_frame']:.0f} ms超过上限{args.max_first_frame_ms:.0f} ms")
+    if args.max_import_ms and total_ms > args.max_import_ms:
+        failures.append(f"界面模块导入耗时{total_ms:.1f} ms超过上限{args.max_import_ms:.0f} ms")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ 启动耗时检查通过")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "repeat": args.repeat, "medians_ms": medians, "heavy_loaded": heavy_loaded,
+                       "import_ms": {"mac_ai_cleaner": total_ms, "cleaner_engine": engine_ms},
+                       "import_breakdown_ms": dict(children), "failures": failures}, f, ensure_ascii=False, indent=2)
+    return 1 if failures else 0
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+输入表格读取
+xlsx以只读模式逐行解析（不构建单元格对象），CSV按块读取，
+边读取边产出DataFrame分块，首批请求无需等待整表读完
+"""
+import codecs
+import os
+import pandas as pd
+from openpyxl import load_workbook
+CSV_EXTENSIONS = (".csv", ".txt")
+# 分片批处理的中间文件，读写快且保留原始类型
+PICKLE_EXTENSIONS = (".pkl",)
+def is_csv_file(path):
+    """是否按CSV读取"""
+    return os.path.splitext(path)[1].lower() in CSV_EXTENSIONS
+def is_pickle_file(path):
+    """是否为分片中间文件"""
+    return os.path.splitext(path)[1].lower() in PICKLE_EXTENSIONS
+def detect_csv_encoding(path, sample_size=1024 * 1024):
+    """检测CSV编码：UTF-8（含BOM）优先，否则按GB18030读取"""
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    try:
+        # 增量解码，采样末尾被截断的多字节字符不算错误
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "gb18030"
+def read_table(path):
+    """一次性读取整张表"""
+    if is_csv_file(path):
+        return pd.read_csv(path, encoding=detect_csv_encoding(path))
+    if is_pickle_file(path):
+        return pd.read_pickle(path)
+    return pd.read_excel(path, engine='openpyxl')
+def save_table(df, path):
+    """按扩展名保存：CSV、分片中间文件或Excel"""
+    if is_csv_file(path):
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    elif is_pickle_file(path):
+        df.to_pickle(path)
+    else:
+        df.to_excel(path, index=False, engine='openpyxl')
+class TableChunkReader:
+    def __init__(self, path, chunk_rows=5000):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.workbook = None
+        if is_csv_file(path):
+            self.encoding = detect_csv_encoding(path)
+            self.columns = pd.read_csv(path, encoding=self.encoding, nrows=0).columns.tolist()
+            # 按换行符估算行数，带换行的单元格会使估算偏大
+            with open(path, "rb") as f:
+                line_count = sum(block.count(b"\n") for block in iter(lambda: f.read(1024 * 1024), b""))
+            self.estimated_rows = max(line_count - 1, 0)
+        else:
+            self.workbook = load_workbook(path, read_only=True, data_only=True)
+            sheet = self.workbook.active
+            self.rows = sheet.iter_rows(values_only=True)
+            header = next(self.rows, None) or ()
+            # 与pandas一致：空表头列命名为Unnamed: N
+            self.columns = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+            # 只读模式下行数来自工作表的dimension记录，缺失时无法估算
+            self.estimated_rows = sheet.max_row - 1 if sheet.max_row else None
+    
+    def __iter__(self):
+        """逐块产出DataFrame，列与表头一致"""
+        if self.workbook is None:
+            with pd.read_csv(self.path, encoding=self.encoding, chunksize=self.chunk_rows) as chunks:
+                for chunk in chunks:
+                    yield chunk.reset_index(drop=True)
+            return
+        
+        width = len(self.columns)
+        chunk = []
+        blank_rows = []
+        for values in self.rows:
+            values = tuple(values[:width]) + (None,) * (width - len(values))
+            # 空行暂存，后面还有数据时才保留，与pandas忽略表尾空行一致
+            if all(value is None for value in values):
+                blank_rows.append(values)
+                continue
+            if blank_rows:
+                chunk.extend(blank_rows)
+                blank_rows = []
+            chunk.append(values)
+            if len(chunk) >= self.chunk_rows:
+                yield pd.DataFrame(chunk, columns=self.columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=self.columns)
+    
+    def close(self):
+        """关闭工作簿"""
+        if self.workbook is not None:
+            self.workbook.close()
+            self.workbook = None
@@ -112,6 +112,943 @@ def test_tool_script():
     except Exception as e:
         print(f"❌ 工具脚本语法错误: {e}")
         return False
+def test_packed_result_parser():
+    """测试打包输出解析"""
+    print("\n" + "=" * 60)
+    print("🧪 测试打包输出解析")
+    print("=" * 60)
+    
+    try:
+        from cleaner_engine import CleanerEngine
+        cleaner = CleanerEngine(None)
+        cleaner.fields = ["产品名称", "规格"]
+        result = "【行1】\n产品名称:兰蔻小黑瓶\n规格:30ml\n【行 2】\n产品名称：雅诗兰黛\n【行3】\n产品名称:海蓝之谜\n规格:\n"
+        parsed = cleaner.parse_packed_result(result, [0, 1, 2])
+        expected = {
+            0: {"产品名称": "兰蔻小黑瓶", "规格": "30ml"},
+            2: {"产品名称": "海蓝之谜", "规格": ""},
+        }
+        if parsed != expected:
+            print(f"❌ 解析结果不符: {parsed}")
+            return False
+        print("✅ 打包输出解析正确（缺失字段的行被剔除以便重试）")
+        return True
+    except Exception as e:
+        print(f"❌ 打包输出解析失败: {e}")
+        return False
+def test_result_cache():
+    """测试结果缓存"""
+    print("\n" + "=" * 60)
+    print("🧪 测试结果缓存")
+    print("=" * 60)
+    
+    try:
+        import sqlite3
+        import tempfile
+        from result_cache import ResultCache
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = ResultCache(db_path=os.path.join(tmp_dir, "cache.sqlite3"))
+            key = ResultCache.make_key("提示词", "宝贝名: 兰蔻小黑瓶 30ml")
+            cache.put(key, {"规格": "30ml"}, request_size=100)
+            cache.commit()
+            found = cache.get_many([key, ResultCache.make_key("提示词", "宝贝名: 其他")])
+            cache.close()
+            if found != {key: {"规格": "30ml"}} or cache.hits != 1 or cache.misses != 1:
+                print(f"❌ 缓存查询结果不符: {found}")
+                return False
+            # 文本模式的部分结果不能在JSON模式下命中
+            if ResultCache.make_key("提示词", "宝贝名: 兰蔻小黑瓶 30ml", "json") == key:
+                print("❌ 缓存键应包含输出格式")
+                return False
+            
+            # 只读查询：命中后关闭不刷新访问时间，也不按大小上限淘汰
+            db_path = os.path.join(tmp_dir, "cache.sqlite3")
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("UPDATE cache SET accessed_at = 1")
+            cache = ResultCache(db_path=db_path, max_mb=0.000001, read_only=True)
+            found = cache.get_many([key])
+            cache.close()
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute("SELECT accessed_at FROM cache").fetchall()
+            if found != {key: {"规格": "30ml"}} or rows != [(1,)]:
+                print(f"❌ 只读查询不应修改缓存: {rows}")
+                return False
+            cache = ResultCache(db_path=os.path.join(tmp_dir, "missing.sqlite3"), read_only=True)
+            found = cache.get_many([key])
+            cache.close()
+            if found or os.path.exists(os.path.join(tmp_dir, "missing.sqlite3")):
+                print("❌ 缓存库不存在时只读查询不应建库")
+                return False
+        print("✅ 结果缓存读写正确")
+        return True
+    except Exception as e:
+        print(f"❌ 结果缓存测试失败: {e}")
+        return False
+def test_checkpoint_resume():
+    """测试检查点续跑"""
+    print("\n" + "=" * 60)
+    print("🧪 测试检查点续跑")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from checkpoint import CheckpointWriter, make_header, read_checkpoint
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "out.xlsx.checkpoint.jsonl")
+            header = make_header("指纹", "提示词哈希", ["规格"])
+            writer = CheckpointWriter(path, header)
+            writer.add([0, 3], {"规格": "30ml"})
+            writer.close()
+            # 模拟崩溃时写了一半的行
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"rows": [5')
+            writer = CheckpointWriter(path, header, resume=True)
+            writer.add([1], {"规格": "50ml"})
+            writer.close()
+            records = read_checkpoint(path, header)
+            if records != [([0, 3], {"规格": "30ml"}), ([1], {"规格": "50ml"})]:
+                print(f"❌ 检查点记录不符: {records}")
+                return False
+            if read_checkpoint(path, make_header("其他指纹", "提示词哈希", ["规格"])) is not None:
+                print("❌ 输入文件变化后不应续跑")
+                return False
+        print("✅ 检查点续跑正确")
+        return True
+    except Exception as e:
+        print(f"❌ 检查点续跑测试失败: {e}")
+        return False
+def test_table_reader():
+    """测试流式读取"""
+    print("\n" + "=" * 60)
+    print("🧪 测试流式读取")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine
+        from table_reader import TableChunkReader, read_table
+        df = pd.DataFrame({"宝贝名": [f"商品{i} 30ml" for i in range(25)], "价格": [i * 1.5 for i in range(25)]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ("input.xlsx", "input.csv"):
+                path = os.path.join(tmp_dir, name)
+                if name.endswith(".csv"):
+                    df.to_csv(path, index=False)
+                else:
+                    df.to_excel(path, index=False)
+                reader = TableChunkReader(path, chunk_rows=10)
+                chunks = list(reader)
+                reader.close()
+                if [len(chunk) for chunk in chunks] != [10, 10, 5] or reader.estimated_rows != 25:
+                    print(f"❌ {name} 分块不符: {[len(chunk) for chunk in chunks]}")
+                    return False
+                if not pd.concat(chunks, ignore_index=True).equals(read_table(path)):
+                    print(f"❌ {name} 分块读取结果与整表读取不一致")
+                    return False
+            
+            # 引擎流式读取：分块写入预分配的表格，跨分块的重复行共用结果，输出不含预分配的空行
+            config = configparser.ConfigParser(interpolation=None)
+            config["DEFAULT"] = default_config()
+            config["DEFAULT"].update({"api_key": "test", "cache_enabled": "0", "stream_chunk_rows": "10"})
+            sizes = [f"{i % 7}ml" for i in range(25)]
+            for name in ("stream.xlsx", "stream.csv"):
+                input_file = os.path.join(tmp_dir, name)
+                output_file = os.path.join(tmp_dir, "output_" + name)
+                stream_df = pd.DataFrame({"宝贝名": [f"商品 {size}" for size in sizes]})
+                if name.endswith(".csv"):
+                    stream_df.to_csv(input_file, index=False)
+                else:
+                    stream_df.to_excel(input_file, index=False)
+                engine = CleanerEngine(config)
+                engine.fields = ["产品名称", "规格"]
+                engine.call_ai_api = lambda api_key, prompt, max_tokens=500, fields=None: "产品名称:测试\n规格:" + prompt.rsplit(" ", 1)[-1].split("\n")[0]
+                engine.processing = True
+                if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                    print(f"❌ {name} 流式处理失败")
+                    return False
+                output = read_table(output_file)
+                if output["规格"].tolist() != sizes or output["宝贝名"].tolist() != stream_df["宝贝名"].tolist():
+                    print(f"❌ {name} 流式处理结果不符: {output['规格'].tolist()}")
+                    return False
+                if list(output.columns) != ["宝贝名", "产品名称", "规格"] or any(engine.df[field].dtype != "string" for field in engine.fields):
+                    print(f"❌ {name} 流式处理的结果列应保持字符串类型: {engine.df.dtypes.to_dict()}")
+                    return False
+        print("✅ xlsx/CSV分块读取正确")
+        return True
+    except Exception as e:
+        print(f"❌ 流式读取测试失败: {e}")
+        return False
+def test_headless_engine():
+    """测试无界面清洗引擎"""
+    print("\n" + "=" * 60)
+    print("🧪 测试无界面清洗引擎")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine
+        config = configparser.ConfigParser(interpolation=None)
+        config["DEFAULT"] = default_config()
+        config["DEFAULT"]["api_key"] = "test"
+        config["DEFAULT"]["cache_enabled"] = "0"
+        config["DEFAULT"]["adaptive_concurrency"] = "0"
+        engine = CleanerEngine(config)
+        engine.fields = ["产品名称", "规格"]
+        # 不请求网络，按提示词中的数据返回固定结果
+        engine.call_ai_api = lambda api_key, prompt, max_tokens=500, fields=None: "产品名称:测试\n规格:" + prompt.rsplit(" ", 1)[-1].split("\n")[0]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            pd.DataFrame({"宝贝名": ["兰蔻小黑瓶 30ml", "雅诗兰黛 50ml", "兰蔻小黑瓶 30ml"]}).to_excel(input_file, index=False)
+            engine.processing = True
+            if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                print("❌ 引擎处理失败")
+                return False
+            output = pd.read_excel(output_file)
+            if output["规格"].tolist() != ["30ml", "50ml", "30ml"]:
+                print(f"❌ 输出结果不符: {output['规格'].tolist()}")
+                return False
+            # 中途停止：由处理线程在收尾时按stop()的参数决定是否导出
+            def stop_during_call(save):
+                def fake_api(api_key, prompt, max_tokens=500, fields=None):
+                    engine.stop(save=save)
+                    return "产品名称:测试\n规格:30ml"
+                return fake_api
+            for save in (True, False):
+                stop_output = os.path.join(tmp_dir, f"stop_{save}.xlsx")
+                engine.call_ai_api = stop_during_call(save)
+                engine.processing = True
+                engine.process_data(input_file, stop_output)
+                if os.path.exists(stop_output) != save:
+                    print(f"❌ 停止后{'应' if save else '不应'}导出结果")
+                    return False
+        # 关闭自适应并发时，过载信号不应降低并发上限
+        engine.limiter.on_overload()
+        engine.limiter.on_success(0.1)
+        if engine.limiter.current_limit != int(config["DEFAULT"]["max_workers"]) or engine.limiter.overloads != 1:
+            print(f"❌ 关闭自适应并发时上限应固定: {engine.limiter.current_limit}")
+            return False
+        print("✅ 无界面引擎处理正确")
+        return True
+    except Exception as e:
+        print(f"❌ 无界面引擎测试失败: {e}")
+        return False
+def test_shard_split_merge():
+    """测试分片切分与合并"""
+    print("\n" + "=" * 60)
+    print("🧪 测试分片切分与合并")
+    print("=" * 60)
+    
+    try:
+        import shutil
+        import tempfile
+        import pandas as pd
+        from shard_runner import split_input, shard_output_path, merge_shards, output_name
+        df = pd.DataFrame({"宝贝名": [f"商品{i}" for i in range(25)], "序号": list(range(25))})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            df.to_excel(input_file, index=False)
+            shards = split_input(input_file, tmp_dir, "input_cleaned", 10)
+            # 输入未变化时复用已有分片，检查点才能续跑
+            if len(shards) != 3 or split_input(input_file, tmp_dir, "input_cleaned", 10) != shards:
+                print(f"❌ 分片数量不符: {shards}")
+                return False
+            for shard in shards:
+                shutil.copy(shard, shard_output_path(shard))
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            merge_shards([shard_output_path(shard) for shard in shards], output_file)
+            if pd.read_excel(output_file)["序号"].tolist() != list(range(25)):
+                print("❌ 合并后行顺序不符")
+                return False
+        # 不同目录下的同名输入各自使用不同的输出名
+        used_names = set()
+        names = [output_name(path, used_names) for path in ("a/商品.xlsx", "b/商品.xlsx", "c/商品.xlsx", "d/商品.csv")]
+        if len(set(names)) != len(names):
+            print(f"❌ 同名输入的输出名重复: {names}")
+            return False
+        print("✅ 分片切分与合并正确")
+        return True
+    except Exception as e:
+        print(f"❌ 分片切分与合并测试失败: {e}")
+        return False
+def test_mock_api_server():
+    """测试本地模拟API服务"""
+    print("\n" + "=" * 60)
+    print("🧪 测试本地模拟API服务")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import re
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine
+        from mock_api_server import MockAPIServer
+        server = MockAPIServer()
+        api_url = server.start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                input_file = os.path.join(tmp_dir, "input.xlsx")
+                pd.DataFrame({"宝贝名": [f"商品{i % 15}" for i in range(20)]}).to_excel(input_file, index=False)
+                outputs = []
+                # 逐行请求和打包请求对同一行应返回相同结果
+                for pack_token_budget in ("0", "2000"):
+                    config = configparser.ConfigParser(interpolation=None)
+                    config["DEFAULT"] = default_config()
+                    config["DEFAULT"].update({"api_key": "test", "api_url": api_url, "cache_enabled": "0",
+                                              "resume_enabled": "0", "pack_token_budget": pack_token_budget})
+                    engine = CleanerEngine(config)
+                    engine.fields = engine.extract_dynamic_fields(config["DEFAULT"]["prompt"])
+                    output_file = os.path.join(tmp_dir, f"output_{pack_token_budget}.xlsx")
+                    connections_before = server.stats.summary()["connections"]
+                    engine.processing = True
+                    if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                        print("❌ 模拟API请求失败")
+                        return False
+                    outputs.append(pd.read_excel(output_file)[engine.fields])
+                    # 引擎统计的新建连接数应与服务端实际接受的连接数一致
+                    messages = [engine.progress_queue.get()[1] for _ in range(engine.progress_queue.qsize())]
+                    reported = [re.search(r"新建连接(\d+)个", msg) for msg in messages if isinstance(msg, str) and "新建连接" in msg]
+                    accepted = server.stats.summary()["connections"] - connections_before
+                    if not reported or int(reported[0].group(1)) != accepted:
+                        print(f"❌ 新建连接统计不符: 引擎{reported[0].group(1) if reported else None}，服务端{accepted}")
+                        return False
+        finally:
+            server.stop()
+        if not outputs[0].equals(outputs[1]) or outputs[0].iloc[0].equals(outputs[0].iloc[1]):
+            print("❌ 模拟API结果不确定")
+            return False
+        if not outputs[0].iloc[0].equals(outputs[0].iloc[15]):
+            print("❌ 相同行结果不一致")
+            return False
+        print("✅ 模拟API服务正常")
+        return True
+    except Exception as e:
+        print(f"❌ 模拟API服务测试失败: {e}")
+        return False
+def test_async_engine():
+    """测试异步引擎"""
+    print("\n" + "=" * 60)
+    print("🧪 测试异步引擎")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine, aiohttp
+        from mock_api_server import MockAPIServer
+        if aiohttp is None:
+            print("⚠️ 未安装aiohttp，跳过异步引擎测试")
+            return True
+        # 注入429和500，覆盖异步请求的重试和退避
+        server = MockAPIServer(rate_limit_rate=0.2, error_rate=0.1, retry_after="0")
+        api_url = server.start()
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                input_file = os.path.join(tmp_dir, "input.xlsx")
+                output_file = os.path.join(tmp_dir, "output.xlsx")
+                pd.DataFrame({"宝贝名": [f"商品{i}" for i in range(40)]}).to_excel(input_file, index=False)
+                config = configparser.ConfigParser(interpolation=None)
+                config["DEFAULT"] = default_config()
+                config["DEFAULT"].update({"api_key": "test", "api_url": api_url, "cache_enabled": "0", "resume_enabled": "0",
+                                          "engine": "async", "async_concurrency": "8", "max_retries": "8",
+                                          "backoff_base": "0.01", "backoff_max": "0.05"})
+                engine = CleanerEngine(config)
+                engine.fields = engine.extract_dynamic_fields(config["DEFAULT"]["prompt"])
+                engine.processing = True
+                if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                    print(f"❌ 异步引擎处理失败: 失败{engine.failed_rows}行")
+                    return False
+                output = pd.read_excel(output_file)
+        finally:
+            server.stop()
+        stats = server.stats.summary()
+        if len(output) != 40 or engine.completed_rows != 40 or output[engine.fields].isna().all(axis=1).any():
+            print(f"❌ 异步引擎未完成全部行: {engine.completed_rows}/40")
+            return False
+        injected = stats["rate_limited"] + stats["errors"]
+        if not injected or engine.limiter.retries < injected:
+            print(f"❌ 异步引擎重试次数不符: 重试{engine.limiter.retries}次，服务端{stats}")
+            return False
+        # 连接数受TCPConnector上限约束；重试前读完错误响应体，连接才能复用
+        if stats["connections"] > int(config["DEFAULT"]["async_concurrency"]):
+            print(f"❌ 异步引擎连接数超出并发上限: {stats['connections']}")
+            return False
+        print(f"✅ 异步引擎处理正确（重试{engine.limiter.retries}次，连接{stats['connections']}个）")
+        return True
+    except Exception as e:
+        print(f"❌ 异步引擎测试失败: {e}")
+        return False
+def test_run_profile():
+    """测试运行剖析导出"""
+    print("\n" + "=" * 60)
+    print("🧪 测试运行剖析导出")
+    print("=" * 60)
+    
+    try:
+        import json
+        import tempfile
+        from run_profile import RunProfiler, profile_paths
+        profiler = RunProfiler()
+        for _ in range(3):
+            with profiler.span("api_wait"):
+                pass
+        profiler.record("save", 0.25)
+        profiler.add_usage({"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120})
+        profiler.add_usage(None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path, csv_path, _ = profile_paths(os.path.join(tmp_dir, "output.xlsx"))
+            profiler.write(json_path, csv_path, {"total_rows": 3})
+            with open(json_path, encoding="utf-8") as f:
+                profile = json.load(f)
+            with open(csv_path, encoding="utf-8-sig") as f:
+                csv_lines = f.read().splitlines()
+        if profile["stages"]["api_wait"]["count"] != 3 or profile["stages"]["save"]["histogram"]["<=500ms"] != 1:
+            print(f"❌ 阶段统计不符: {profile['stages']}")
+            return False
+        if profile["tokens"] != {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120, "requests": 2}:
+            print(f"❌ Token统计不符: {profile['tokens']}")
+            return False
+        if len(csv_lines) != 3 or not csv_lines[1].startswith("api_wait,"):
+            print(f"❌ CSV内容不符: {csv_lines}")
+            return False
+        print("✅ 运行剖析导出正确")
+        return True
+    except Exception as e:
+        print(f"❌ 运行剖析测试失败: {e}")
+        return False
+def test_metrics_endpoint():
+    """测试运行指标接口"""
+    print("\n" + "=" * 60)
+    print("🧪 测试运行指标接口")
+    print("=" * 60)
+    
+    try:
+        import urllib.request
+        from cleaner_engine import CleanerEngine
+        from metrics_server import MetricsServer
+        engine = CleanerEngine(None)
+        engine.total_rows = 10
+        engine.completed_rows = 7
+        engine.failed_rows = 1
+        engine.profiler.record("api_wait", 0.15)
+        engine.profiler.add_usage({"prompt_tokens": 30, "completion_tokens": 5, "total_tokens": 35})
+        server = MetricsServer(engine, port=0)
+        try:
+            text = urllib.request.urlopen(server.url, timeout=5).read().decode("utf-8")
+        finally:
+            server.stop()
+        expected = [
+            "ai_cleaner_rows_completed_total 7",
+            "ai_cleaner_rows_failed_total 1",
+            'ai_cleaner_tokens_total{type="prompt"} 30',
+            'ai_cleaner_request_latency_seconds_bucket{le="0.1"} 0',
+            'ai_cleaner_request_latency_seconds_bucket{le="0.2"} 1',
+            "ai_cleaner_request_latency_seconds_count 1",
+        ]
+        missing = [line for line in expected if line not in text.splitlines()]
+        if missing:
+            print(f"❌ 指标内容缺失: {missing}")
+            return False
+        print("✅ 运行指标接口正常")
+        return True
+    except Exception as e:
+        print(f"❌ 运行指标接口测试失败: {e}")
+        return False
+def test_progress_digest():
+    """测试界面进度消息合并"""
+    print("\n" + "=" * 60)
+    print("🧪 测试界面进度消息合并")
+    print("=" * 60)
+    
+    try:
+        import queue
+        from mac_ai_cleaner import ProgressDigest
+        progress_queue = queue.Queue()
+        for i in range(1000):
+            progress_queue.put(("status", f"   行 {i+1}: 成功提取 2 个字段\n"))
+            progress_queue.put(("progress", i / 10))
+        progress_queue.put(("status", "   行 1001: 未提取到任何字段\n"))
+        progress_queue.put(("status", "💾 检查点追加200行\n"))
+        progress_queue.put(("rate", "吞吐: 100行/秒"))
+        progress_queue.put(("finished", None))
+        digest = ProgressDigest()
+        log_text, progress, rate, finished = digest.drain(progress_queue)
+        if log_text != "💾 检查点追加200行\n" or progress != 99.9 or rate != "吞吐: 100行/秒" or not finished:
+            print(f"❌ 合并结果不符: {log_text!r}, {progress}, {rate}, {finished}")
+            return False
+        if (digest.rows_succeeded, digest.rows_empty) != (1000, 1) or not progress_queue.empty():
+            print(f"❌ 逐行计数不符: {digest.summary()}")
+            return False
+        print("✅ 界面进度消息合并正确")
+        return True
+    except Exception as e:
+        print(f"❌ 界面进度消息合并测试失败: {e}")
+        return False
+def test_json_output_parser():
+    """测试JSON输出解析与校验"""
+    print("\n" + "=" * 60)
+    print("🧪 测试JSON输出解析与校验")
+    print("=" * 60)
+    
+    try:
+        from cleaner_engine import CleanerEngine
+        engine = CleanerEngine(None)
+        engine.fields = ["产品名称", "规格"]
+        engine.output_format = "json"
+        result = engine.parse_row_result('好的：\n```json\n{"产品名称": "兰蔻小黑瓶", "规格": 30, "备注": "x"}\n```')
+        if result != {"产品名称": "兰蔻小黑瓶", "规格": "30"}:
+            print(f"❌ 单行解析结果不符: {result}")
+            return False
+        for bad_output in ('{"产品名称": "兰蔻"}', '{"产品名称": "兰蔻", "规格": {"值": 1}}', "产品名称:兰蔻", '{"产品名称": "兰'):
+            try:
+                engine.parse_row_result(bad_output)
+            except ValueError:
+                continue
+            print(f"❌ 未拒绝无效输出: {bad_output}")
+            return False
+        packed = engine.parse_packed_result('{"1": {"产品名称": "A", "规格": ""}, "行2": {"产品名称": "B"}, "3": {"产品名称": "C", "规格": null}}', [0, 1, 2])
+        if packed != {0: {"产品名称": "A", "规格": ""}, 2: {"产品名称": "C", "规格": ""}}:
+            print(f"❌ 打包解析结果不符: {packed}")
+            return False
+        print("✅ JSON输出解析与校验正确")
+        return True
+    except Exception as e:
+        print(f"❌ JSON输出解析测试失败: {e}")
+        return False
+def test_bulk_write_back():
+    """测试结果批量写回"""
+    print("\n" + "=" * 60)
+    print("🧪 测试结果批量写回")
+    print("=" * 60)
+    
+    try:
+        import pandas as pd
+        from cleaner_engine import CleanerEngine
+        engine = CleanerEngine(None)
+        engine.fields = ["产品名称", "规格"]
+        engine.df = pd.DataFrame({"宝贝名": ["A", "B", "A", "C"]})
+        engine.add_result_columns(engine.df)
+        engine.field_buffers = {field: ([], []) for field in engine.fields}
+        engine.duplicate_groups = {0: [2]}
+        engine.write_row_fields(0, {"产品名称": "甲", "规格": "30ml", "多余字段": "x"})
+        engine.write_row_fields(3, {"产品名称": "丙"})
+        if engine.df["产品名称"].tolist() != ["", "", "", ""]:
+            print("❌ 结果未经缓冲直接写入")
+            return False
+        engine.flush_row_writes()
+        if engine.df["产品名称"].tolist() != ["甲", "", "甲", "丙"] or engine.df["规格"].tolist() != ["30ml", "", "30ml", ""]:
+            print(f"❌ 写回结果不符: {engine.df.to_dict('list')}")
+            return False
+        if str(engine.df["产品名称"].dtype) != "string" or "多余字段" in engine.df.columns:
+            print(f"❌ 结果列类型不符: {engine.df.dtypes.to_dict()}")
+            return False
+        print("✅ 结果批量写回正确")
+        return True
+    except Exception as e:
+        print(f"❌ 结果批量写回测试失败: {e}")
+        return False
+def test_run_planner():
+    """测试运行前预估"""
+    print("\n" + "=" * 60)
+    print("🧪 测试运行前预估")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine, estimate_tokens
+        from run_planner import estimate_row_tokens, plan_run
+        df = pd.DataFrame({"宝贝名": ["兰蔻小黑瓶 30ml", "SK-II神仙水 230ml", None] * 10, "价格": [299.0, 1540.5, 88.0] * 10})
+        engine = CleanerEngine(None)
+        columns = df.columns.tolist()
+        expected = [estimate_tokens(engine.build_row_data(row, columns)) for _, row in df.iterrows()]
+        if estimate_row_tokens(df, columns).tolist() != expected:
+            print("❌ 向量化Token估算与逐行估算不一致")
+            return False
+        config = configparser.ConfigParser(interpolation=None)
+        config["DEFAULT"] = default_config()
+        config["DEFAULT"]["cache_enabled"] = "0"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            df.to_excel(input_file, index=False)
+            plan = plan_run(config, ["产品名称", "规格"], input_file, sample_rows=10)
+        if plan["total_rows"] != 30 or plan["sample_rows"] != 10 or plan["request_rows"] != 9 or plan["prompt_tokens"] <= 0:
+            print(f"❌ 预估结果不符: {plan}")
+            return False
+        print("✅ 运行前预估正确")
+        return True
+    except Exception as e:
+        print(f"❌ 运行前预估测试失败: {e}")
+        return False
+def test_column_projection():
+    """测试列投影"""
+    print("\n" + "=" * 60)
+    print("🧪 测试列投影")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import numpy as np
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine, select_prompt_columns, serialize_rows
+        columns = ["宝贝名", "价格", "上架时间", 7]
+        if select_prompt_columns("从【宝贝名】和【价格】提取", columns) != ["宝贝名", "价格"]:
+            print("❌ 未按提示词中的【列名】选出发送列")
+            return False
+        if select_prompt_columns("从【不存在】提取", columns) != columns or select_prompt_columns("【宝贝名】", columns, infer=False) != columns:
+            print("❌ 未引用任何列或关闭推断时应发送全部列")
+            return False
+        if select_prompt_columns("【宝贝名】", columns, "7，价格") != ["价格", 7]:
+            print("❌ 配置的发送列未生效")
+            return False
+        try:
+            select_prompt_columns("", columns, "库存")
+            print("❌ 配置不存在的列时应报错")
+            return False
+        except ValueError:
+            pass
+        df = pd.DataFrame({"宝贝名": ["兰蔻小黑瓶 30ml", None], "价格": [299.0, np.nan],
+                           "上架时间": pd.to_datetime(["2024-01-01 00:00:00", "2024-02-03 12:30:00"]), 7: [1, 2]})
+        engine = CleanerEngine(None)
+        expected = [engine.build_row_data(row, columns) for _, row in df.iterrows()]
+        if serialize_rows(df, columns) != expected:
+            print(f"❌ 向量化序列化与逐行序列化不一致: {serialize_rows(df, columns)}")
+            return False
+        
+        # 引擎只发送提示词引用的列，且去重按发送列判断
+        config = configparser.ConfigParser(interpolation=None)
+        config["DEFAULT"] = default_config()
+        config["DEFAULT"]["api_key"] = "test"
+        config["DEFAULT"]["cache_enabled"] = "0"
+        engine = CleanerEngine(config)
+        engine.fields = ["产品名称", "规格"]
+        prompts = []
+        engine.call_ai_api = lambda api_key, prompt, max_tokens=500, fields=None: prompts.append(prompt) or "产品名称:测试\n规格:30ml"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            pd.DataFrame({"宝贝名": ["兰蔻小黑瓶 30ml", "兰蔻小黑瓶 30ml"], "店铺备注": ["甲", "乙"]}).to_excel(input_file, index=False)
+            engine.processing = True
+            if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                print("❌ 引擎处理失败")
+                return False
+            output = pd.read_excel(output_file)
+        if len(prompts) != 1 or "店铺备注" in prompts[0] or "宝贝名: 兰蔻小黑瓶 30ml" not in prompts[0]:
+            print(f"❌ 发送的提示词不符: {prompts}")
+            return False
+        if output["店铺备注"].tolist() != ["甲", "乙"] or output["规格"].tolist() != ["30ml", "30ml"]:
+            print(f"❌ 输出结果不符: {output.to_dict('list')}")
+            return False
+        print("✅ 列投影正确")
+        return True
+    except Exception as e:
+        print(f"❌ 列投影测试失败: {e}")
+        return False
+def test_streaming_completion():
+    """测试流式输出与自适应max_tokens"""
+    print("\n" + "=" * 60)
+    print("🧪 测试流式输出与自适应max_tokens")
+    print("=" * 60)
+    
+    try:
+        from cleaner_config import DEFAULT_PROMPT, default_config
+        from cleaner_engine import APISessionPool, CleanerEngine, OutputTokenBudget
+        from mock_api_server import MockAPIServer
+        if default_config()["stream_enabled"] != "0":
+            print("❌ 提前断开会丢弃keep-alive连接，流式输出应默认关闭")
+            return False
+        budget = OutputTokenBudget(field_count=5)
+        if budget.max_tokens() != 5 * 30 + 10 + 16:
+            print(f"❌ 观测不足时应按字段数估算: {budget.max_tokens()}")
+            return False
+        for _ in range(20):
+            budget.observe(80, rows=2)
+        if budget.max_tokens() != 40 * 1.25 + 16 or budget.max_tokens(rows=3) != 40 * 1.25 * 3 + 16 or budget.max_tokens(rows=500) != 8192:
+            print(f"❌ 应按p99加余量计算: {budget.max_tokens()}")
+            return False
+        
+        engine = CleanerEngine(None)
+        engine.fields = engine.extract_dynamic_fields(DEFAULT_PROMPT)
+        packed = "【行1】\n" + "".join(f"{field}:值\n" for field in engine.fields) + "【行2】\n产品名称:值\n"
+        if engine.stream_complete(packed, rows=2) or not engine.stream_complete(packed.split("【行2】")[0], rows=1):
+            print("❌ 字段是否到齐判断错误")
+            return False
+        # 规则已填充部分字段的行只请求其余字段，到齐即可结束
+        if not engine.stream_complete("产品名称:x\n功效:y\n", fields=["产品名称", "功效"]) or engine.stream_complete("产品名称:x\n功效:y\n"):
+            print("❌ 部分字段请求的到齐判断错误")
+            return False
+        
+        # 模型在字段之后追加说明：读到全部字段即断开（连接随之丢弃，下次请求重连）；输出被截断时加倍max_tokens重试
+        server = MockAPIServer(chatter_rate=1.0)
+        engine.api_url = server.start()
+        engine.api_pool = APISessionPool(1)
+        engine.stream_completions = True
+        engine.processing = True
+        engine.output_budget = OutputTokenBudget(len(engine.fields))
+        try:
+            prompt = engine.build_single_prompt("宝贝名: 兰蔻小黑瓶精华液 30ml", DEFAULT_PROMPT)
+            result = engine.call_ai_api("test", prompt, max_tokens=engine.output_max_tokens())
+            early_stops = engine.early_stops
+            truncated = engine.call_ai_api("test", prompt, max_tokens=8)
+            reconnects, connects = engine.api_pool.reconnect_count(), engine.api_pool.connection_count()
+        finally:
+            engine.api_pool.close()
+            server.stop()
+        if reconnects < 1 or connects != server.stats.summary()["connections"]:
+            print(f"❌ 提前断开后的重连统计不符: 重连{reconnects}次，新建连接{connects}个，服务端{server.stats.summary()['connections']}个")
+            return False
+        if early_stops != 1 or "说明" in result or len(engine.parse_row_result(result)) != len(engine.fields):
+            print(f"❌ 流式输出未在字段到齐后结束: {result!r}")
+            return False
+        if engine.truncated_outputs == 0 or len(engine.parse_row_result(truncated)) != len(engine.fields):
+            print(f"❌ 截断后未加大max_tokens重试: {truncated!r}")
+            return False
+        print("✅ 流式输出与自适应max_tokens正确")
+        return True
+    except Exception as e:
+        print(f"❌ 流式输出测试失败: {e}")
+        return False
+def test_hedged_requests():
+    """测试请求对冲"""
+    print("\n" + "=" * 60)
+    print("🧪 测试请求对冲")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import math
+        import tempfile
+        import threading
+        import time
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine, HedgePolicy
+        policy = HedgePolicy(percentile=95, max_ratio=0.1, min_delay=0.0)
+        for i in range(20):
+            policy.record(0.1 if i < 19 else 5.0)
+        policy.tasks = 10
+        if not policy.should_hedge(policy.delay) or policy.should_hedge(policy.delay - 0.01):
+            print(f"❌ 对冲阈值不符: {policy.delay}")
+            return False
+        policy.fired = 1
+        if policy.should_hedge(60):
+            print("❌ 超出对冲预算后不应再对冲")
+            return False
+        
+        # 对冲会额外发出计费请求，默认关闭
+        if default_config()["hedge_enabled"] != "0":
+            print("❌ 请求对冲应默认关闭")
+            return False
+        
+        # 最后一行的首次请求卡住，对冲副本先返回
+        config = configparser.ConfigParser(interpolation=None)
+        config["DEFAULT"] = default_config()
+        config["DEFAULT"].update({"api_key": "test", "cache_enabled": "0", "resume_enabled": "0", "hedge_enabled": "1", "hedge_max_ratio": "0.05"})
+        engine = CleanerEngine(config)
+        engine.fields = ["产品名称", "规格"]
+        calls = []
+        pool_sizes = set()
+        lock = threading.Lock()
+        
+        def fake_api(api_key, prompt, max_tokens=500, fields=None):
+            with lock:
+                calls.append(prompt)
+                pool_sizes.add(engine.api_pool.pool_size)
+                stalled = "商品39" in prompt and len([call for call in calls if "商品39" in call]) == 1
+            if stalled:
+                time.sleep(2.5)
+            return "产品名称:测试\n规格:30ml"
+        
+        engine.call_ai_api = fake_api
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            pd.DataFrame({"宝贝名": [f"商品{i}" for i in range(40)]}).to_excel(input_file, index=False)
+            engine.processing = True
+            if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                print("❌ 引擎处理失败")
+                return False
+            output = pd.read_excel(output_file)
+        if engine.hedge.fired != 1 or engine.hedge.won != 1 or max(engine.row_latencies) > 2.0:
+            print(f"❌ 对冲结果不符: 发出{engine.hedge.fired}次，胜出{engine.hedge.won}次，最大行延迟{max(engine.row_latencies):.2f}秒")
+            return False
+        if output["规格"].tolist() != ["30ml"] * 40:
+            print("❌ 输出结果不符")
+            return False
+        # 线程引擎中卡住的原请求已在执行，无法取消；连接池为其预留的线程留出连接
+        max_workers = int(config["DEFAULT"]["max_workers"])
+        if engine.hedge.abandoned != 1 or pool_sizes != {max_workers + math.ceil(max_workers * 0.05)}:
+            print(f"❌ 对冲资源统计不符: 未能取消{engine.hedge.abandoned}次，连接池{pool_sizes}")
+            return False
+        print("✅ 请求对冲正确")
+        return True
+    except Exception as e:
+        print(f"❌ 请求对冲测试失败: {e}")
+        return False
+def test_rule_extractor():
+    """测试规则预提取"""
+    print("\n" + "=" * 60)
+    print("🧪 测试规则预提取")
+    print("=" * 60)
+    
+    try:
+        import configparser
+        import tempfile
+        import pandas as pd
+        from cleaner_config import default_config
+        from cleaner_engine import CleanerEngine
+        from result_cache import ResultCache
+        from rule_extractor import RuleExtractor, parse_rules
+        for bad_rules in ("规格 | 宝贝名", "规格 | 宝贝名 | (\\d+"):
+            try:
+                parse_rules(bad_rules)
+                print(f"❌ 规则格式错误时应报错: {bad_rules}")
+                return False
+            except ValueError:
+                pass
+        # 生效规则计入缓存键：正则变化后，缓存中旧规则填充的字段不再命中
+        keys = [ResultCache.make_key("提示词", "宝贝名: 面霜 50g", "text", RuleExtractor(parse_rules(rules), ["规格"], ["宝贝名"]).signature())
+                for rules in ("规格 | 宝贝名 | (\\d+g)", "规格 | 宝贝名 | (\\d+ml)", "")]
+        if len(set(keys)) != 3 or keys[2] != ResultCache.make_key("提示词", "宝贝名: 面霜 50g"):
+            print("❌ 缓存键应随生效规则变化")
+            return False
+        
+        config = configparser.ConfigParser(interpolation=None)
+        config["DEFAULT"] = default_config()
+        config["DEFAULT"].update({"api_key": "test", "cache_enabled": "0", "resume_enabled": "0", "extract_rules": "\n".join([
+            "# 规格：数字+单位，可带件数",
+            "规格 | 宝贝名 | (\\d+(?:\\.\\d+)?\\s*(?:ml|g)(?:\\s*[*×]\\s*\\d+)?)",
+            "产品名称 | 宝贝名 | ^(\\S+)",
+        ])})
+        engine = CleanerEngine(config)
+        engine.fields = ["产品名称", "规格"]
+        prompts = []
+        engine.call_ai_api = lambda api_key, prompt, max_tokens=500, fields=None: prompts.append(prompt) or "规格:一瓶"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            pd.DataFrame({"宝贝名": ["兰蔻小黑瓶 30ml", "雅诗兰黛 50g*2", "海蓝之谜 面霜", "兰蔻小黑瓶 30ml"]}).to_excel(input_file, index=False)
+            engine.processing = True
+            if not engine.process_data(input_file, output_file) or engine.failed_rows:
+                print("❌ 引擎处理失败")
+                return False
+            output = pd.read_excel(output_file)
+        if len(prompts) != 1 or "只需输出以下字段" not in prompts[0] or "海蓝之谜" not in prompts[0]:
+            print(f"❌ 应只为规则未填满的行请求缺少的字段: {prompts}")
+            return False
+        if output["规格"].tolist() != ["30ml", "50g*2", "一瓶", "30ml"] or output["产品名称"].tolist() != ["兰蔻小黑瓶", "雅诗兰黛", "海蓝之谜", "兰蔻小黑瓶"]:
+            print(f"❌ 输出结果不符: {output.to_dict('list')}")
+            return False
+        if engine.rule_rows != 3 or engine.local_cells != 7:
+            print(f"❌ 规则填充统计不符: {engine.rule_rows}行，{engine.local_cells}个单元格")
+            return False
+        
+        # 规则读取未发送的列时，发送列相同但该列不同的行不能去重合并
+        config["DEFAULT"].update({"prompt_columns": "宝贝名", "extract_rules": "产品名称 | 店铺 | ^(\\S+?)旗舰店\n规格 | 宝贝名 | (\\d+g)"})
+        engine = CleanerEngine(config)
+        engine.fields = ["产品名称", "规格"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_file = os.path.join(tmp_dir, "input.xlsx")
+            output_file = os.path.join(tmp_dir, "output.xlsx")
+            pd.DataFrame({"宝贝名": ["面霜 50g", "面霜 50g"], "店铺": ["兰蔻旗舰店", "雅诗兰黛旗舰店"]}).to_excel(input_file, index=False)
+            engine.processing = True
+            if not engine.process_data(input_file, output_file):
+                print("❌ 引擎处理失败")
+                return False
+            output = pd.read_excel(output_file)
+        if output["产品名称"].tolist() != ["兰蔻", "雅诗兰黛"]:
+            print(f"❌ 规则读取的列不同的行不应共用结果: {output['产品名称'].tolist()}")
+            return False
+        print("✅ 规则预提取正确")
+        return True
+    except Exception as e:
+        print(f"❌ 规则预提取测试失败: {e}")
+        return False
+def test_startup_benchmark():
+    """测试界面启动不加载重型依赖"""
+    print("\n" + "=" * 60)
+    print("🧪 测试启动耗时")
+    print("=" * 60)
+    
+    try:
+        import json
+        import tempfile
+        import startup_benchmark
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, "startup.json")
+            exit_code = startup_benchmark.main(["--headless", "--repeat", "1", "--json", json_path])
+            with open(json_path, encoding="utf-8") as f:
+                report = json.load(f)
+        if exit_code != 0 or report["heavy_loaded"]:
+            print(f"❌ 界面模块导入时不应加载重型依赖: {report['heavy_loaded']}")
+            return False
+        if report["import_ms"]["mac_ai_cleaner"] >= report["import_ms"]["cleaner_engine"]:
+            print(f"❌ 界面模块导入耗时应低于数据处理模块: {report['import_ms']}")
+            return False
+        if "cleaner_config" not in report["import_breakdown_ms"] or report["medians_ms"]["engine_ready"] <= report["medians_ms"]["imported"]:
+            print(f"❌ 启动耗时报告不完整: {report}")
+            return False
+        print("✅ 界面启动延迟加载数据处理模块")
+        return True
+    except Exception as e:
+        print(f"❌ 启动耗时测试失败: {e}")
+        return False
+def test_bundle_report():
+    """测试打包大小报告和预算检查"""
+    print("\n" + "=" * 60)
+    print("🧪 测试打包报告")
+    print("=" * 60)
+    
+    try:
+        import tempfile
+        from bundle_report import bundle_sizes, check_budget, find_executable, package_of
+        expected = {
+            "_internal/pandas/_libs/lib.so": "pandas",
+            "_internal/numpy.libs/libopenblas.so": "numpy",
+            "_internal/numpy-2.0.0.dist-info/RECORD": "numpy",
+            "pandas.core.frame": "pandas",
+            "_internal/_tcl_data/init.tcl": "Tcl/Tk",
+            "_internal/base_library.zip": "Python运行时",
+            "_internal/libssl.so.3": "共享库",
+        }
+        for name, package in expected.items():
+            if package_of(name) != package:
+                print(f"❌ {name}应归到{package}，实际为{package_of(name)}")
+                return False
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dist_path = os.path.join(tmp_dir, "AI清洗工具2.0")
+            files = {"AI清洗工具2.0": 1000, "_internal/pandas/_libs/lib.so": 3 * 1024 * 1024, "_internal/numpy.libs/blas.so": 2 * 1024 * 1024}
+            for name, size in files.items():
+                path = os.path.join(dist_path, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(b"\0" * size)
+            total_bytes, sizes = bundle_sizes(dist_path)
+            executable = find_executable(dist_path)
+        if total_bytes != sum(files.values()) or sizes["pandas"] != files["_internal/pandas/_libs/lib.so"] or not executable.endswith("AI清洗工具2.0"):
+            print(f"❌ 打包大小统计不符: {total_bytes}, {dict(sizes)}")
+            return False
+        if check_budget(total_bytes, {"first_frame": 800.0}, 10, 1000) or len(check_budget(total_bytes, {"engine_ready": 1500.0}, 4, 1000)) != 2:
+            print("❌ 预算检查结果不符")
+            return False
+        print("✅ 打包报告正确")
+        return True
+    except Exception as e:
+        print(f"❌ 打包报告测试失败: {e}")
+        return False
 def run_all_tests():
     """运行所有测试"""
     print("=" * 60)
@@ -123,6 +1060,26 @@ def run_all_tests():
         ("构建脚本测试", test_build_script),
         ("主脚本测试", test_main_script),
         ("工具脚本测试", test_tool_script),
+        ("打包解析测试", test_packed_result_parser),
+        ("结果缓存测试", test_result_cache),
+        ("检查点续跑测试", test_checkpoint_resume),
+        ("流式读取测试", test_table_reader),
+        ("无界面引擎测试", test_headless_engine),
+        ("分片批处理测试", test_shard_split_merge),
+        ("模拟API测试", test_mock_api_server),
+        ("异步引擎测试", test_async_engine),
+        ("运行剖析测试", test_run_profile),
+        ("指标接口测试", test_metrics_endpoint),
+        ("界面刷新测试", test_progress_digest),
+        ("JSON输出测试", test_json_output_parser),
+        ("批量写回测试", test_bulk_write_back),
+        ("运行预估测试", test_run_planner),
+        ("列投影测试", test_column_projection),
+        ("流式输出测试", test_streaming_completion),
+        ("请求对冲测试", test_hedged_requests),
+        ("规则预提取测试", test_rule_extractor),
+        ("启动耗时测试", test_startup_benchmark),
+        ("打包报告测试", test_bundle_report),
     ]
     
     results = []